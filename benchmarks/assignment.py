@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Concurrent dialogue assignment: throughput and balance of the scheduler.
+
+Registers ``--dialogues`` dialogues, lets ``--sessions`` sessions ask for assignments from
+``--threads`` threads (a fraction of them abandon their leases which then expire) and
+checks that the load of the dialogues stays balanced.
+
+    python benchmarks/assignment.py --dialogues 10000 --sessions 500 --threads 16
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from speechwoz import create_app
+from speechwoz.db import get_db, init_db, start_session, write_batch
+from speechwoz.scheduler import assign, complete
+
+
+def run_session(app, i, lease_seconds, abandon_ratio):
+    with app.app_context():
+        session_id = start_session(f"bench{i}", f"session{i}")
+        start = time.perf_counter()
+        assignments = assign(session_id, 40, 2, lease_seconds)
+        elapsed = time.perf_counter() - start
+        if random.random() >= abandon_ratio:
+            for a in assignments:
+                complete(session_id, a["dialogue_id"])
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dialogues", type=int, default=10000)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--abandon-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_app({"TESTING": True, "DATABASE": os.path.join(tmpdir, "bench.sqlite")})
+        with app.app_context():
+            init_db()
+            write_batch(
+                "INSERT INTO dialogue (id, n_turns) VALUES (?, ?)",
+                ((f"MUL{i:05d}.json", random.randint(6, 20)) for i in range(args.dialogues)),
+            )
+
+        for lease_seconds, label in [(3600, "leased"), (-1, "expired leases")]:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.threads) as pool:
+                latencies = sorted(
+                    pool.map(
+                        run_session,
+                        [app] * args.sessions,
+                        range(args.sessions) if label == "leased" else range(args.sessions, 2 * args.sessions),
+                        [lease_seconds] * args.sessions,
+                        [args.abandon_ratio] * args.sessions,
+                    )
+                )
+            elapsed = time.perf_counter() - start
+            with app.app_context():
+                low, high = get_db().execute("SELECT MIN(load), MAX(load) FROM dialogue").fetchone()
+            print(
+                f"{args.sessions} sessions ({label}): {args.sessions / elapsed:.0f} sessions/s,"
+                f" assign p50 {latencies[len(latencies) // 2] * 1000:.1f} ms"
+                f" p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, dialogue load {low}..{high}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import pytest
+
+from speechwoz import create_app
+from speechwoz.db import init_db
+from speechwoz.pages import clear_cache
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(
+        {
+            "TESTING": True,
+            "MIC_CHECK_REQUIRED": False,
+            "DATABASE": str(tmp_path / "bench.sqlite"),
+            "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+            "RECORDINGS_FOLDER": str(tmp_path / "recordings"),
+        }
+    )
+    with app.app_context():
+        init_db()
+        yield app
+
+
+@pytest.fixture
+def site(app):
+    """The app with the routes of ``speechwoz.app`` on the temporary instance of ``app``."""
+    from speechwoz.app import app as site
+
+    config = dict(site.config)
+    keys = ["TESTING", "MIC_CHECK_REQUIRED", "DATABASE", "RECORDINGS_FOLDER", "PAGE_CACHE"]
+    site.config.update({k: app.config[k] for k in keys})
+    clear_cache(site)
+    yield site
+    site.config.update(config)
+    clear_cache(site)
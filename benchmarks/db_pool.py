@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Requests/sec of the DB read and write paths with and without connection pooling and pragmas.
+
+Every simulated request pushes an app context, runs one query through ``get_db`` and tears
+the context down, which is the per-request lifecycle of a gunicorn worker.
+The baseline opens a fresh connection per request with SQLite defaults (rollback journal,
+``synchronous=FULL``) like the original flaskr ``get_db``.
+
+    python benchmarks/db_pool.py --threads 4 --requests 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from speechwoz import create_app
+from speechwoz.db import add_recording, get_recording, init_db
+
+CONFIGS = {
+    "baseline": {"DB_POOL_SIZE": 0, "DB_PRAGMAS": {"busy_timeout": 5000}},
+    "pooled": {},
+}
+
+
+def read_request(app, recording_id):
+    with app.app_context():
+        assert get_recording(recording_id) is not None
+
+
+def write_request(app, i):
+    with app.app_context():
+        add_recording("bench", "onboarding", f"/tmp/{i}.mp3", f"/static/{i}.mp3")
+
+
+def run(app, fn, args, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(fn, [app] * len(args), args))
+    return len(args) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'config':10} {'write req/s':>12} {'read req/s':>12}")
+    for name, config in CONFIGS.items():
+        with tempfile.TemporaryDirectory() as tmpdir:
+            app = create_app(dict(config, TESTING=True, DATABASE=os.path.join(tmpdir, "bench.sqlite")))
+            with app.app_context():
+                init_db()
+            writes = run(app, write_request, range(args.requests), args.threads)
+            reads = run(app, read_request, [i % args.requests + 1 for i in range(args.requests)], args.threads)
+        print(f"{name:10} {writes:12.0f} {reads:12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Throughput of ``/`` for first visits of new Prolific participants.
+
+Every request comes from a new client with a new PROLIFIC_PID, so it derives the annotator
+id, registers the annotator and starts a session. Also compares the cost of deriving the id
+with HMAC against the salted ``generate_password_hash`` used before.
+
+    python benchmarks/first_visit.py --visits 2000 --threads 8
+"""
+import argparse
+import os
+import tempfile
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from speechwoz.annotators import pseudonymize
+from speechwoz.db import init_db
+
+
+def visit(app, i):
+    client = app.test_client()
+    start = time.perf_counter()
+    response = client.get(f"/?PROLIFIC_PID=pid{i}&SESSION_ID=session{i}&STUDY_ID=bench")
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.status
+    # the follow-up requests of the page resolve the annotator from the cache
+    client.get("/hello")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--visits", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    from speechwoz.app import app
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app.config.update(TESTING=True, DATABASE=os.path.join(tmpdir, "bench.sqlite"))
+        with app.app_context():
+            init_db()
+            n = 20
+            hmac_ms = timeit.timeit(lambda: pseudonymize("5f2a9b1c0d"), number=n * 100) / (n * 100) * 1000
+            kdf_ms = timeit.timeit(lambda: generate_password_hash("5f2a9b1c0d"), number=n) / n * 1000
+        print(f"annotator id: hmac {hmac_ms:.4f} ms, generate_password_hash {kdf_ms:.1f} ms")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            latencies = sorted(pool.map(visit, [app] * args.visits, range(args.visits)))
+        elapsed = time.perf_counter() - start
+    print(
+        f"{args.visits} first visits of / with {args.threads} threads: {args.visits / elapsed:.0f} visits/s,"
+        f" p50 {latencies[len(latencies) // 2] * 1000:.1f} ms p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Load test of the main endpoints: p50/p99 latency, throughput and RSS per endpoint.
+
+Drives ``speechwoz.app`` through test clients from ``--threads`` threads against a
+temporary instance (DB, uploads, recordings), so runs are reproducible on any machine.
+Scenarios: first visits of ``/`` (new participant each time), repeated visits of ``/``,
+``/annotate`` and ``/upload_recording/onboarding`` with every size of ``--upload-kb``.
+
+    python benchmarks/load.py --threads 8 --requests 500 --upload-kb 64 1024 8192 --json load.json
+    python benchmarks/load.py --baseline load.json --tolerance 0.25  # exit 1 on a regression
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+
+def rss_mb():
+    """Current resident set size of the process."""
+    with open("/proc/self/statm") as r:
+        return int(r.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def percentile(latencies, q):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+
+
+class Scenario:
+    """Requests of one endpoint; with ``login`` every thread first registers a participant."""
+
+    def __init__(self, name, request, login=True):
+        self.name = name
+        self.request = request
+        self.login = login
+
+
+def run(app, scenario, num_requests, threads):
+    local = threading.local()
+    pids = itertools.count()
+
+    def one(i):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+            if scenario.login:
+                local.client.get(f"/?PROLIFIC_PID=load-{threading.get_ident()}&SESSION_ID=load")
+        start = time.perf_counter()
+        response = scenario.request(local.client, next(pids))
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, (scenario.name, response.status)
+        return elapsed
+
+    # warm up templates, caches and connections
+    for i in range(min(threads, 10)):
+        one(-1 - i)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = sorted(pool.map(one, range(num_requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": num_requests,
+        "rps": num_requests / elapsed,
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": rss_mb() - rss_before,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def scenarios(upload_sizes):
+    run_id = os.getpid()
+    yield Scenario(
+        "/ first visit", lambda c, i: c.get(f"/?PROLIFIC_PID=first-{run_id}-{i}&SESSION_ID=s{i}"), login=False
+    )
+    yield Scenario("/ repeat visit", lambda c, i: c.get("/?SESSION_ID=load"))
+    yield Scenario("/annotate", lambda c, i: c.get("/annotate"))
+    for kb in upload_sizes:
+
+        def upload(c, i, kb=kb):
+            # distinct content, identical takes would be deduplicated
+            take = i.to_bytes(8, "little", signed=True) * (kb * 128)
+            boundary, body = encode_multipart({"file": FileStorage(io.BytesIO(take), "take.mp3")})
+            content_type = f"multipart/form-data; boundary={boundary}"
+            return c.post("/upload_recording/onboarding", data=body, content_type=content_type)
+
+        yield Scenario(f"/upload_recording/onboarding {kb} KB", upload)
+
+
+def regressions(results, baseline, tolerance):
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            yield f"{name}: p99 {base['p99_ms']:.1f} -> {result['p99_ms']:.1f} ms"
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            yield f"{name}: throughput {base['rps']:.0f} -> {result['rps']:.0f} req/s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario.")
+    parser.add_argument("--upload-kb", type=int, nargs="+", default=[64, 1024])
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown.")
+    args = parser.parse_args()
+
+    from speechwoz.app import app
+    from speechwoz.db import init_db
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app.config.update(
+            TESTING=True,
+            MIC_CHECK_REQUIRED=False,
+            DATABASE=os.path.join(tmpdir, "load.sqlite"),
+            UPLOAD_FOLDER=os.path.join(tmpdir, "uploads"),
+            RECORDINGS_FOLDER=os.path.join(tmpdir, "recordings"),
+        )
+        os.makedirs(app.config["UPLOAD_FOLDER"])
+        with app.app_context():
+            init_db()
+        print(f"{'endpoint':40} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'+RSS':>6}")
+        for scenario in scenarios(args.upload_kb):
+            r = results[scenario.name] = run(app, scenario, args.requests, args.threads)
+            print(
+                f"{scenario.name:40} {r['rps']:8.0f} {r['p50_ms']:8.1f} {r['p99_ms']:8.1f}"
+                f" {r['rss_mb']:8.0f} {r['rss_growth_mb']:6.1f}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as w:
+            json.dump(results, w, indent=2)
+    if args.baseline:
+        with open(args.baseline) as r:
+            found = list(regressions(results, json.load(r), args.tolerance))
+        for line in found:
+            print("REGRESSION", line)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Cost of a request reading the session as its progress state grows.
+
+Requests ``/annotate`` (which resolves the annotator from the session) with sessions
+holding progress of ``--turns`` recorded turns, once with Flask's signed cookies and once
+with the SQLite store of speechwoz/sessions.py. Cookies over 4 KB are not accepted by
+browsers, they are only measured here to show the trend.
+
+    python benchmarks/sessions.py --turns 0 10 100 1000 --requests 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+from flask.sessions import SecureCookieSessionInterface
+
+from speechwoz.db import init_db
+from speechwoz.sessions import SQLiteSessionInterface
+
+
+def progress(turns):
+    return {
+        "dialogue_id": "mul0036.json",
+        "turns": [{"turn_id": i, "segment": "turn", "start": i * 4.2, "duration": 3.9} for i in range(turns)],
+    }
+
+
+def measure(app, turns, requests):
+    client = app.test_client()
+    client.get("/?PROLIFIC_PID=bench&SESSION_ID=bench")
+    with client.session_transaction() as session:
+        session["progress"] = progress(turns)
+    cookie = max(len(c.value) for c in client.cookie_jar)
+    start = time.perf_counter()
+    for _ in range(requests):
+        assert client.get("/annotate").status_code == 200
+    return requests / (time.perf_counter() - start), cookie
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    from speechwoz.app import app
+
+    # werkzeug warns about cookies too large for browsers
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app.config.update(TESTING=True, DATABASE=os.path.join(tmpdir, "bench.sqlite"))
+        with app.app_context():
+            init_db()
+        print(f"{'turns':>6} {'store':>8} {'req/s':>8} {'cookie B':>9}")
+        for turns in args.turns:
+            for name, interface in [("cookie", SecureCookieSessionInterface()), ("sqlite", SQLiteSessionInterface())]:
+                app.session_interface = interface
+                rps, cookie = measure(app, turns, args.requests)
+                print(f"{turns:6} {name:>8} {rps:8.0f} {cookie:9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Slices per second of ``/slices`` for per-turn playback of a long recording.
+
+Writes a long mono 16-bit WAV (a prototype take is one file per participant) and requests
+random turn-long slices of it, checking them against the samples. For comparison, cutting
+the turn out of the fully read and decoded file, which is what playing a turn meant before.
+
+    python benchmarks/slices.py --minutes 30 --slices 2000 --threads 8
+"""
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from speechwoz.audio import read_wav, write_wav
+from speechwoz.db import init_db
+
+RATE = 16000
+
+
+def turns(n, seconds, max_turn=8.0):
+    rng = random.Random(0)
+    return [(round(rng.uniform(0, seconds - max_turn), 3), round(rng.uniform(1.0, max_turn), 3)) for _ in range(n)]
+
+
+def request_slice(client, start, duration):
+    t = time.perf_counter()
+    response = client.get(f"/slices/take.wav?start={start}&duration={duration}")
+    elapsed = time.perf_counter() - t
+    assert response.status_code == 200, response.status
+    return elapsed, response.data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--slices", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--full-reads", type=int, default=20, help="Slices cut from the decoded file.")
+    args = parser.parse_args()
+
+    from speechwoz.app import app
+
+    seconds = args.minutes * 60
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app.config.update(
+            TESTING=True, DATABASE=os.path.join(tmpdir, "bench.sqlite"), RECORDINGS_FOLDER=os.path.join(tmpdir, "rec")
+        )
+        with app.app_context():
+            init_db()
+        os.makedirs(app.config["RECORDINGS_FOLDER"])
+        path = os.path.join(app.config["RECORDINGS_FOLDER"], "take.wav")
+        samples = np.random.default_rng(0).integers(-3000, 3000, int(seconds * RATE), dtype=np.int16)
+        write_wav(path, samples, RATE)
+        print(f"{os.path.getsize(path) / 2**20:.0f} MiB WAV of {args.minutes:g} minutes")
+
+        # correctness of a few slices
+        client = app.test_client()
+        for start, duration in turns(10, seconds):
+            _, data = request_slice(client, start, duration)
+            got, rate = read_wav(io.BytesIO(data))
+            first = int(round(start * RATE))
+            assert rate == RATE and np.array_equal(got, samples[first : first + int(round(duration * RATE))])
+
+        requests = turns(args.slices, seconds)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            results = list(pool.map(lambda turn: request_slice(app.test_client(), *turn), requests))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(r[0] for r in results)
+        print(
+            f"mmap slices with {args.threads} threads: {args.slices / elapsed:.0f} slices/s,"
+            f" p50 {latencies[len(latencies) // 2] * 1000:.2f} ms p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms"
+        )
+
+        start = time.perf_counter()
+        for first, duration in turns(args.full_reads, seconds):
+            decoded, rate = read_wav(path)
+            out = io.BytesIO()
+            write_wav(out, decoded[int(first * rate) : int((first + duration) * rate)], rate)
+        elapsed = time.perf_counter() - start
+        print(f"full read and decode: {args.full_reads / elapsed:.1f} slices/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Slow uploads against gunicorn with sync vs. gevent workers.
+
+``--slow-clients`` clients trickle an upload chunk over ``--upload-seconds`` while a prober
+requests ``/hello`` every 50 ms. With sync workers the probes stall as soon as there are more
+slow clients than workers; with gevent workers they stay fast.
+
+    python benchmarks/slow_uploads.py --worker-class sync --workers 2 --slow-clients 8
+    python benchmarks/slow_uploads.py --worker-class gevent --workers 2 --slow-clients 8
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from speechwoz import create_app
+from speechwoz.db import init_db
+
+APPS = {"sync": "speechwoz.app:app", "gevent": "speechwoz.serve:app"}
+
+
+def request(port, method, path, body=None, headers=None, timeout=60):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response, data
+
+
+def login(port, pid):
+    response, _ = request(port, "GET", f"/?PROLIFIC_PID={pid}&SESSION_ID={pid}")
+    return response.getheader("Set-Cookie").split(";")[0]
+
+
+def slow_upload(port, pid, size, seconds, results):
+    cookie = login(port, pid)
+    _, data = request(port, "POST", "/upload/onboarding", headers={"Cookie": cookie})
+    upload_id = json.loads(data)["upload_id"]
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=seconds * 10)
+    conn.putrequest("PUT", f"/upload/onboarding/{upload_id}/0")
+    conn.putheader("Cookie", cookie)
+    conn.putheader("Content-Length", str(size))
+    conn.endheaders()
+    pieces = 20
+    for _ in range(pieces):
+        conn.send(b"\0" * (size // pieces))
+        time.sleep(seconds / pieces)
+    conn.send(b"\0" * (size - size // pieces * pieces))
+    results.append(json.loads(conn.getresponse().read())["status"])
+    conn.close()
+
+
+def probe(port, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        request(port, "GET", "/hello")
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.05)
+
+
+def wait_for_server(port, workers, timeout=30):
+    """Wait until all workers have loaded the app so startup does not count as latency."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            for _ in range(4 * workers):
+                request(port, "GET", "/hello", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-class", choices=sorted(APPS), default="gevent")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--slow-clients", type=int, default=8)
+    parser.add_argument("--upload-seconds", type=float, default=5)
+    parser.add_argument("--upload-kb", type=int, default=512)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = {
+            "DATABASE": os.path.join(tmpdir, "bench.sqlite"),
+            "UPLOAD_FOLDER": os.path.join(tmpdir, "uploads"),
+            "RECORDINGS_FOLDER": os.path.join(tmpdir, "recordings"),
+        }
+        app = create_app(dict(config, TESTING=True))
+        with app.app_context():
+            init_db()
+        env = dict(os.environ, **{f"FLASK_{k}": v for k, v in config.items()})
+        cmd = [sys.executable, "-m", "gunicorn", APPS[args.worker_class], "-k", args.worker_class]
+        cmd += ["-w", str(args.workers), "--bind", f"127.0.0.1:{args.port}"]
+        cmd += ["--timeout", "120", "--log-level", "warning"]
+        server = subprocess.Popen(cmd, env=env)
+        try:
+            wait_for_server(args.port, args.workers)
+            stop, latencies, results = threading.Event(), [], []
+            prober = threading.Thread(target=probe, args=(args.port, stop, latencies))
+            prober.start()
+            clients = [
+                threading.Thread(
+                    target=slow_upload,
+                    args=(args.port, f"bench{i}", args.upload_kb * 1024, args.upload_seconds, results),
+                )
+                for i in range(args.slow_clients)
+            ]
+            start = time.perf_counter()
+            for c in clients:
+                c.start()
+            for c in clients:
+                c.join()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            prober.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    print(
+        f"{args.worker_class} x{args.workers}: {results.count('ok')}/{args.slow_clients} slow uploads in {elapsed:.1f}s"
+    )
+    print(
+        f"  /hello during uploads: {len(latencies)} probes,"
+        f" p50 {latencies[len(latencies) // 2] * 1000:.0f} ms,"
+        f" p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms,"
+        f" max {latencies[-1] * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
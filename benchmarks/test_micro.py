@@ -0,0 +1,86 @@
+"""Micro-benchmarks of the per-request and per-take hot paths.
+
+    pytest benchmarks/test_micro.py --benchmark-only
+    pytest benchmarks/test_micro.py --benchmark-autosave  # then --benchmark-compare to catch regressions
+
+Needs ``pip install pytest-benchmark``.
+"""
+
+import io
+import os
+
+import numpy as np
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+from speechwoz import annotators, quality, review
+from speechwoz.miccheck import LevelMeter
+from speechwoz.storage import BlobWriter
+
+
+@pytest.fixture(scope="module")
+def samples():
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(16000 * 10) * 3000).astype(np.int16)
+
+
+def test_pseudonymize(app, benchmark):
+    benchmark(annotators.pseudonymize, "5f2a9b1c0d")
+
+
+def test_annotator_lookup(app, benchmark):
+    ann_id = annotators.register("5f2a9b1c0d")
+    assert benchmark(annotators.lookup, ann_id)["id"] == ann_id
+
+
+def test_quality_analyze(benchmark, samples):
+    benchmark(quality.analyze, samples, 16000)
+
+
+def test_peaks(benchmark, samples):
+    assert len(benchmark(review.peaks, samples)) == 2 * review.PEAKS_WIDTH
+
+
+def test_mic_check_block(benchmark, samples):
+    meter = LevelMeter(sample_rate=16000)
+    # 250 ms block as sent by the browser
+    benchmark(meter.update, samples[:4000])
+
+
+@pytest.mark.parametrize("size_kb", [64, 1024, 8192])
+def test_store_blob(app, benchmark, size_kb):
+    data = os.urandom(size_kb * 1024)
+
+    def store():
+        with BlobWriter(".mp3") as w:
+            for i in range(0, len(data), 64 * 1024):
+                w.write(data[i : i + 64 * 1024])
+            return w.commit()
+
+    benchmark(store)
+
+
+@pytest.mark.parametrize("size_kb", [64, 1024])
+def test_upload_recording(site, benchmark, size_kb):
+    client = site.test_client()
+    client.get("/?PROLIFIC_PID=micro&SESSION_ID=micro")
+    takes = iter(range(10 ** 9))
+
+    def upload():
+        take = next(takes).to_bytes(8, "little") * (size_kb * 128)
+        # encoded in memory, the test client would spool large files to unclosed temporary files
+        boundary, body = encode_multipart({"file": FileStorage(io.BytesIO(take), "take.mp3")})
+        return client.post(
+            "/upload_recording/onboarding", data=body, content_type=f"multipart/form-data; boundary={boundary}"
+        )
+
+    assert benchmark(upload).get_json()["status"] == "ok"
+
+
+@pytest.mark.parametrize("page_cache", [False, True])
+def test_index_page(site, benchmark, page_cache):
+    site.config["PAGE_CACHE"] = page_cache
+    client = site.test_client()
+    client.get("/?PROLIFIC_PID=micro&SESSION_ID=micro")
+    assert benchmark(client.get, "/?SESSION_ID=micro").status_code == 200
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Concurrent chunked uploads against ``create_app`` with a temporary instance folder.
+
+Every client opens an upload, sends its chunks in shuffled order (re-sending some of them
+to simulate retries) and finalizes. Reports throughput and the peak Python heap
+allocated while serving, which should stay around ``clients * UPLOAD_BUFFER_SIZE``
+regardless of the take size.
+
+    python benchmarks/upload_concurrency.py --clients 16 --take-mb 8 --chunk-kb 256
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from speechwoz import create_app
+from speechwoz.db import init_db
+
+
+def upload_take(app, take, chunk_size, retry_ratio):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["ann_id"] = "bench"
+    upload_id = client.post("/upload/onboarding").get_json()["upload_id"]
+    chunks = [take[i : i + chunk_size] for i in range(0, len(take), chunk_size)]
+    order = list(range(len(chunks)))
+    random.shuffle(order)
+    order += random.sample(order, int(len(order) * retry_ratio))
+    for i in order:
+        status = client.put(f"/upload/onboarding/{upload_id}/{i}", data=chunks[i]).get_json()["status"]
+        assert status == "ok", status
+    data = client.post(f"/upload/onboarding/{upload_id}/finalize", json={"num_chunks": len(chunks)}).get_json()
+    assert data["status"] == "ok", data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=32, help="Total number of takes to upload")
+    parser.add_argument("--take-mb", type=float, default=4)
+    parser.add_argument("--chunk-kb", type=int, default=256)
+    parser.add_argument("--retry-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_app(
+            {
+                "TESTING": True,
+                "MIC_CHECK_REQUIRED": False,
+                "DATABASE": os.path.join(tmpdir, "bench.sqlite"),
+                "UPLOAD_FOLDER": os.path.join(tmpdir, "uploads"),
+                "RECORDINGS_FOLDER": os.path.join(tmpdir, "recordings"),
+            }
+        )
+        os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+        with app.app_context():
+            init_db()
+        take = os.urandom(int(args.take_mb * 1024 * 1024))
+        chunk_size = args.chunk_kb * 1024
+
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            for f in [pool.submit(upload_take, app, take, chunk_size, args.retry_ratio) for _ in range(args.uploads)]:
+                f.result()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    total_mb = args.uploads * len(take) / 1024 / 1024
+    print(f"{args.uploads} uploads of {args.take_mb} MB by {args.clients} clients in {elapsed:.2f}s")
+    print(f"  {args.uploads / elapsed:.1f} uploads/s, {total_mb / elapsed:.1f} MB/s")
+    print(f"  peak traced heap while serving: {(peak - baseline) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,50 @@
+import os
+
 from flask import Flask
 from flask_socketio import SocketIO
 
+from .relay import Relay
+from .sharding import check_shards, shard_channel
+from .transcript import Transcript
+
 socketio = SocketIO()
+transcript = Transcript()
+relay = Relay()
+
 
+def create_app(debug=False, message_queue=None, shard=None, shard_urls=None, test_config=None):
+    """Create an application.
 
-def create_app(debug=False):
-    """Create an application."""
+    Several processes or nodes serve the chat together when they share a message queue,
+    e.g. a ``redis://`` or ``amqp://`` URL; ``memory://`` is an in-process stand-in for tests.
+    Rooms are split into as many shards as there are ``shard_urls`` (base URLs of the
+    processes serving them); this process serves ``shard`` and redirects other rooms.
+    All shards must share SECRET_KEY, it signs the redirects (see sharding.py).
+    Without arguments the settings are read from the SOCKETIO_MESSAGE_QUEUE, CHAT_SHARD
+    and CHAT_SHARD_URLS (space separated) environment variables."""
     app = Flask(__name__)
     app.debug = debug
     app.config['SECRET_KEY'] = 'gjr39dkjn344_!68#'
+    if message_queue is None:
+        message_queue = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    if shard is None:
+        shard = int(os.environ.get('CHAT_SHARD', 0))
+    if shard_urls is None:
+        shard_urls = os.environ.get('CHAT_SHARD_URLS', '').split()
+    check_shards(shard, shard_urls)
+    app.config['CHAT_SHARD'] = shard
+    app.config['CHAT_SHARD_URLS'] = shard_urls
+    if test_config is not None:
+        app.config.update(test_config)
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
-    socketio.init_app(app)
+    # the events of a client using its audio stream are handled in order, see ordering.py
+    socketio.init_app(app, message_queue=message_queue, channel=shard_channel(shard),
+                      async_mode=app.config.get('SOCKETIO_ASYNC_MODE'))
+    transcript.init_app(app)
+    relay.init_app(app)
+    socketio.start_background_task(transcript.run, socketio.sleep)
     return app
 
@@ -1,15 +1,33 @@
-from flask import session
+import functools
+import time
+
+from flask import current_app, request, session
 from flask_socketio import emit, join_room, leave_room
-from .. import socketio
+from .. import relay, socketio, transcript
+from ..ordering import forget, ordered
+from ..relay import CODECS
+
+
+def broadcast(room, kind, msg):
+    """Log the message to the room transcript and send it to all people in the room."""
+    message = transcript.append(room, kind, session.get('name'), msg)
+    emit(kind, {'msg': msg, 'seq': message['seq']}, room=room)
 
 
 @socketio.on('joined', namespace='/chat')
+@ordered
 def joined(message):
     """Sent by clients when they enter a room.
-    A status message is broadcast to all people in the room."""
+    The client first gets the messages after the sequence number ``since``
+    it saw last, then a status message is broadcast to all people in the room."""
     room = session.get('room')
     join_room(room)
-    emit('status', {'msg': session.get('name') + ' has entered the room.'}, room=room)
+    relay.join(request.sid, room, session.get('name'))
+    since = message.get('since')
+    if since is not None:
+        for m in transcript.replay(room, since, current_app.config['TRANSCRIPT_REPLAY_LIMIT']):
+            emit(m['kind'], {'msg': m['msg'], 'seq': m['seq']})
+    broadcast(room, 'status', session.get('name') + ' has entered the room.')
 
 
 @socketio.on('text', namespace='/chat')
@@ -17,14 +35,85 @@ def text(message):
     """Sent by a client when the user entered a new message.
     The message is sent to all people in the room."""
     room = session.get('room')
-    emit('message', {'msg': session.get('name') + ':' + message['msg']}, room=room)
+    broadcast(room, 'message', session.get('name') + ':' + message['msg'])
 
 
 @socketio.on('left', namespace='/chat')
+@ordered
 def left(message):
     """Sent by clients when they leave a room.
     A status message is broadcast to all people in the room."""
     room = session.get('room')
     leave_room(room)
-    emit('status', {'msg': session.get('name') + ' has left the room.'}, room=room)
+    relay.leave(request.sid)
+    broadcast(room, 'status', session.get('name') + ' has left the room.')
+
+
+@socketio.on('disconnect', namespace='/chat')
+@ordered
+def disconnect():
+    # after the frames of the client which are still being stored
+    relay.leave(request.sid)
+    forget(request.sid)
+
+
+@socketio.on('audio_start', namespace='/chat')
+@ordered
+def audio_start(message):
+    """Sent by a client before its audio frames: codec, rate, channels and its role.
+    The acknowledgement tells the status."""
+    codec = message.get('codec', 'pcm_s16le')
+    if codec not in CODECS:
+        return {'status': 'unknown-codec'}
+    path = relay.start(request.sid, message.get('role', 'speaker'), codec,
+                       int(message.get('rate', 16000)), int(message.get('channels', 1)))
+    if path is None:
+        return {'status': 'not-joined'}
+    return {'status': 'ok'}
+
+
+@socketio.on('audio', namespace='/chat')
+@ordered
+def audio(frame):
+    """A binary audio frame ``{'seq': n, 't': capture time, 'data': bytes}``,
+    Opus frames also give the number of ``samples`` they encode.
+    It is stored, relayed to the others in the room and acknowledged."""
+    stream = relay.streams.get(request.sid)
+    if stream is None or stream.track is None:
+        return {'status': 'not-started'}
+    data = frame.get('data')
+    samples = frame.get('samples')
+    if not isinstance(data, bytes) or len(data) > relay.max_frame_size:
+        return {'status': 'bad-frame'}
+    if stream.track.codec != 'pcm_s16le' and not isinstance(samples, int):
+        return {'status': 'no-samples'}
+    receivers, dropped = relay.receive(request.sid, data, frame.get('t'), samples)
+    for sid in receivers:
+        emit('audio', {'name': stream.name, 'role': stream.role, 'seq': frame.get('seq'), 't': frame.get('t'),
+                       'data': data},
+             to=sid, callback=functools.partial(relay.delivered, sid, time.time()))
+    return {'status': 'ok', 'dropped': dropped}
+
+
+@socketio.on('audio_stop', namespace='/chat')
+@ordered
+def audio_stop(message):
+    """Sent by a client when it stops recording, closes its track."""
+    stream = relay.streams.get(request.sid)
+    if stream is not None:
+        relay.stop(stream)
+    return {'status': 'ok'}
+
 
+@socketio.on('turn', namespace='/chat')
+@ordered
+def turn(message):
+    """Start or end of a dialogue turn ``{'event': 'start' | 'end', 'turn_id': ..., 'text': ...}``.
+    The acknowledgement tells its time in the speaker's recording."""
+    stream = relay.streams.get(request.sid)
+    if stream is None or stream.track is None:
+        return {'status': 'not-started'}
+    if message.get('event') not in ('start', 'end'):
+        return {'status': 'unknown-event'}
+    seconds = relay.turn(request.sid, message['event'], message.get('turn_id'), message.get('text'))
+    return {'status': 'ok', 'time': seconds}
@@ -1,6 +1,12 @@
-from flask import session, redirect, url_for, render_template, request
+import hmac
+
+from flask import abort, current_app, session, redirect, url_for, render_template, request, jsonify
 from . import main
+from .. import relay
 from .forms import LoginForm
+from ..sharding import handoff_token, load_handoff, room_shard
+
+LOOPBACK = {'127.0.0.1', '::1'}
 
 
 @main.route('/', methods=['GET', 'POST'])
@@ -26,9 +32,34 @@ def index():
 @main.route('/chat')
 def chat():
     """Chat room. The user's name and room must be stored in
-    the session."""
+    the session or handed over by another shard."""
+    if 'handoff' in request.args:
+        user = load_handoff(current_app.secret_key, request.args['handoff'])
+        if user is not None:
+            session['name'] = user['name']
+            session['room'] = user['room']
+        return redirect(url_for('main.chat'))
     name = session.get('name', '')
     room = session.get('room', '')
     if name == '' or room == '':
         return redirect(url_for('main.index'))
+    shard_urls = current_app.config['CHAT_SHARD_URLS']
+    shard = room_shard(room, len(shard_urls))
+    if shard != current_app.config['CHAT_SHARD']:
+        # all clients of a room connect to the same shard, which may not get our session cookie
+        token = handoff_token(current_app.secret_key, name, room)
+        return redirect(shard_urls[shard] + url_for('main.chat', handoff=token))
     return render_template('chat.html', name=name, room=room)
+
+
+@main.route('/relay/metrics')
+def relay_metrics():
+    """Frame counts, drops and latency percentiles of the audio relay."""
+    token = current_app.config['RELAY_METRICS_TOKEN']
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token)
+    else:
+        allowed = request.remote_addr in LOOPBACK and 'X-Forwarded-For' not in request.headers
+    if not allowed:
+        abort(403)
+    return jsonify(relay.metrics())
@@ -0,0 +1,78 @@
+"""In-order handling of the events of one client.
+
+Socket.IO runs every event handler in its own task, so the handlers of a client's events
+may overlap and finish in any order. Events using the client's audio stream must not: a
+turn event is stamped with the samples stored before it (see timeline.py) and the stream
+is closed when the client leaves, so not while one of its frames is being written. Handlers wrapped in
+``ordered`` run one at a time per client, in the order they started, i.e. the order their
+events arrived; handlers of other events and of other clients still run concurrently.
+The order relies on tasks starting in the order they are spawned, as on the eventlet hub.
+
+Waiting handlers block on events of the server's async mode, so they yield to the other
+tasks whether or not the standard library is monkey patched (chat.py only patches it for
+the message queue clients).
+"""
+import collections
+import functools
+import threading
+
+from flask import current_app, request
+
+
+class Turnstile(object):
+    """FIFO lock: holders enter one at a time, in the order they tried to enter.
+
+    ``create_event`` makes the events the waiting holders block on, e.g. threading.Event or
+    the ``create_event`` of the Engine.IO server."""
+
+    def __init__(self, create_event):
+        self.create_event = create_event
+        # events of the waiting holders, the first one enters next
+        self.waiting = collections.deque()
+        self.busy = False
+        # never held while waiting, so it does not block an unpatched event loop
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            if not self.busy:
+                self.busy = True
+                return
+            event = self.create_event()
+            self.waiting.append(event)
+        event.wait()
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            if self.waiting:
+                # handed over, the turnstile stays busy
+                self.waiting.popleft().set()
+            else:
+                self.busy = False
+
+
+# Socket.IO session id -> Turnstile
+_turnstiles = {}
+_lock = threading.Lock()
+
+
+def ordered(handler):
+    """Run the handler after the ordered handlers of earlier events of the same client."""
+
+    @functools.wraps(handler)
+    def wrapped(*args, **kwargs):
+        with _lock:
+            turnstile = _turnstiles.get(request.sid)
+            if turnstile is None:
+                create_event = current_app.extensions["socketio"].server.eio.create_event
+                turnstile = _turnstiles[request.sid] = Turnstile(create_event)
+        with turnstile:
+            return handler(*args, **kwargs)
+
+    return wrapped
+
+
+def forget(sid):
+    """Drop the state of a disconnected client."""
+    with _lock:
+        _turnstiles.pop(sid, None)
@@ -0,0 +1,240 @@
+"""Server-side relay of audio frames between the speakers of a room.
+
+A client announces its stream with ``audio_start`` (codec, sample rate, its role, e.g. agent
+or caller) and then sends binary ``audio`` frames on the /chat namespace. Every frame is
+first appended to the speaker's file under RELAY_FOLDER/<room>/ and then forwarded to the
+other clients of the room:
+
+- PCM (``pcm_s16le``) streams are written as WAV files,
+- Opus packets as ``.opus.frames`` files, each packet prefixed by its length (uint32 LE).
+
+Flow control works in both directions. A frame is acknowledged to the sender only after it
+is on disk, so a sender keeping a window of unacknowledged frames is slowed down to what the
+server can store. Towards a receiver at most RELAY_MAX_BUFFERED_FRAMES frames are in flight
+(sent and not acknowledged by the receiver); frames beyond that are dropped for that
+receiver only and counted, so one slow connection neither grows the server's memory nor
+delays the others. A receiver which acknowledged nothing for RELAY_ACK_TIMEOUT seconds is
+assumed to have lost its frames in flight and gets new frames again.
+
+Turn events sent between the frames are stamped on the tracks' sample clock and written
+with per-turn cuts when the session ends, see timeline.py.
+
+Latency is measured from the client's capture time stamp to the server (``ingest``, needs
+synchronised clocks) and as the round trip from the server to the receiver's ack
+(``delivery``); ``GET /relay/metrics`` reports percentiles of the latest samples. It lists
+names, rooms and file paths, so it answers only RELAY_METRICS_TOKEN bearer tokens or, without
+a token, unproxied requests from the local host.
+"""
+import collections
+import os
+import struct
+import threading
+import time
+import wave
+
+from werkzeug.utils import secure_filename
+
+from .timeline import Timeline
+
+CODECS = ["pcm_s16le", "opus"]
+
+# latency samples kept for the percentiles
+LATENCY_WINDOW = 1000
+
+
+class Track(object):
+    """The file receiving the frames of one speaker."""
+
+    def __init__(self, path, codec, rate, channels):
+        self.path = path
+        self.codec = codec
+        self.rate = rate
+        self.channels = channels
+        # the sample clock of the speaker
+        self.samples = 0
+        if codec == "pcm_s16le":
+            self.file = wave.open(path, "wb")
+            self.file.setnchannels(channels)
+            self.file.setsampwidth(2)
+            self.file.setframerate(rate)
+        else:
+            self.file = open(path, "wb")
+
+    def write(self, data, samples=None):
+        """Append a frame; the number of samples of an Opus packet must be given."""
+        if self.codec == "pcm_s16le":
+            self.file.writeframesraw(data)
+            self.samples += len(data) // (2 * self.channels)
+        else:
+            self.file.write(struct.pack("<I", len(data)) + data)
+            self.samples += samples
+
+    def seconds(self):
+        return self.samples / self.rate
+
+    def close(self):
+        # the wave writer fixes the header sizes on close
+        self.file.close()
+
+
+class Stream(object):
+    """State of one connection in the relay."""
+
+    def __init__(self, room, name):
+        self.room = room
+        self.name = name
+        self.role = None
+        self.track = None
+        self.track_id = None
+        self.in_flight = 0
+        # server time of the last ack, or of the first frame sent with nothing in flight
+        self.last_ack = None
+        self.frames = 0
+        self.dropped = 0
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"p50": None, "p99": None}
+    return {"p50": samples[len(samples) // 2] * 1000, "p99": samples[int(len(samples) * 0.99)] * 1000}
+
+
+class Relay(object):
+    """Streams of the connected clients, indexed by Socket.IO session id."""
+
+    def __init__(self, app=None):
+        self.streams = {}
+        self.rooms = collections.defaultdict(set)
+        self.timelines = {}
+        self.lock = threading.Lock()
+        self.ingest = collections.deque(maxlen=LATENCY_WINDOW)
+        self.delivery = collections.deque(maxlen=LATENCY_WINDOW)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.folder = config.setdefault("RELAY_FOLDER", os.path.join(app.instance_path, "relay"))
+        self.max_buffered = config.setdefault("RELAY_MAX_BUFFERED_FRAMES", 50)
+        self.max_frame_size = config.setdefault("RELAY_MAX_FRAME_SIZE", 64 * 1024)
+        self.ack_timeout = config.setdefault("RELAY_ACK_TIMEOUT", 5.0)
+        config.setdefault("RELAY_METRICS_TOKEN", os.environ.get("RELAY_METRICS_TOKEN"))
+
+    def join(self, sid, room, name):
+        self.leave(sid)
+        with self.lock:
+            self.streams[sid] = Stream(room, name)
+            self.rooms[room].add(sid)
+
+    def leave(self, sid):
+        with self.lock:
+            stream = self.streams.pop(sid, None)
+            if stream is not None:
+                self.rooms[stream.room].discard(sid)
+                if not self.rooms[stream.room]:
+                    del self.rooms[stream.room]
+        if stream is not None:
+            self.stop(stream)
+
+    def start(self, sid, role, codec, rate, channels):
+        """Open the speaker's file; returns its path or None for an unknown connection."""
+        stream = self.streams.get(sid)
+        if stream is None:
+            return None
+        self.stop(stream)
+        with self.lock:
+            timeline = self.timelines.get(stream.room)
+            if timeline is None:
+                session_id = "%d" % (time.time() * 1000)
+                folder = os.path.join(self.folder, secure_filename(stream.room), session_id)
+                timeline = self.timelines[stream.room] = Timeline(folder, session_id)
+            track_id = secure_filename("%s-%s-%d" % (role, stream.name, len(timeline.tracks)))
+            os.makedirs(timeline.folder, exist_ok=True)
+            ext = ".wav" if codec == "pcm_s16le" else ".opus.frames"
+            path = os.path.join(timeline.folder, track_id + ext)
+            stream.role = role
+            stream.track = Track(path, codec, rate, channels)
+            stream.track_id = track_id
+            timeline.add_track(track_id, stream.track, stream.name, role)
+        return path
+
+    def stop(self, stream):
+        """Close the stream's track; the last track of a session finalizes its timeline."""
+        if stream.track is None:
+            return
+        stream.track.close()
+        with self.lock:
+            timeline = self.timelines[stream.room]
+            last = timeline.close_track(stream.track_id)
+            if last:
+                del self.timelines[stream.room]
+        stream.track = stream.track_id = None
+        if last:
+            timeline.finalize()
+
+    def turn(self, sid, event, turn_id, text=None):
+        """Stamp a turn event on the speaker's sample clock; returns its time in seconds."""
+        stream = self.streams[sid]
+        return self.timelines[stream.room].stamp(stream.track_id, event, turn_id, text)
+
+    def receive(self, sid, data, sent_time=None, samples=None):
+        """Store a frame; returns the session ids of the receivers with space in their buffers
+        and the number of receivers the frame was dropped for."""
+        stream = self.streams.get(sid)
+        # the client may have left or stopped since its frame was checked
+        track = stream.track if stream is not None else None
+        if track is None:
+            return [], 0
+        track.write(data, samples)
+        stream.frames += 1
+        now = time.time()
+        if sent_time is not None:
+            self.ingest.append(now - sent_time)
+        receivers, dropped = [], 0
+        with self.lock:
+            for other_sid in self.rooms.get(stream.room, ()):
+                other = self.streams.get(other_sid)
+                if other is None or other_sid == sid:
+                    continue
+                if other.in_flight >= self.max_buffered and now - other.last_ack >= self.ack_timeout:
+                    # its acks are lost, e.g. the receiver reconnected
+                    other.in_flight = 0
+                if other.in_flight >= self.max_buffered:
+                    other.dropped += 1
+                    dropped += 1
+                    continue
+                if other.in_flight == 0:
+                    other.last_ack = now
+                other.in_flight += 1
+                receivers.append(other_sid)
+        return receivers, dropped
+
+    def delivered(self, sid, sent, *args):
+        """Ack callback of a frame sent to ``sid`` at server time ``sent``."""
+        self.delivery.append(time.time() - sent)
+        with self.lock:
+            stream = self.streams.get(sid)
+            if stream is not None and stream.in_flight > 0:
+                stream.in_flight -= 1
+                stream.last_ack = time.time()
+
+    def metrics(self):
+        with self.lock:
+            streams = [
+                {
+                    "room": s.room,
+                    "name": s.name,
+                    "role": s.role,
+                    "frames": s.frames,
+                    "dropped": s.dropped,
+                    "in_flight": s.in_flight,
+                    "recording": s.track.path if s.track else None,
+                }
+                for s in self.streams.values()
+            ]
+        return {
+            "streams": streams,
+            "ingest_ms": percentiles(self.ingest),
+            "delivery_ms": percentiles(self.delivery),
+        }
@@ -0,0 +1,55 @@
+"""Assignment of chat rooms to shards.
+
+Each shard is served by exactly one process, so a message only fans out to the process
+which has the clients of the room. The process keeps per-room state in memory, e.g. the
+sequence numbers of the transcript (see transcript.py) and the audio streams of the relay,
+so two processes must never serve the same shard; its message queue channel only lets
+other processes emit to the rooms of the shard.
+
+Shards may run on different hosts, where the session cookie of one shard is not sent to
+another. ``/chat`` therefore hands the user's name and room over to the shard of the room
+in a short-lived token signed with SECRET_KEY, which all shards must share.
+"""
+import zlib
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# seconds a handoff token is accepted, it is used right away by the redirect
+HANDOFF_MAX_AGE = 60
+
+
+def room_shard(room, num_shards):
+    """Stable shard index of a room, the same in every process."""
+    if num_shards <= 1:
+        return 0
+    return zlib.crc32(room.encode("utf8")) % num_shards
+
+
+def shard_channel(shard):
+    """Message queue channel of the processes serving ``shard``."""
+    return "flask-socketio-shard%d" % shard
+
+
+def check_shards(shard, shard_urls):
+    """Raise ValueError unless ``shard`` is one of ``shard_urls``; a single process needs no URLs."""
+    if not shard_urls and shard == 0:
+        return
+    if not 0 <= shard < len(shard_urls):
+        raise ValueError("CHAT_SHARD=%d but CHAT_SHARD_URLS lists %d shards" % (shard, len(shard_urls)))
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt="chat-shard-handoff")
+
+
+def handoff_token(secret_key, name, room):
+    """Token carrying the user's name and room to the shard of the room."""
+    return _serializer(secret_key).dumps({"name": name, "room": room})
+
+
+def load_handoff(secret_key, token, max_age=HANDOFF_MAX_AGE):
+    """The name and room of a handoff token, or None if it is forged or expired."""
+    try:
+        return _serializer(secret_key).loads(token, max_age=max_age)
+    except BadSignature:
+        return None
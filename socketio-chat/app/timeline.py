@@ -0,0 +1,126 @@
+"""Session timeline of a room: turn events on the audio sample clock and per-turn cuts.
+
+The clients send ``turn`` events (start or end of a dialogue turn) on the same connection as
+their audio frames, so an event arrives right after the frames recorded before it. The
+server stamps it with the number of samples stored in the speaker's track at that moment,
+i.e. its position in the speaker's own file, whatever the clocks of the browsers say.
+
+Events are kept in memory. Once the last track of the session is closed, the timeline is
+written next to the recordings as ``timeline.json`` together with ``cuts.jsonl``: one Lhotse
+MonoCut per turn, cut out of its speaker's file.
+"""
+import json
+import os
+import time
+
+
+class Timeline(object):
+    """Tracks and turn events of one recording session of a room."""
+
+    def __init__(self, folder, session_id):
+        self.folder = folder
+        self.session_id = session_id
+        self.tracks = {}
+        self.open_tracks = set()
+        self.events = []
+
+    def add_track(self, track_id, track, name, role):
+        """Register a new track; its offset is where the session's longest open track is now."""
+        offset = max([self.tracks[t]["track"].seconds() for t in self.open_tracks] + [0.0])
+        self.tracks[track_id] = {"track": track, "name": name, "role": role, "offset": offset}
+        self.open_tracks.add(track_id)
+
+    def stamp(self, track_id, event, turn_id, text=None):
+        """Record a turn event at the current end of the track; returns its time in seconds."""
+        track = self.tracks[track_id]["track"]
+        self.events.append(
+            {
+                "track": track_id,
+                "event": event,
+                "turn_id": turn_id,
+                "text": text,
+                "sample": track.samples,
+                "time": track.seconds(),
+                "received": time.time(),
+            }
+        )
+        return track.seconds()
+
+    def close_track(self, track_id):
+        """Mark a track as finished; returns True when it was the last open one."""
+        self.open_tracks.discard(track_id)
+        return not self.open_tracks
+
+    def turns(self):
+        """Pairs of start and end events per track and turn; an open turn ends with its track."""
+        started = {}
+        for event in self.events:
+            key = (event["track"], event["turn_id"])
+            if event["event"] == "start":
+                started[key] = event
+            elif event["event"] == "end" and key in started:
+                yield started.pop(key), event
+        for (track_id, turn_id), start in started.items():
+            track = self.tracks[track_id]["track"]
+            yield start, {"sample": track.samples, "time": track.seconds(), "text": None}
+
+    def to_cuts(self):
+        """Lhotse MonoCut dicts, one per turn."""
+        cuts = []
+        for start, end in self.turns():
+            info = self.tracks[start["track"]]
+            track = info["track"]
+            rid = "%s-%s" % (self.session_id, start["track"])
+            cid = "%s-%s" % (rid, start["turn_id"])
+            duration = (end["sample"] - start["sample"]) / track.rate
+            if duration <= 0:
+                continue
+            recording = {
+                "id": rid,
+                "sources": [{"type": "file", "channels": [0], "source": track.path}],
+                "sampling_rate": track.rate,
+                "num_samples": track.samples,
+                "duration": track.seconds(),
+                "channel_ids": [0],
+            }
+            supervision = {
+                "id": cid,
+                "recording_id": rid,
+                "start": 0.0,
+                "duration": duration,
+                "channel": 0,
+                "text": start["text"] or end["text"],
+                "speaker": info["name"],
+                "custom": {"role": info["role"], "turn_id": start["turn_id"], "session_offset": info["offset"]},
+            }
+            cuts.append(
+                {
+                    "id": cid,
+                    "start": start["time"],
+                    "duration": duration,
+                    "channel": 0,
+                    "supervisions": [supervision],
+                    "recording": recording,
+                    "type": "MonoCut",
+                }
+            )
+        return cuts
+
+    def finalize(self):
+        """Write the timeline and the per-turn cuts next to the tracks."""
+        tracks = {
+            track_id: {
+                "path": info["track"].path,
+                "name": info["name"],
+                "role": info["role"],
+                "rate": info["track"].rate,
+                "samples": info["track"].samples,
+                "offset": info["offset"],
+            }
+            for track_id, info in self.tracks.items()
+        }
+        with open(os.path.join(self.folder, "timeline.json"), "w") as w:
+            json.dump({"session_id": self.session_id, "tracks": tracks, "events": self.events}, w, indent=1)
+        with open(os.path.join(self.folder, "cuts.jsonl"), "w") as w:
+            for cut in self.to_cuts():
+                w.write(json.dumps(cut, ensure_ascii=False) + "\n")
@@ -0,0 +1,162 @@
+"""Append-only transcript of the chat rooms.
+
+Every status and text message gets the next sequence number of its room and is queued;
+a background task writes the queue to SQLite in one transaction every
+TRANSCRIPT_FLUSH_INTERVAL seconds (group commit), or right away once TRANSCRIPT_BATCH_SIZE
+messages are waiting. A message is therefore on disk at most one flush interval after it
+was broadcast.
+
+The latest TRANSCRIPT_TAIL_SIZE messages of each room are also kept in memory, so a client
+reconnecting with the last sequence number it saw is usually served without touching the
+database. Sequence numbers are assigned by the process serving the room, which is why a
+shard must only be served by one process (see sharding.py). Should a second process serve
+it anyway, the messages it numbered twice are logged and skipped, the others are stored.
+
+A batch leaves the queue only once it is committed; a failed flush is logged and retried
+with the next one.
+"""
+import atexit
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message (
+    room TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT,
+    msg TEXT NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (room, seq)
+) WITHOUT ROWID;
+"""
+
+
+# target of INSERT and INSERT OR IGNORE of queued messages
+INTO_MESSAGE = "INTO message (room, seq, kind, name, msg, time) VALUES (:room, :seq, :kind, :name, :msg, :time)"
+
+
+class Transcript(object):
+    """Batched writer and replay cache of the room transcripts."""
+
+    def __init__(self, app=None):
+        self.db = None
+        self.pending = []
+        self.tails = {}
+        self.last_seq = {}
+        # lock guards the in-memory state, flush_lock the database connection
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        path = config.setdefault("TRANSCRIPT_DATABASE", os.path.join(app.instance_path, "transcript.sqlite"))
+        self.batch_size = config.setdefault("TRANSCRIPT_BATCH_SIZE", 1000)
+        self.flush_interval = config.setdefault("TRANSCRIPT_FLUSH_INTERVAL", 0.05)
+        self.tail_size = config.setdefault("TRANSCRIPT_TAIL_SIZE", 1000)
+        config.setdefault("TRANSCRIPT_REPLAY_LIMIT", 1000)
+        self.open(path, config.setdefault("TRANSCRIPT_SYNCHRONOUS", "NORMAL"))
+
+    def open(self, path, synchronous="NORMAL"):
+        """Open the transcript database, after closing one opened before."""
+        self.close()
+        # sequence numbers continue from the database
+        self.pending, self.tails, self.last_seq = [], {}, {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # NORMAL: a power loss may lose the last committed batches, FULL syncs every batch
+        self.db.execute("PRAGMA synchronous=%s" % synchronous)
+        self.db.executescript(SCHEMA)
+        atexit.register(self.flush)
+
+    def close(self):
+        """Write the queued messages and close the database."""
+        if self.db is None:
+            return
+        atexit.unregister(self.flush)
+        self.flush()
+        self.db.close()
+        self.db = None
+
+    def append(self, room, kind, name, msg):
+        """Queue a message of the room and return it with its sequence number."""
+        if room not in self.last_seq:
+            with self.flush_lock:
+                row = self.db.execute("SELECT MAX(seq) FROM message WHERE room = ?", (room,)).fetchone()
+            with self.lock:
+                if room not in self.last_seq:
+                    self.last_seq[room] = row[0] or 0
+                    self.tails[room] = collections.deque(maxlen=self.tail_size)
+        with self.lock:
+            self.last_seq[room] += 1
+            message = {
+                "room": room,
+                "seq": self.last_seq[room],
+                "kind": kind,
+                "name": name,
+                "msg": msg,
+                "time": time.time(),
+            }
+            self.tails[room].append(message)
+            self.pending.append(message)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+        return message
+
+    def flush(self):
+        """Write all queued messages in one transaction."""
+        with self.flush_lock:
+            with self.lock:
+                batch = self.pending[:]
+            if batch:
+                try:
+                    with self.db:
+                        self.db.executemany("INSERT " + INTO_MESSAGE, batch)
+                except sqlite3.IntegrityError:
+                    # another process numbered messages of the same room, see sharding.py
+                    with self.db:
+                        stored = self.db.executemany("INSERT OR IGNORE " + INTO_MESSAGE, batch).rowcount
+                    logging.warning(
+                        "Skipped %d transcript messages with duplicate sequence numbers", len(batch) - stored
+                    )
+                # appends only add to the end, flushes are serialized by flush_lock
+                with self.lock:
+                    del self.pending[: len(batch)]
+        return len(batch)
+
+    def replay(self, room, since=0, limit=1000):
+        """The last ``limit`` messages of the room with a sequence number above ``since``."""
+        with self.lock:
+            tail = self.tails.get(room, ())
+            first = tail[0]["seq"] if tail else None
+            recent = [m for m in tail if m["seq"] > since]
+        if first is not None and (first <= since + 1 or len(recent) >= limit):
+            return recent[-limit:]
+        # older than the cached tail, the flush makes everything queued so far readable
+        self.flush()
+        with self.flush_lock:
+            rows = self.db.execute(
+                "SELECT * FROM message WHERE room = ? AND seq > ? ORDER BY seq DESC LIMIT ?", (room, since, limit)
+            ).fetchall()
+        messages = [dict(row) for row in reversed(rows)]
+        last = messages[-1]["seq"] if messages else since
+        messages.extend(m for m in recent if m["seq"] > last)
+        return messages[-limit:]
+
+    def run(self, sleep):
+        """Flush periodically, meant to run as a background task; ``sleep`` is the async mode's sleep."""
+        while True:
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Flushing the transcript failed, retrying with the next batch")
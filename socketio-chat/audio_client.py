@@ -0,0 +1,137 @@
+#!/bin/env python
+"""Simulated agent and caller streaming audio to each other through the relay.
+
+Both clients join one room, announce a 16 kHz PCM stream and send 20 ms frames of a tone in
+real time, keeping at most ``--window`` frames unacknowledged (the server acknowledges a
+frame once it is on disk). Each prints the end-to-end latency of the frames it received
+from the other; the server's view is at /relay/metrics. The speakers take turns of
+``--turn-seconds``, marked with turn events, and the server writes one cut per turn when
+both close their tracks.
+
+    python audio_client.py --url http://localhost:8090 --seconds 10
+    python audio_client.py --slow-receiver 0.05  # caller acks late, the relay drops frames for it
+
+Needs the Socket.IO client extras: pip install "python-socketio[client]" requests
+"""
+import argparse
+import json
+import math
+import re
+import struct
+import threading
+import time
+
+import requests
+import socketio
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+RATE = 16000
+FRAME = RATE // 50
+
+
+def tone(freq, seq):
+    start = seq * FRAME
+    return struct.pack(
+        "<%dh" % FRAME, *(int(8000 * math.sin(2 * math.pi * freq * (start + i) / RATE)) for i in range(FRAME))
+    )
+
+
+class Speaker(object):
+    def __init__(self, url, room, role, delay):
+        http = requests.Session()
+        csrf_token = CSRF_RE.search(http.get(url + "/").text).group(1)
+        http.post(url + "/", data={"name": role, "room": room, "csrf_token": csrf_token})
+        shard_url = http.get(url + "/chat").url[: -len("/chat")]
+        self.role = role
+        self.delay = delay
+        self.latencies = []
+        self.dropped = 0
+        self.window = None
+        # the client runs every handler in its own thread, a slow receiver handles one frame at a time
+        self.busy = threading.Lock()
+        self.sio = socketio.Client()
+        self.sio.on("audio", self.on_audio, namespace="/chat")
+        self.sio.connect(
+            shard_url,
+            headers={"Cookie": "; ".join("%s=%s" % (c.name, c.value) for c in http.cookies)},
+            namespaces=["/chat"],
+        )
+        self.sio.emit("joined", {}, namespace="/chat")
+
+    def on_audio(self, frame):
+        self.latencies.append(time.time() - frame["t"])
+        if self.delay:
+            with self.busy:
+                time.sleep(self.delay)
+        return "ok"
+
+    def on_ack(self, reply):
+        self.dropped += reply.get("dropped", 0)
+        self.window.release()
+
+    def stream(self, seconds, freq, window, turn_frames=0, parity=0):
+        self.window = threading.Semaphore(window)
+        reply = self.sio.call("audio_start", {"codec": "pcm_s16le", "rate": RATE, "role": self.role}, namespace="/chat")
+        assert reply["status"] == "ok", reply
+        start = time.time()
+        for seq in range(seconds * 50):
+            # real time pace, unless the server's acks hold us back
+            time.sleep(max(0.0, start + seq * 0.02 - time.time()))
+            if turn_frames and seq % turn_frames == 0 and (seq // turn_frames) % 2 == parity:
+                self.sio.emit("turn", {"event": "start", "turn_id": seq // turn_frames}, namespace="/chat")
+            self.window.acquire()
+            self.sio.emit(
+                "audio",
+                {"seq": seq, "t": time.time(), "data": tone(freq, seq)},
+                namespace="/chat",
+                callback=self.on_ack,
+            )
+            if turn_frames and (seq + 1) % turn_frames == 0 and (seq // turn_frames) % 2 == parity:
+                self.sio.emit("turn", {"event": "end", "turn_id": seq // turn_frames}, namespace="/chat")
+        self.window.acquire()
+        self.sio.call("audio_stop", {}, namespace="/chat")
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return "%s: no frames received" % self.role
+        return "%s: received %d frames, end-to-end p50 %.1f ms p99 %.1f ms, dropped for the peer %d" % (
+            self.role,
+            len(latencies),
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            self.dropped,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8090")
+    parser.add_argument("--room", default="audio%d" % time.time())
+    parser.add_argument("--seconds", type=int, default=5)
+    parser.add_argument("--window", type=int, default=10, help="Unacknowledged frames a sender may have.")
+    parser.add_argument("--turn-seconds", type=float, default=1.0)
+    parser.add_argument("--slow-receiver", type=float, default=0.0, help="Seconds the caller takes per frame.")
+    args = parser.parse_args()
+    url = args.url.rstrip("/")
+    agent = Speaker(url, args.room, "agent", 0.0)
+    caller = Speaker(url, args.room, "caller", args.slow_receiver)
+    turn_frames = int(args.turn_seconds * 50)
+    threads = [
+        threading.Thread(target=agent.stream, args=(args.seconds, 440, args.window, turn_frames, 0)),
+        threading.Thread(target=caller.stream, args=(args.seconds, 660, args.window, turn_frames, 1)),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(1)
+    print(agent.report())
+    print(caller.report())
+    print(json.dumps(requests.get(url + "/relay/metrics").json(), indent=1))
+    agent.sio.disconnect()
+    caller.sio.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/bin/env python
+"""Transcript log throughput: messages per second sustained to disk and replay latency.
+
+Appends ``--messages`` messages spread over ``--rooms`` rooms from ``--threads`` threads,
+once committing every message and then with group commits of growing batch sizes, with
+and without a sync of every commit, and
+times replays from a recent and from an old sequence number.
+
+    python bench_transcript.py --messages 20000 --rooms 100
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.transcript import Transcript
+
+
+def bench(path, synchronous, batch_size, flush_interval, num_messages, num_rooms, num_threads):
+    transcript = Transcript()
+    transcript.batch_size = batch_size
+    transcript.flush_interval = flush_interval
+    transcript.tail_size = 100
+    transcript.open(path, synchronous)
+    stop = threading.Event()
+
+    def flusher():
+        while not stop.wait(flush_interval):
+            transcript.flush()
+
+    def send(i):
+        transcript.append("room%d" % (i % num_rooms), "message", "bench", "bench:message %d" % i)
+
+    thread = threading.Thread(target=flusher)
+    thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(num_threads) as pool:
+        list(pool.map(send, range(num_messages)))
+    stop.set()
+    thread.join()
+    transcript.flush()
+    elapsed = time.perf_counter() - start
+
+    def replay_ms(since):
+        start = time.perf_counter()
+        for r in range(num_rooms):
+            transcript.replay("room%d" % r, since, 1000)
+        return (time.perf_counter() - start) / num_rooms * 1000
+
+    last = num_messages // num_rooms
+    print(
+        "synchronous %-6s batch %5d: %8.0f msg/s to disk, replay of the last 10 %.3f ms, of everything %.3f ms"
+        % (synchronous, batch_size, num_messages / elapsed, replay_ms(last - 10), replay_ms(0))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for synchronous in ["NORMAL", "FULL"]:
+            for batch_size in [1, 10, 100, 1000]:
+                path = os.path.join(tmpdir, "transcript-%s-%d.sqlite" % (synchronous, batch_size))
+                bench(path, synchronous, batch_size, args.flush_interval, args.messages, args.rooms, args.threads)
+
+
+if __name__ == "__main__":
+    main()
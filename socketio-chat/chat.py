@@ -1,10 +1,18 @@
 #!/bin/env python
+import os
+
+if os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+    # the message queue clients must not block the event loop
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import create_app, socketio
 
+# multi-process setup: SOCKETIO_MESSAGE_QUEUE=redis://... CHAT_SHARD=0 CHAT_SHARD_URLS="http://... http://..."
 app = create_app(debug=True)
 
 if __name__ == '__main__':
     socketio.run(app,
             # host="namuddis",
-            port=8090,
+            port=int(os.environ.get('PORT', 8090)),
             )
@@ -0,0 +1,124 @@
+#!/bin/env python
+"""Load generator for the chat: fan-out latency and delivered messages per second.
+
+For every combination of ``--rooms`` and ``--clients`` (clients per room) it logs the clients
+in through the login form, follows the redirect to the shard serving their room, joins the
+room over Socket.IO and lets every client send ``--messages`` messages. Each message is
+stamped with its send time, so every receiving client measures the fan-out latency.
+
+    python loadgen.py --url http://localhost:8090 --rooms 1 10 --clients 2 10 --messages 20
+
+Needs the Socket.IO client extras: pip install "python-socketio[client]" requests
+"""
+import argparse
+import json
+import re
+import threading
+import time
+
+import requests
+import socketio
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class ChatClient(object):
+    """One logged in chat participant."""
+
+    def __init__(self, url, name, room, latencies, lock):
+        self.name = name
+        self.received = 0
+        self.latencies = latencies
+        self.lock = lock
+        http = requests.Session()
+        csrf_token = CSRF_RE.search(http.get(url + "/").text).group(1)
+        http.post(url + "/", data={"name": name, "room": room, "csrf_token": csrf_token})
+        # /chat redirects to the shard serving the room
+        shard_url = http.get(url + "/chat").url[: -len("/chat")]
+        cookies = "; ".join("%s=%s" % (c.name, c.value) for c in http.cookies)
+        self.joined = threading.Event()
+        self.sio = socketio.Client()
+        self.sio.on("status", self.on_status, namespace="/chat")
+        self.sio.on("message", self.on_message, namespace="/chat")
+        self.sio.connect(shard_url, headers={"Cookie": cookies}, namespaces=["/chat"])
+        self.sio.emit("joined", {}, namespace="/chat")
+
+    def on_status(self, data):
+        if data["msg"].startswith(self.name + " "):
+            self.joined.set()
+
+    def on_message(self, data):
+        now = time.time()
+        sender, payload = data["msg"].split(":", 1)
+        if sender == self.name:
+            return
+        with self.lock:
+            self.received += 1
+            self.latencies.append(now - json.loads(payload)["t"])
+
+    def send(self, i):
+        self.sio.emit("text", {"msg": json.dumps({"t": time.time(), "i": i})}, namespace="/chat")
+
+    def close(self):
+        self.sio.disconnect()
+
+
+def run(url, num_rooms, clients_per_room, num_messages, interval, prefix):
+    latencies = []
+    lock = threading.Lock()
+    clients = [
+        ChatClient(url, "%s-r%d-c%d" % (prefix, r, c), "%s-room%d" % (prefix, r), latencies, lock)
+        for r in range(num_rooms)
+        for c in range(clients_per_room)
+    ]
+    for client in clients:
+        client.joined.wait(10)
+    expected = num_rooms * clients_per_room * (clients_per_room - 1) * num_messages
+    start = time.time()
+    for i in range(num_messages):
+        for client in clients:
+            client.send(i)
+        time.sleep(interval)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        with lock:
+            if len(latencies) >= expected:
+                break
+        time.sleep(0.05)
+    elapsed = time.time() - start
+    for client in clients:
+        client.close()
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else float("nan")
+
+    print(
+        "rooms %4d  clients/room %4d  delivered %7d/%-7d  %8.0f msg/s  p50 %7.1f ms  p99 %7.1f ms"
+        % (num_rooms, clients_per_room, len(latencies), expected, len(latencies) / elapsed, pct(0.5), pct(0.99))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8090", help="Any node, rooms are redirected to their shard.")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--clients", type=int, nargs="+", default=[2, 10], help="Clients per room.")
+    parser.add_argument("--messages", type=int, default=20, help="Messages sent by every client.")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between rounds of messages.")
+    args = parser.parse_args()
+    prefix = "load%d" % time.time()
+    for num_rooms in args.rooms:
+        for clients_per_room in args.clients:
+            run(
+                args.url.rstrip("/"),
+                num_rooms,
+                clients_per_room,
+                args.messages,
+                args.interval,
+                "%s-%dx%d" % (prefix, num_rooms, clients_per_room),
+            )
+
+
+if __name__ == "__main__":
+    main()
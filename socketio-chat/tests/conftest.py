@@ -0,0 +1,45 @@
+import pytest
+
+from app import create_app, relay, socketio, transcript
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Create apps of the chat with their state in ``tmp_path``; the transcript is closed after the test."""
+
+    def make_app(**kwargs):
+        config = {
+            "TESTING": True,
+            "TRANSCRIPT_DATABASE": str(tmp_path / "transcript.sqlite"),
+            "RELAY_FOLDER": str(tmp_path / "relay"),
+            "SOCKETIO_ASYNC_MODE": "threading",
+        }
+        config.update(kwargs.pop("test_config", {}))
+        return create_app(test_config=config, **kwargs)
+
+    yield make_app
+    for sid in list(relay.streams):
+        relay.leave(sid)
+    transcript.close()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(shard=0, shard_urls=[])
+
+
+@pytest.fixture
+def join():
+    """Connect a Socket.IO client of ``name`` to the chat of ``app`` and join ``room``; returns the client."""
+
+    def join(app, name, room="room1"):
+        flask_client = app.test_client()
+        with flask_client.session_transaction() as session:
+            session["name"] = name
+            session["room"] = room
+        client = socketio.test_client(app, namespace="/chat", flask_test_client=flask_client)
+        client.emit("joined", {}, namespace="/chat")
+        client.get_received("/chat")
+        return client
+
+    return join
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+from flask import request
+
+from app.ordering import Turnstile, forget, ordered
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_turnstile_order():
+    turnstile = Turnstile(threading.Event)
+    entered = []
+    inside = []
+
+    def holder(i):
+        with turnstile:
+            inside.append(i)
+            assert len(inside) == 1
+            entered.append(i)
+            time.sleep(0.001)
+            inside.remove(i)
+
+    threads = []
+    with turnstile:
+        for i in range(10):
+            threads.append(threading.Thread(target=holder, args=(i,)))
+            threads[-1].start()
+            # the next one arrives after this one waits
+            wait_until(lambda: len(turnstile.waiting) == i + 1)
+    for thread in threads:
+        thread.join()
+    assert entered == list(range(10))
+    assert not turnstile.busy and not turnstile.waiting
+
+
+def test_turnstile_released_on_error():
+    turnstile = Turnstile(threading.Event)
+    try:
+        with turnstile:
+            raise ValueError()
+    except ValueError:
+        pass
+    assert not turnstile.busy
+
+
+def test_ordered_handlers(app):
+    """Handlers of one client run in the order of its events, those of other clients alongside."""
+    release = threading.Event()
+    calls = []
+
+    @ordered
+    def handler(name):
+        calls.append(("start", name))
+        if name == "first":
+            release.wait(5)
+        calls.append(("end", name))
+
+    def event(sid, name):
+        with app.test_request_context():
+            request.sid = sid
+            handler(name)
+
+    threads = [threading.Thread(target=event, args=("sid1", "first"))]
+    threads[0].start()
+    wait_until(lambda: ("start", "first") in calls)
+    threads.append(threading.Thread(target=event, args=("sid1", "second")))
+    threads[1].start()
+    # another client is not held up
+    event("sid2", "other")
+    assert calls == [("start", "first"), ("start", "other"), ("end", "other")]
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls[3:] == [("end", "first"), ("start", "second"), ("end", "second")]
+    forget("sid1")
+    forget("sid2")
+
+
+def test_ordered_handlers_without_monkey_patching(make_app):
+    """Waiting handlers yield to the event loop, a blocked thread lock would stall it."""
+    gevent = pytest.importorskip("gevent")
+    app = make_app(shard=0, shard_urls=[], test_config={"SOCKETIO_ASYNC_MODE": "gevent"})
+    calls = []
+
+    @ordered
+    def handler(name):
+        calls.append(("start", name))
+        gevent.sleep(0.01 if name == "first" else 0)
+        calls.append(("end", name))
+
+    def event(name):
+        with app.test_request_context():
+            request.sid = "sid"
+            handler(name)
+
+    greenlets = [gevent.spawn(event, name) for name in ["first", "second", "third"]]
+    gevent.joinall(greenlets, timeout=5, raise_error=True)
+    assert calls == [(kind, name) for name in ["first", "second", "third"] for kind in ["start", "end"]]
+    forget("sid")
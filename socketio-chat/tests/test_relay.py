@@ -0,0 +1,114 @@
+import json
+import os
+import time
+import wave
+
+import pytest
+
+from app import relay
+
+RATE = 16000
+# 20 ms of silence
+FRAME = b"\x00\x00" * (RATE // 50)
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(shard=0, shard_urls=[], test_config={"RELAY_MAX_BUFFERED_FRAMES": 3})
+
+
+def emit(client, event, data):
+    return client.emit(event, data, namespace="/chat", callback=True)
+
+
+def start(client, role):
+    return emit(client, "audio_start", {"codec": "pcm_s16le", "rate": RATE, "role": role})
+
+
+def frames(client):
+    return [m["args"][0] for m in client.get_received("/chat") if m["name"] == "audio"]
+
+
+def sid_of(name):
+    return next(sid for sid, stream in relay.streams.items() if stream.name == name)
+
+
+def test_relay(app, join):
+    alice, bob = join(app, "alice"), join(app, "bob")
+    assert start(alice, "agent") == {"status": "ok"}
+    assert emit(alice, "audio", {"seq": 0, "t": time.time(), "data": FRAME}) == {"status": "ok", "dropped": 0}
+    (frame,) = frames(bob)
+    assert (frame["name"], frame["role"], frame["seq"], frame["data"]) == ("alice", "agent", 0, FRAME)
+    assert frames(alice) == []
+
+
+def test_backpressure(app, join):
+    """Frames beyond the receiver's window of unacknowledged frames are dropped for it only."""
+    alice, bob = join(app, "alice"), join(app, "bob")
+    start(alice, "agent")
+    acks = [emit(alice, "audio", {"seq": seq, "data": FRAME})["dropped"] for seq in range(5)]
+    # the test client does not acknowledge the frames it gets
+    assert acks == [0, 0, 0, 1, 1]
+    assert [frame["seq"] for frame in frames(bob)] == [0, 1, 2]
+    relay.delivered(sid_of("bob"), time.time())
+    assert emit(alice, "audio", {"seq": 5, "data": FRAME})["dropped"] == 0
+    assert [frame["seq"] for frame in frames(bob)] == [5]
+    streams = {s["name"]: s for s in relay.metrics()["streams"]}
+    assert (streams["alice"]["frames"], streams["bob"]["dropped"], streams["bob"]["in_flight"]) == (6, 2, 3)
+    # every frame is stored whether relayed or not
+    assert relay.streams[sid_of("alice")].track.samples == 6 * len(FRAME) // 2
+
+
+def test_lost_acks(app, join):
+    app.config["RELAY_ACK_TIMEOUT"] = relay.ack_timeout = 0.05
+    alice, bob = join(app, "alice"), join(app, "bob")
+    start(alice, "agent")
+    for seq in range(4):
+        emit(alice, "audio", {"seq": seq, "data": FRAME})
+    time.sleep(0.05)
+    assert emit(alice, "audio", {"seq": 4, "data": FRAME})["dropped"] == 0
+    assert [frame["seq"] for frame in frames(bob)] == [0, 1, 2, 4]
+
+
+def test_bad_frames(app, join):
+    alice = join(app, "alice")
+    assert emit(alice, "audio", {"seq": 0, "data": FRAME}) == {"status": "not-started"}
+    assert emit(alice, "audio_start", {"codec": "mp3"}) == {"status": "unknown-codec"}
+    start(alice, "agent")
+    assert emit(alice, "audio", {"seq": 0, "data": "text"}) == {"status": "bad-frame"}
+    assert emit(alice, "audio", {"seq": 0, "data": b"\x00" * (relay.max_frame_size + 1)}) == {"status": "bad-frame"}
+
+
+def test_stop_flushes(app, join):
+    alice, bob = join(app, "alice"), join(app, "bob")
+    start(alice, "agent")
+    start(bob, "caller")
+    path = relay.streams[sid_of("alice")].track.path
+    assert emit(alice, "turn", {"event": "start", "turn_id": 0, "text": "Hello."}) == {"status": "ok", "time": 0.0}
+    for seq in range(50):
+        emit(alice, "audio", {"seq": seq, "data": FRAME})
+    assert emit(alice, "turn", {"event": "end", "turn_id": 0}) == {"status": "ok", "time": 1.0}
+    assert emit(alice, "audio_stop", {}) == {"status": "ok"}
+    assert emit(alice, "turn", {"event": "start", "turn_id": 1}) == {"status": "not-started"}
+    # the header is written when the track is closed
+    with wave.open(path) as w:
+        assert (w.getframerate(), w.getnframes()) == (RATE, RATE)
+    folder = os.path.dirname(path)
+    assert not os.path.exists(os.path.join(folder, "cuts.jsonl"))
+    # the timeline is written with its last track, here closed by the disconnect
+    bob.disconnect(namespace="/chat")
+    with open(os.path.join(folder, "cuts.jsonl")) as r:
+        cuts = [json.loads(line) for line in r]
+    assert [(cut["supervisions"][0]["text"], cut["duration"]) for cut in cuts] == [("Hello.", 1.0)]
+
+
+def test_metrics_access(app, join):
+    client = app.test_client()
+    assert client.get("/relay/metrics").status_code == 200
+    assert client.get("/relay/metrics", headers={"X-Forwarded-For": "192.0.2.1"}).status_code == 403
+    assert client.get("/relay/metrics", environ_base={"REMOTE_ADDR": "192.0.2.1"}).status_code == 403
+    app.config["RELAY_METRICS_TOKEN"] = "token"
+    assert client.get("/relay/metrics").status_code == 403
+    response = client.get("/relay/metrics", headers={"Authorization": "Bearer token", "X-Forwarded-For": "192.0.2.1"})
+    assert response.status_code == 200
+    assert response.get_json()["streams"] == []
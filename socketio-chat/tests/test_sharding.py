@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from socketio import KombuManager
+
+from app import socketio
+from app.sharding import check_shards, handoff_token, load_handoff, room_shard, shard_channel
+
+URLS = ["http://shard0", "http://shard1"]
+ROOMS = ["room%d" % i for i in range(100)]
+
+
+def test_room_shard():
+    shards = [room_shard(room, 2) for room in ROOMS]
+    assert set(shards) == {0, 1}
+    assert [room_shard(room, 1) for room in ROOMS] == [0] * len(ROOMS)
+    # every process maps a room to the same shard, unlike hash()
+    code = "from app.sharding import room_shard; print([room_shard('room%d' % i, 2) for i in range(100)])"
+    env = dict(os.environ, PYTHONHASHSEED="1")
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == str(shards)
+
+
+def test_check_shards():
+    check_shards(0, [])
+    check_shards(1, URLS)
+    for shard, urls in [(1, []), (2, URLS), (-1, URLS)]:
+        with pytest.raises(ValueError):
+            check_shards(shard, urls)
+
+
+def test_handoff_token():
+    token = handoff_token("secret", "alice", "room1")
+    assert load_handoff("secret", token) == {"name": "alice", "room": "room1"}
+    assert load_handoff("other secret", token) is None
+    assert load_handoff("secret", token + "x") is None
+    assert load_handoff("secret", token, max_age=-1) is None
+
+
+def chat(app, name, room):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["name"] = name
+        session["room"] = room
+    return client, client.get("/chat")
+
+
+def test_own_shard(make_app):
+    app = make_app(shard=0, shard_urls=URLS)
+    room = next(room for room in ROOMS if room_shard(room, 2) == 0)
+    _, response = chat(app, "alice", room)
+    assert response.status_code == 200
+    assert room in response.get_data(as_text=True)
+
+
+def test_handoff(make_app):
+    room = next(room for room in ROOMS if room_shard(room, 2) == 1)
+    _, response = chat(make_app(shard=0, shard_urls=URLS), "alice", room)
+    assert response.status_code == 302
+    url = urlsplit(response.location)
+    assert (url.scheme, url.netloc, url.path) == ("http", "shard1", "/chat")
+    token = parse_qs(url.query)["handoff"][0]
+    # the other shard does not get the session cookie of the first one
+    client = make_app(shard=1, shard_urls=URLS).test_client()
+    response = client.get("/chat?handoff=" + token)
+    assert response.status_code == 302 and response.location.endswith("/chat")
+    response = client.get("/chat")
+    assert response.status_code == 200
+    assert room in response.get_data(as_text=True)
+
+
+def test_forged_handoff(make_app):
+    client = make_app(shard=1, shard_urls=URLS).test_client()
+    token = handoff_token("another key", "mallory", "room1")
+    assert client.get("/chat?handoff=" + token).location.endswith("/chat")
+    assert client.get("/chat").location.endswith("/")
+
+
+def test_shard_channel(make_app, monkeypatch):
+    """Other processes emit to the rooms of a shard on its channel of the (here in-process) message queue."""
+    make_app(message_queue="memory://", shard=1, shard_urls=URLS)
+    manager = socketio.server.manager
+    received = []
+    monkeypatch.setattr(manager, "_handle_emit", received.append)
+    # the listener starts with the first client otherwise
+    socketio.server.manager_initialized = True
+    manager.initialize()
+    emitters = [KombuManager("memory://", channel=shard_channel(shard), write_only=True) for shard in [0, 1]]
+
+    def emit(shard, msg):
+        emitters[shard].emit("status", {"msg": msg}, namespace="/chat", room="room1")
+
+    # messages published before the listener subscribed are not queued for it
+    deadline = time.monotonic() + 5
+    while not received:
+        assert time.monotonic() < deadline
+        emit(1, "ping")
+        time.sleep(0.05)
+    emit(0, "to shard 0")
+    emit(1, "to shard 1")
+    while received[-1]["data"] != [{"msg": "to shard 1"}]:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert {message["data"][0]["msg"] for message in received} == {"ping", "to shard 1"}
@@ -0,0 +1,88 @@
+import json
+import os
+import wave
+
+import pytest
+
+from app.relay import Track
+from app.timeline import Timeline
+
+RATE = 16000
+
+
+def frame(seconds):
+    return b"\x00\x00" * int(RATE * seconds)
+
+
+@pytest.fixture
+def timeline(tmp_path):
+    """A session of an agent and a caller, the caller joining after 0.5 s."""
+    timeline = Timeline(str(tmp_path), "session")
+    agent = Track(str(tmp_path / "agent.wav"), "pcm_s16le", RATE, 1)
+    timeline.add_track("agent", agent, "alice", "agent")
+    agent.write(frame(0.5))
+    caller = Track(str(tmp_path / "caller.wav"), "pcm_s16le", RATE, 1)
+    timeline.add_track("caller", caller, "bob", "caller")
+    yield timeline
+    agent.close()
+    caller.close()
+
+
+def tracks(timeline):
+    return [timeline.tracks[track_id]["track"] for track_id in ["agent", "caller"]]
+
+
+def test_stamps(timeline):
+    agent, caller = tracks(timeline)
+    assert timeline.tracks["caller"]["offset"] == 0.5
+    assert timeline.stamp("agent", "start", 0, "Hello.") == 0.5
+    agent.write(frame(1))
+    assert timeline.stamp("agent", "end", 0) == 1.5
+    assert [(e["event"], e["sample"]) for e in timeline.events] == [("start", 8000), ("end", 24000)]
+
+
+def test_turns(timeline):
+    agent, caller = tracks(timeline)
+    timeline.stamp("caller", "end", 9)
+    timeline.stamp("agent", "start", 0, "Hello.")
+    timeline.stamp("caller", "start", 1, "Hi.")
+    agent.write(frame(1))
+    caller.write(frame(0.25))
+    timeline.stamp("agent", "end", 0)
+    timeline.stamp("agent", "start", 2, "Empty.")
+    timeline.stamp("agent", "end", 2)
+    caller.write(frame(0.25))
+    turns = [(start["track"], start["turn_id"], start["sample"], end["sample"]) for start, end in timeline.turns()]
+    # an end without a start is ignored, an open turn ends with its track
+    assert turns == [("agent", 0, 8000, 24000), ("agent", 2, 24000, 24000), ("caller", 1, 0, 8000)]
+    cuts = timeline.to_cuts()
+    # empty turns are not cut
+    assert [cut["id"] for cut in cuts] == ["session-agent-0", "session-caller-1"]
+    agent_cut, caller_cut = cuts
+    assert (agent_cut["start"], agent_cut["duration"]) == (0.5, 1.0)
+    assert agent_cut["recording"]["sources"][0]["source"] == agent.path
+    assert agent_cut["recording"]["num_samples"] == 24000
+    supervision = agent_cut["supervisions"][0]
+    assert (supervision["text"], supervision["speaker"], supervision["custom"]["role"]) == ("Hello.", "alice", "agent")
+    assert (caller_cut["start"], caller_cut["duration"]) == (0.0, 0.5)
+    assert caller_cut["supervisions"][0]["custom"]["session_offset"] == 0.5
+
+
+def test_finalize(timeline, tmp_path):
+    agent, caller = tracks(timeline)
+    timeline.stamp("agent", "start", 0, "Hello.")
+    agent.write(frame(1))
+    assert not timeline.close_track("agent")
+    agent.close()
+    assert timeline.close_track("caller")
+    caller.close()
+    timeline.finalize()
+    with open(tmp_path / "timeline.json") as r:
+        written = json.load(r)
+    assert written["tracks"]["agent"]["samples"] == 24000
+    assert [e["turn_id"] for e in written["events"]] == [0]
+    with open(tmp_path / "cuts.jsonl") as r:
+        cuts = [json.loads(line) for line in r]
+    assert [cut["duration"] for cut in cuts] == [1.0]
+    with wave.open(os.path.join(tmp_path, "agent.wav")) as w:
+        assert w.getnframes() == 24000
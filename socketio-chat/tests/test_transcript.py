@@ -0,0 +1,113 @@
+import logging
+import sqlite3
+
+import pytest
+from flask import Flask
+
+from app.transcript import SCHEMA, Transcript
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.fixture
+def open_transcript(tmp_path):
+    """Open transcripts of the database in ``tmp_path``; all are closed after the test."""
+    transcripts = []
+
+    def open_transcript(**config):
+        app = Flask(__name__)
+        app.config.update(TRANSCRIPT_DATABASE=str(tmp_path / "transcript.sqlite"), **config)
+        transcripts.append(Transcript(app))
+        return transcripts[-1]
+
+    yield open_transcript
+    for transcript in transcripts:
+        transcript.close()
+
+
+def stored(tmp_path):
+    """Sequence numbers on disk, read by another connection."""
+    db = sqlite3.connect(tmp_path / "transcript.sqlite")
+    try:
+        return [row[0] for row in db.execute("SELECT seq FROM message ORDER BY room, seq")]
+    finally:
+        db.close()
+
+
+def test_flush_on_batch_size(open_transcript, tmp_path):
+    transcript = open_transcript(TRANSCRIPT_BATCH_SIZE=3)
+    transcript.append("room1", "message", "alice", "one")
+    transcript.append("room1", "message", "alice", "two")
+    assert stored(tmp_path) == []
+    transcript.append("room1", "message", "alice", "three")
+    assert stored(tmp_path) == [1, 2, 3]
+    assert transcript.pending == []
+
+
+def test_flush_on_interval(open_transcript, tmp_path):
+    transcript = open_transcript(TRANSCRIPT_FLUSH_INTERVAL=0.5)
+    transcript.append("room1", "message", "alice", "one")
+    sleeps = []
+
+    def sleep(seconds):
+        if sleeps:
+            raise Stop()
+        sleeps.append(seconds)
+
+    with pytest.raises(Stop):
+        transcript.run(sleep)
+    assert sleeps == [0.5]
+    assert stored(tmp_path) == [1]
+
+
+def test_failed_flush_is_retried(open_transcript, tmp_path, caplog):
+    transcript = open_transcript()
+    transcript.append("room1", "message", "alice", "one")
+    transcript.db.execute("DROP TABLE message")
+    sleeps = []
+
+    def sleep(seconds):
+        if len(sleeps) == 2:
+            raise Stop()
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            transcript.db.executescript(SCHEMA)
+
+    with caplog.at_level(logging.ERROR), pytest.raises(Stop):
+        transcript.run(sleep)
+    assert "Flushing the transcript failed" in caplog.text
+    assert stored(tmp_path) == [1]
+
+
+def test_replay_after_restart(open_transcript):
+    transcript = open_transcript(TRANSCRIPT_TAIL_SIZE=2)
+    for i in range(5):
+        transcript.append("room1", "message", "alice", str(i))
+    transcript.append("room2", "message", "bob", "hi")
+    assert [m["seq"] for m in transcript.replay("room1", since=1)] == [2, 3, 4, 5]
+    transcript.close()
+    restarted = open_transcript()
+    # numbering continues from the database
+    assert restarted.append("room1", "message", "alice", "again")["seq"] == 6
+    assert [m["msg"] for m in restarted.replay("room1", since=2)] == ["2", "3", "4", "again"]
+    assert [m["seq"] for m in restarted.replay("room1", since=2, limit=2)] == [5, 6]
+    assert [m["msg"] for m in restarted.replay("room2")] == ["hi"]
+
+
+def test_crash_loses_the_queued_messages(open_transcript, caplog):
+    transcript = open_transcript()
+    transcript.append("room1", "message", "alice", "flushed")
+    transcript.flush()
+    transcript.append("room1", "message", "alice", "queued")
+    # a process which never flushed again, e.g. killed
+    restarted = open_transcript()
+    assert [m["msg"] for m in restarted.replay("room1")] == ["flushed"]
+    assert restarted.append("room1", "message", "bob", "after")["seq"] == 2
+    restarted.flush()
+    # should the old process still flush, the messages numbered twice are skipped
+    with caplog.at_level(logging.WARNING):
+        assert transcript.flush() == 1
+    assert "Skipped 1 transcript messages" in caplog.text
+    assert [m["msg"] for m in restarted.replay("room1")] == ["flushed", "after"]
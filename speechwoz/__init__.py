@@ -12,30 +12,154 @@ def create_app(test_config=None):
         SECRET_KEY="dev",
         # store the database in the instance folder
         DATABASE=os.path.join(app.instance_path, "speechwoz.sqlite"),
+        # session data in the database, only its id in the cookie, see speechwoz/sessions.py; None for signed cookies
+        SESSION_STORE="sqlite",
+        SESSION_CACHE_SIZE=10000,
+        SESSION_GC_INTERVAL=300,
+        # pseudonymous annotator ids, see speechwoz/annotators.py; None means SECRET_KEY
+        ANNOTATOR_ID_KEY=None,
+        ANNOTATOR_CACHE_SIZE=4096,
+        # besides agents, requests with "Authorization: Bearer <REVIEW_TOKEN>" may review recordings
+        REVIEW_TOKEN=None,
+        # compiled MultiWOZ dialogues, see speechwoz/multiwoz.py
+        MULTIWOZ_DATABASE=os.path.join(app.instance_path, "multiwoz.sqlite"),
+        # dialogues handed to a new session, see speechwoz/scheduler.py
+        ASSIGNMENT_MAX_DIALOGUES=2,
+        ASSIGNMENT_TURN_BUDGET=7,
+        ASSIGNMENT_LEASE_SECONDS=3600,
+        # live microphone check during onboarding, see speechwoz/miccheck.py
+        MIC_CHECK_REQUIRED=True,
+        MIC_CHECK_MIN_SECONDS=3,
+        MIC_CHECK_MIN_SPEECH_DBFS=-35,
+        MIC_CHECK_MIN_SNR=20,
+        MIC_CHECK_MAX_CLIPPING=0.001,
+        MIC_CHECK_MAX_BLOCK_SIZE=256 * 1024,
+        # checks older than this are deleted by speechwoz/reconcile.py and no longer pass a take
+        MIC_CHECK_TTL=24 * 3600,
+        # idle connections kept per worker process, see speechwoz/db.py
+        DB_POOL_SIZE=8,
+        DB_CACHED_STATEMENTS=256,
+        DB_PRAGMAS={
+            # readers do not block the writer and vice versa across gunicorn workers
+            "journal_mode": "WAL",
+            # with WAL still safe against corruption, only the last commits may be lost on power failure
+            "synchronous": "NORMAL",
+            # wait for the write lock of another worker instead of failing with "database is locked"
+            "busy_timeout": 5000,
+            # negative means KiB
+            "cache_size": -16000,
+            "temp_store": "MEMORY",
+        },
         # Number to be called to connect
         # So far enabled for Czech republic and I think also by default for US
         # https://console.twilio.com/us1/develop/phone-numbers/manage/incoming
         TWILIO_NUMBER="+420910902780",
         PROLIFIC_CODE="TODO_paste_code_to_be_displayed_to_workers",
+        # recordings are served as static files
+        RECORDINGS_FOLDER=os.path.join(app.static_folder, "recordings"),
+        # see speechwoz/media.py, e.g. "/_recordings/" to let nginx send the files
+        MEDIA_ACCEL_REDIRECT=None,
+        MEDIA_MAX_AGE=365 * 24 * 3600,
+        # per-turn playback, see speechwoz/slices.py
+        SLICE_OPEN_MAPS=64,
+        SLICE_MAX_SECONDS=600,
+        # chunks of unfinished uploads, see speechwoz/upload.py
+        UPLOAD_FOLDER=os.path.join(app.instance_path, "uploads"),
+        UPLOAD_BUFFER_SIZE=64 * 1024,
+        UPLOAD_MAX_CHUNK_SIZE=8 * 1024 * 1024,
+        UPLOAD_MAX_CHUNKS=10000,
+        # a finalize claimed longer ago died assembling the take and is taken over
+        UPLOAD_FINALIZE_TIMEOUT=600,
+        UPLOAD_EXPIRE_AFTER=7 * 24 * 3600,
+        # replies to retried uploads, see speechwoz/idempotency.py
+        IDEMPOTENCY_KEY_TTL=24 * 3600,
+        # remove what killed workers left behind, see speechwoz/reconcile.py
+        RECONCILE_ON_STARTUP=True,
+        # background conversion of uploads to WAV, see speechwoz/transcode.py
+        TRANSCODE_ENCODER="ffmpeg",  # or "stub" which needs no external tools
+        TRANSCODE_SAMPLE_RATE=16000,  # or 48000
+        TRANSCODE_WORKERS=os.cpu_count(),
+        TRANSCODE_POLL_INTERVAL=1.0,
+        TRANSCODE_MAX_ATTEMPTS=3,
+        TRANSCODE_STALE_AFTER=3600,
+        # pages rendered once per role and locale, see speechwoz/pages.py
+        PAGE_CACHE=True,
+        LANGUAGES=["en"],
+        STATIC_MAX_AGE=365 * 24 * 3600,
+        # native threads for blocking file and DB calls in gevent workers, see speechwoz/serve.py
+        ASYNC_THREADPOOL_SIZE=16,
+        # request, upload and DB timing on /metrics, see speechwoz/metrics.py
+        METRICS_ENABLED=False,
+        # bearer token of the scraper; None answers only unproxied requests from loopback
+        METRICS_TOKEN=None,
+        # sample the stacks of requests running longer than METRICS_PROFILE_AFTER seconds; None disables
+        METRICS_PROFILE_INTERVAL=None,
+        METRICS_PROFILE_AFTER=0.1,
     )
     assert "TWILIO_NUMBER" in app.config
 
     if test_config is None:
         # load the instance config, if it exists, when not testing
         app.config.from_pyfile("config.py", silent=True)
+        # and overrides from the environment, e.g. FLASK_DATABASE=/tmp/speechwoz.sqlite
+        app.config.from_prefixed_env()
     else:
         # load the test config if passed in
         app.config.update(test_config)
 
     os.makedirs(app.instance_path, exist_ok=True)
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
     @app.route("/hello")
     def hello():
         return "Hello, World!"
 
+    # first, so the request timing covers all other hooks
+    from speechwoz import metrics
+
+    metrics.init_app(app)
+
     # register the database commands
     from speechwoz import db
 
     db.init_app(app)
 
+    from speechwoz import sessions
+
+    sessions.init_app(app)
+
+    from speechwoz import pages
+
+    pages.init_app(app)
+
+    from speechwoz import transcode
+
+    transcode.init_app(app)
+
+    from speechwoz import export
+
+    export.init_app(app)
+
+    from speechwoz import ingest
+
+    ingest.init_app(app)
+
+    from speechwoz import multiwoz
+
+    multiwoz.init_app(app)
+
+    from speechwoz import media, miccheck, quality, review, scheduler, slices, upload
+
+    app.register_blueprint(media.bp)
+    app.register_blueprint(miccheck.bp)
+    app.register_blueprint(quality.bp)
+    app.register_blueprint(review.bp)
+    app.register_blueprint(scheduler.bp)
+    app.register_blueprint(slices.bp)
+    app.register_blueprint(upload.bp)
+
+    from speechwoz import reconcile
+
+    reconcile.init_app(app)
+
     return app
@@ -0,0 +1,90 @@
+"""Pseudonymous annotator identities.
+
+The annotator id is an HMAC-SHA256 of the PROLIFIC_PID keyed with ``ANNOTATOR_ID_KEY``
+(``SECRET_KEY`` unless set). Unlike a salted password hash it is deterministic, so a
+participant keeps the same id in every session and recordings aggregate per annotator,
+and it takes microseconds instead of a deliberately slow key derivation. The PID cannot
+be recovered without the key; changing the key changes all ids.
+
+Annotators are stored in the ``annotator`` table and read through an in-process LRU cache,
+so resolving the annotator of a request does not query the DB each time.
+
+Recordings are reviewed by agents, or by scripts sending ``REVIEW_TOKEN`` as a bearer token;
+views showing or judging recordings of other annotators are wrapped in ``reviewer_required``.
+"""
+import collections
+import functools
+import hashlib
+import hmac
+import threading
+
+from flask import current_app, jsonify, request, session
+
+from speechwoz.db import add_annotator, get_annotator
+
+AGENT_PROLIFIC_IDS = ["oplatek", "odusek"]
+
+ROLE_AGENT = "ROLE_AGENT"
+ROLE_CALLER = "ROLE_CALLER"
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def pseudonymize(prolific_pid):
+    key = current_app.config["ANNOTATOR_ID_KEY"] or current_app.config["SECRET_KEY"]
+    # e.g. os.urandom(32) as recommended for SECRET_KEY
+    if not isinstance(key, bytes):
+        key = key.encode()
+    return hmac.new(key, prolific_pid.encode(), hashlib.sha256).hexdigest()
+
+
+def role(prolific_pid):
+    return ROLE_AGENT if prolific_pid in AGENT_PROLIFIC_IDS else ROLE_CALLER
+
+
+def register(prolific_pid):
+    """Store the annotator of a Prolific participant unless known; returns the annotator id."""
+    ann_id = pseudonymize(prolific_pid)
+    add_annotator(ann_id, role(prolific_pid))
+    return ann_id
+
+
+def lookup(ann_id):
+    """The annotator as a dict, or None if unknown; unknown ids are not cached."""
+    key = (current_app.config["DATABASE"], ann_id)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    row = get_annotator(ann_id)
+    if row is None:
+        return None
+    annotator = dict(row)
+    with _cache_lock:
+        _cache[key] = annotator
+        while len(_cache) > current_app.config["ANNOTATOR_CACHE_SIZE"]:
+            _cache.popitem(last=False)
+    return annotator
+
+
+def is_reviewer():
+    """Whether the current request comes from an agent or carries the ``REVIEW_TOKEN``."""
+    token = current_app.config["REVIEW_TOKEN"]
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    ann_id = session.get("ann_id")
+    annotator = lookup(ann_id) if ann_id is not None else None
+    return annotator is not None and annotator["role"] == ROLE_AGENT
+
+
+def reviewer_required(view):
+    """Answer 403 unless ``is_reviewer()``."""
+
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        if not is_reviewer():
+            return jsonify(status="forbidden"), 403
+        return view(*args, **kwargs)
+
+    return wrapped
@@ -1,26 +1,21 @@
-import os
-from pathlib import Path
 import logging
-import uuid
-from flask import session, url_for, render_template, request, flash, g, jsonify
-from werkzeug.security import generate_password_hash
-from speechwoz.db import get_db
-from speechwoz import create_app
+from flask import session, request, flash, g, jsonify
+from speechwoz.annotators import ROLE_CALLER
+from speechwoz.db import add_recording, start_session
+from speechwoz import annotators, create_app, miccheck, storage, transcode
+from speechwoz.concurrency import run_blocking
+from speechwoz.idempotency import idempotent
+from speechwoz.pages import render_page
 
 app = create_app()
-AGENT_PROLIFIC_IDS = ["oplatek", "odusek"]
-
-ROLE_AGENT = "ROLE_AGENT"
-ROLE_CALLER = "ROLE_CALLER"
 
 
 def get_annotator_info(session):
-    # consider benefits storing infor to DB
-    # info = get_db().execute("SELECT * FROM annotator WHERE id = ?", (ann_id,)).fetchone()
     ann_id = session.get("ann_id")
+    annotator = annotators.lookup(ann_id) if ann_id is not None else None
     return {
         "id": ann_id,
-        "role": ROLE_AGENT if ann_id in AGENT_PROLIFIC_IDS else ROLE_CALLER,
+        "role": annotator["role"] if annotator is not None else ROLE_CALLER,
         "accepted_terms": session.get("accepted_terms", False),
     }
 
@@ -50,25 +45,36 @@ def index():
     ann_id = session.get("ann_id")
     if ann_id is None:
         if prolific_pid is not None:
-            ann_id = prolific_pid
-            ann_id = generate_password_hash(ann_id)
+            ann_id = run_blocking(annotators.register, prolific_pid)
             session["ann_id"] = ann_id
         else:
             msg = "Your PROLIFIC_PID argument is not set"
             flash(msg)
             logging.warning(msg)
 
-    session["prolific_sessionid"] = prolific_sessionid
-    session["prolific_studyid"] = prolific_studyid
-    return render_template("index.html")
+    new_session = "session_id" not in session or session.get("prolific_sessionid") != prolific_sessionid
+    if ann_id is not None and new_session:
+        session["session_id"] = run_blocking(start_session, ann_id, prolific_sessionid, prolific_studyid)
+    # assigned only when changed, so a repeated visit does not write the session
+    if session.get("prolific_sessionid") != prolific_sessionid:
+        session["prolific_sessionid"] = prolific_sessionid
+    if session.get("prolific_studyid") != prolific_studyid:
+        session["prolific_studyid"] = prolific_studyid
+    return render_page("index.html")
 
 
 @app.route("/annotate")
 def annotate():
-    return render_template("annotate.html")
+    return render_page("annotate.html")
+
+
+@app.route("/survey")
+def survey():
+    return render_page("survey.html")
 
 
 @app.route("/upload_recording/<source>", methods=["POST"])
+@idempotent
 def upload_recording(source):
     # check if the post request has the file part
     assert source in ["onboarding"]  # TODO add others
@@ -80,13 +86,28 @@ def upload_recording(source):
     if file.filename == "":
         flash("No selected file")
         return jsonify(status="no-filename")
-    file_name = session["ann_id"] + str(uuid.uuid4()) + ".mp3"
-    appdir = Path(os.path.dirname(os.path.realpath(__file__)))
-    local_suffix = f"recordings/{source}/{file_name}"
-    localpath = appdir / 'static' / local_suffix
-    audio_url = url_for("static", filename=local_suffix)
-    logging.info(f"Saving to {localpath}\n\t accessible at {audio_url}")
-    file.save(localpath)
-    # TODO add to DB
-    # TODO save as wav
+    if source == "onboarding" and app.config["MIC_CHECK_REQUIRED"]:
+        # see speechwoz/miccheck.py
+        verdict = run_blocking(miccheck.verdict, request.form.get("mic_check"), session.get("ann_id"))
+        if verdict != "ok":
+            return jsonify(status="mic-check-failed", mic_check=verdict)
+    ann_id = session["ann_id"]
+    blob = storage.store_stream(file.stream, ".mp3")
+    duplicate = run_blocking(storage.find_recording, ann_id, source, blob["sha256"])
+    if duplicate is not None:
+        # a retry of an upload which got through
+        return jsonify(status="ok", path=duplicate["url"])
+    audio_url = storage.blob_url(blob)
+    logging.info(f"Saved to {blob['path']}\n\t accessible at {audio_url}")
+    recording_id = run_blocking(
+        add_recording,
+        ann_id,
+        source,
+        blob["path"],
+        audio_url,
+        session.get("session_id"),
+        blob=blob["sha256"],
+        commit=False,
+    )
+    run_blocking(transcode.enqueue, blob["path"], recording_id)
     return jsonify(status="ok", path=audio_url)
@@ -0,0 +1,84 @@
+"""Conversion of uploaded recordings to canonical mono 16-bit PCM WAV and basic statistics."""
+import subprocess
+import wave
+
+import numpy as np
+
+# Supported sampling rates of the canonical WAV files
+SAMPLE_RATES = [16000, 48000]
+# |sample| at or above this value counts as clipped
+CLIPPING_LEVEL = 32767 - 1
+
+
+def ffmpeg_encode(src, dst, sample_rate):
+    """Decode anything ffmpeg understands (webm/opus, ogg, mp3, ...) into a mono WAV."""
+    cmd = ["ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-i", src]
+    cmd += ["-ac", "1", "-ar", str(sample_rate), "-c:a", "pcm_s16le", "-f", "wav", dst]
+    subprocess.run(cmd, check=True, capture_output=True)
+
+
+def stub_encode(src, dst, sample_rate):
+    """Encoder without external dependencies for local runs and tests.
+
+    WAV input is downmixed and resampled, anything else is taken as raw 16-bit PCM
+    already sampled at ``sample_rate``."""
+    with open(src, "rb") as r:
+        raw = r.read()
+    if raw[:4] == b"RIFF":
+        samples, src_rate = read_wav(src)
+        samples = resample(samples, src_rate, sample_rate)
+    else:
+        samples = np.frombuffer(raw[: len(raw) // 2 * 2], dtype="<i2")
+    write_wav(dst, samples, sample_rate)
+
+
+ENCODERS = {
+    "ffmpeg": ffmpeg_encode,
+    "stub": stub_encode,
+}
+
+
+def read_wav(path):
+    """Return mono int16 samples and the sampling rate of a 16-bit PCM WAV file."""
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        channels = w.getnchannels()
+        samples = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+        rate = w.getframerate()
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def write_wav(path, samples, sample_rate):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(samples.astype("<i2").tobytes())
+
+
+def resample(samples, src_rate, dst_rate):
+    """Linear interpolation resampling; good enough for the stub encoder."""
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    n = int(round(len(samples) * dst_rate / src_rate))
+    positions = np.arange(n) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+
+
+def stats(samples, sample_rate):
+    """Duration in seconds, RMS and peak in dBFS and the ratio of clipped samples."""
+    if len(samples) == 0:
+        return {"duration": 0.0, "rms": None, "peak": None, "clipping_ratio": 0.0}
+    x = samples.astype(np.float64) / 32768.0
+    rms = np.sqrt(np.mean(x * x))
+    peak = np.max(np.abs(x))
+    clipped = np.count_nonzero(np.abs(samples.astype(np.int32)) >= CLIPPING_LEVEL)
+    return {
+        "duration": len(samples) / sample_rate,
+        "rms": float(20 * np.log10(rms)) if rms > 0 else None,
+        "peak": float(20 * np.log10(peak)) if peak > 0 else None,
+        "clipping_ratio": clipped / len(samples),
+    }
@@ -0,0 +1,27 @@
+"""Helpers for serving with cooperative (gevent) workers, see speechwoz/serve.py."""
+import contextvars
+import sys
+
+
+def cooperative():
+    """True if running in a gevent monkey-patched process."""
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+
+    return monkey.is_module_patched("socket")
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Call ``fn`` without blocking the other requests of this worker.
+
+    File and SQLite calls are not made cooperative by gevent's monkey patching, so in a
+    gevent worker they run in the hub's native thread pool while the calling greenlet
+    waits. The current Flask contexts are visible to ``fn``. Elsewhere ``fn`` is just called.
+    """
+    if not cooperative():
+        return fn(*args, **kwargs)
+    import gevent
+
+    ctx = contextvars.copy_context()
+    return gevent.get_hub().threadpool.apply(ctx.run, (fn,) + args, kwargs)
@@ -1,13 +1,98 @@
 """
 Copied from https://github.com/pallets/flask/blob/afc13b9390ae2e40f4731e815b49edc9ef52ed4b/examples/tutorial/flaskr/db.py
+
+Instead of connecting on every request, connections are kept in a small pool per worker
+process, so the pragmas below and the statement cache survive between requests.
 """
+import os
+import queue
 import sqlite3
+import time
 
 import click
 from flask import current_app
 from flask import g
 from flask.cli import with_appcontext
 
+# (pid, database path) -> idle connections; the pid makes the pool safe with forking servers
+_pools = {}
+
+# callables ``hook(statement, seconds)`` called by TimedConnection, see speechwoz/metrics.py
+query_hooks = []
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection reporting the duration of every statement to ``query_hooks``.
+
+    The duration of a SELECT is the time to its first row, the rest is read while fetching."""
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            seconds = time.perf_counter() - start
+            for hook in query_hooks:
+                hook(sql, seconds)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self._timed(super().executemany, sql, parameters)
+
+    def executescript(self, sql):
+        return self._timed(super().executescript, sql)
+
+
+def connect(path, pragmas, cached_statements=128, factory=sqlite3.Connection):
+    """Open a new connection and apply ``pragmas`` e.g. ``{"journal_mode": "WAL"}``."""
+    db = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        # pooled connections serve requests of any thread, but only one at a time
+        check_same_thread=False,
+        cached_statements=cached_statements,
+        factory=factory,
+    )
+    db.row_factory = sqlite3.Row
+    for name, value in pragmas.items():
+        db.execute(f"PRAGMA {name} = {value}")
+    return db
+
+
+def _pool(path):
+    key = (os.getpid(), path)
+    if key not in _pools:
+        _pools[key] = queue.LifoQueue()
+    return _pools[key]
+
+
+def acquire_db():
+    """Take an idle connection to the configured database from the pool or open a new one."""
+    config = current_app.config
+    try:
+        return _pool(config["DATABASE"]).get_nowait()
+    except queue.Empty:
+        factory = TimedConnection if config["METRICS_ENABLED"] else sqlite3.Connection
+        return connect(config["DATABASE"], config["DB_PRAGMAS"], config["DB_CACHED_STATEMENTS"], factory)
+
+
+def idle_connections():
+    """Number of pooled connections to the configured database in this process."""
+    return _pool(current_app.config["DATABASE"]).qsize()
+
+
+def release_db(db):
+    """Return the connection to the pool, or close it if the pool is full."""
+    if db.in_transaction:
+        db.rollback()
+    pool = _pool(current_app.config["DATABASE"])
+    if pool.qsize() < current_app.config["DB_POOL_SIZE"]:
+        pool.put(db)
+    else:
+        db.close()
+
 
 def get_db():
     """Connect to the application's configured database. The connection
@@ -15,22 +100,41 @@ def get_db():
     again.
     """
     if "db" not in g:
-        g.db = sqlite3.connect(
-            current_app.config["DATABASE"], detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = acquire_db()
 
     return g.db
 
 
 def close_db(e=None):
-    """If this request connected to the database, close the
-    connection.
+    """If this request connected to the database, give the
+    connection back to the pool.
     """
     db = g.pop("db", None)
 
     if db is not None:
-        db.close()
+        release_db(db)
+
+
+def write_batch(query, rows, batch_size=500):
+    """Execute ``query`` for every row of the iterable ``rows``, committing once per ``batch_size`` rows.
+
+    One transaction per batch instead of per row saves a journal sync for every row.
+    Returns the number of written rows."""
+    db = get_db()
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with db:
+                db.executemany(query, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        with db:
+            db.executemany(query, batch)
+        written += len(batch)
+    return written
 
 
 def init_db():
@@ -41,6 +145,80 @@ def init_db():
         db.executescript(f.read().decode("utf8"))
 
 
+# Data access helpers; every query below is served by a primary key or an index from schema.sql
+
+
+def add_annotator(annotator_id, role):
+    """Register the annotator unless already known."""
+    db = get_db()
+    db.execute("INSERT INTO annotator (id, role) VALUES (?, ?) ON CONFLICT (id) DO NOTHING", (annotator_id, role))
+    db.commit()
+
+
+def get_annotator(annotator_id):
+    return get_db().execute("SELECT * FROM annotator WHERE id = ?", (annotator_id,)).fetchone()
+
+
+def start_session(annotator_id, prolific_sessionid=None, prolific_studyid=None):
+    """Return the id of the annotation session, creating it on the first visit."""
+    db = get_db()
+    db.execute(
+        "INSERT INTO annotation_session (annotator_id, prolific_sessionid, prolific_studyid) VALUES (?, ?, ?)"
+        " ON CONFLICT (annotator_id, prolific_sessionid) DO NOTHING",
+        (annotator_id, prolific_sessionid, prolific_studyid),
+    )
+    db.commit()
+    row = db.execute(
+        "SELECT id FROM annotation_session WHERE annotator_id = ? AND prolific_sessionid IS ?"
+        " ORDER BY id DESC LIMIT 1",
+        (annotator_id, prolific_sessionid),
+    ).fetchone()
+    return row["id"]
+
+
+def add_recording(
+    annotator_id, source, path, url, session_id=None, dialogue_id=None, turn_id=None, blob=None, commit=True
+):
+    """Store a recording saved at ``path`` and served at ``url``; returns its id.
+
+    If the annotator already has a recording of the same ``blob`` and source, its id is returned instead."""
+    db = get_db()
+    cur = db.execute(
+        "INSERT INTO recording (annotator_id, session_id, dialogue_id, turn_id, source, path, url, blob)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+        (annotator_id, session_id, dialogue_id, turn_id, source, path, url, blob),
+    )
+    if cur.rowcount == 0:
+        query = "SELECT id FROM recording WHERE blob = ? AND annotator_id = ? AND source = ?"
+        return db.execute(query, (blob, annotator_id, source)).fetchone()["id"]
+    if dialogue_id is not None:
+        db.execute("UPDATE dialogue SET recording_count = recording_count + 1 WHERE id = ?", (dialogue_id,))
+    if commit:
+        db.commit()
+    return cur.lastrowid
+
+
+def get_recording(recording_id):
+    return get_db().execute("SELECT * FROM recording WHERE id = ?", (recording_id,)).fetchone()
+
+
+def recordings_by_annotator(annotator_id, limit=100):
+    """Newest recordings of an annotator first."""
+    query = "SELECT * FROM recording WHERE annotator_id = ? ORDER BY created DESC LIMIT ?"
+    return get_db().execute(query, (annotator_id, limit)).fetchall()
+
+
+def recordings_by_dialogue(dialogue_id):
+    query = "SELECT * FROM recording WHERE dialogue_id = ? ORDER BY turn_id"
+    return get_db().execute(query, (dialogue_id,)).fetchall()
+
+
+def recordings_since(created, limit=1000):
+    """Recordings created at or after ``created`` (a datetime), oldest first."""
+    query = "SELECT * FROM recording WHERE created >= ? ORDER BY created LIMIT ?"
+    return get_db().execute(query, (created, limit)).fetchall()
+
+
 @click.command("init-db")
 @with_appcontext
 def init_db_command():
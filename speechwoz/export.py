@@ -0,0 +1,157 @@
+"""Export of transcoded recordings as Lhotse manifests.
+
+``flask --app speechwoz export-cuts -o exports/`` streams recordings out of the DB and writes
+gzipped JSONL shards of recordings, supervisions and cuts in the format Lhotse reads, e.g.
+``CutSet.from_files(sorted(glob("exports/speechwoz_cuts.*.jsonl.gz")))``.
+Recordings are read one shard at a time, so memory does not grow with the number of takes.
+
+Every recording remembers the ``export_run`` it was exported in; by default only recordings
+not exported yet are written (``--full`` exports everything again).
+"""
+import functools
+import gzip
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from speechwoz.db import get_db
+from speechwoz.multiwoz import load_turn
+
+MANIFESTS = ["recordings", "supervisions", "cuts"]
+
+
+def write_shard(path, lines):
+    """Write JSON ``lines`` into a gzipped JSONL file, atomically so a crash leaves no partial shard."""
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt") as w:
+        for obj in lines:
+            w.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def iter_pages(db, page_size, full=False):
+    """Transcoded recordings in id order, ``page_size`` rows at a time.
+
+    Unless ``full``, only those not exported yet, found through the partial index on ``export_run``."""
+    query = (
+        "SELECT recording.*, transcode_job.sample_rate FROM recording"
+        # the newest of the done jobs of a recording, on the transcode_job_recording index
+        " JOIN transcode_job ON transcode_job.id = (SELECT id FROM transcode_job"
+        " WHERE recording_id = recording.id AND status = 'done' ORDER BY id DESC LIMIT 1)"
+        " WHERE recording.id > ? AND recording.wav_path IS NOT NULL"
+    )
+    if not full:
+        query += " AND recording.export_run IS NULL"
+    query += " ORDER BY recording.id LIMIT ?"
+    last_id = 0
+    while True:
+        rows = db.execute(query, (last_id, page_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+
+
+@functools.lru_cache(maxsize=1024)
+def _turn(dialogue_id, turn_id):
+    return load_turn(dialogue_id, turn_id)
+
+
+def to_manifests(rec):
+    """Lhotse Recording, SupervisionSegment and MonoCut dicts of a recording row."""
+    rid = f"speechwoz-{rec['id']:08d}"
+    sr = rec["sample_rate"]
+    num_samples = int(round(rec["duration"] * sr))
+    duration = num_samples / sr
+    recording = {
+        "id": rid,
+        "sources": [{"type": "file", "channels": [0], "source": rec["wav_path"]}],
+        "sampling_rate": sr,
+        "num_samples": num_samples,
+        "duration": duration,
+        "channel_ids": [0],
+    }
+    custom = {
+        "speechwoz": {
+            "source": rec["source"],
+            "annotator_id": rec["annotator_id"],
+            "session_id": rec["session_id"],
+        }
+    }
+    text = None
+    if rec["dialogue_id"] is not None and rec["turn_id"] is not None:
+        turn = _turn(rec["dialogue_id"], rec["turn_id"])
+        if turn is not None:
+            text = turn["utterance"]
+            custom["multiwoz"] = {
+                "speaker": turn["speaker"],
+                "conversation_id": rec["dialogue_id"],
+                "prompt": text,
+                "turn_id": rec["turn_id"],
+            }
+    supervision = {
+        "id": rid,
+        "recording_id": rid,
+        "start": 0.0,
+        "duration": duration,
+        "channel": 0,
+        "text": text,
+        "speaker": rec["annotator_id"],
+        "custom": custom,
+    }
+    cut = {
+        "id": rid,
+        "start": 0.0,
+        "duration": duration,
+        "channel": 0,
+        "supervisions": [supervision],
+        "recording": recording,
+        "type": "MonoCut",
+    }
+    return recording, supervision, cut
+
+
+def export_cuts(outdir, shard_size, full=False):
+    """Write one shard of each manifest per ``shard_size`` recordings; returns the run id and the number of cuts.
+
+    Recordings are marked with the run once their shard is complete, so an interrupted run
+    is simply continued by the next one."""
+    db = get_db()
+    with db:
+        run_id = db.execute("INSERT INTO export_run (outdir) VALUES (?)", (outdir,)).lastrowid
+    os.makedirs(outdir, exist_ok=True)
+    count = 0
+    for shard, rows in enumerate(iter_pages(db, shard_size, full)):
+        manifests = [to_manifests(rec) for rec in rows]
+        for i, name in enumerate(MANIFESTS):
+            path = os.path.join(outdir, f"speechwoz_{name}.{run_id:04d}.{shard:06d}.jsonl.gz")
+            write_shard(path, (m[i] for m in manifests))
+        with db:
+            db.executemany("UPDATE recording SET export_run = ? WHERE id = ?", [(run_id, rec["id"]) for rec in rows])
+        count += len(rows)
+    with db:
+        db.execute(
+            "UPDATE export_run SET num_cuts = ?, finished = CURRENT_TIMESTAMP WHERE id = ?",
+            (count, run_id),
+        )
+    return run_id, count
+
+
+@click.command("export-cuts")
+@click.option("-o", "--outdir", default=None, help="Defaults to exports/ in the instance folder.")
+@click.option("--shard-size", type=int, default=10000, show_default=True, help="Cuts per manifest file.")
+@click.option("--full", is_flag=True, help="Export all recordings, not only the new ones.")
+@with_appcontext
+def export_cuts_command(outdir, shard_size, full):
+    """Export transcoded recordings as sharded Lhotse manifests."""
+    outdir = outdir or os.path.join(current_app.instance_path, "exports")
+    run_id, count = export_cuts(outdir, shard_size, full)
+    click.echo(f"Exported {count} cuts to {outdir} (run {run_id}).")
+
+
+def init_app(app):
+    """Register the export command with the Flask app."""
+    app.cli.add_command(export_cuts_command)
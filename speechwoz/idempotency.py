@@ -0,0 +1,90 @@
+"""Idempotent upload requests.
+
+A client sends an ``Idempotency-Key`` header (e.g. a UUID per take) with the requests which
+create something: opening an upload, finalizing it and the single-request upload. The first
+request with a key is executed and its successful JSON response stored in the
+``idempotency_key`` table; a retry with the same key gets the stored response without
+running the view again, so a response lost on a flaky connection never creates a second
+upload or recording. A retry arriving while the first request still runs gets
+``{"status": "in-progress"}``; a failed request frees the key for the next attempt.
+
+Keys are scoped to the annotator and the endpoint, so the key of opening an upload does not
+answer its finalize. A key left pending by a killed worker is released by the
+startup reconciler (see ``speechwoz.reconcile``), stored responses are kept
+``IDEMPOTENCY_KEY_TTL`` seconds.
+"""
+import functools
+import os
+
+from flask import current_app, jsonify, request, session
+
+from speechwoz.concurrency import run_blocking
+from speechwoz.db import get_db
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 128
+
+
+def claim(ann_id, endpoint, key):
+    """None if the key is new and now pending, otherwise its row."""
+    db = get_db()
+    cur = db.execute(
+        "INSERT INTO idempotency_key (annotator_id, endpoint, key, owner) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING",
+        (ann_id, endpoint, key, os.getpid()),
+    )
+    db.commit()
+    if cur.rowcount == 1:
+        return None
+    query = "SELECT * FROM idempotency_key WHERE annotator_id = ? AND endpoint = ? AND key = ?"
+    return db.execute(query, (ann_id, endpoint, key)).fetchone()
+
+
+def complete(ann_id, endpoint, key, response):
+    db = get_db()
+    db.execute(
+        "UPDATE idempotency_key SET status = 'done', response = ? WHERE annotator_id = ? AND endpoint = ? AND key = ?",
+        (response, ann_id, endpoint, key),
+    )
+    db.commit()
+
+
+def release(ann_id, endpoint, key):
+    db = get_db()
+    db.execute(
+        "DELETE FROM idempotency_key WHERE annotator_id = ? AND endpoint = ? AND key = ? AND status = 'pending'",
+        (ann_id, endpoint, key),
+    )
+    db.commit()
+
+
+def idempotent(view):
+    """Replay the stored response of a view returning JSON to requests repeating an ``Idempotency-Key``."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        ann_id = session.get("ann_id")
+        if key is None or ann_id is None:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify(status="bad-idempotency-key")
+        endpoint = request.endpoint
+        row = run_blocking(claim, ann_id, endpoint, key)
+        if row is not None:
+            if row["status"] == "pending":
+                return jsonify(status="in-progress")
+            return current_app.response_class(row["response"], mimetype="application/json")
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            run_blocking(release, ann_id, endpoint, key)
+            raise
+        data = response.get_json(silent=True) if response.is_json else None
+        if response.status_code == 200 and data is not None and data.get("status") == "ok":
+            run_blocking(complete, ann_id, endpoint, key, response.get_data(as_text=True))
+        else:
+            # e.g. missing chunks, the retry will do better
+            run_blocking(release, ann_id, endpoint, key)
+        return response
+
+    return wrapper
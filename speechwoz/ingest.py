@@ -0,0 +1,270 @@
+"""Batch ingest of recordings which are already on disk.
+
+``flask --app speechwoz ingest DIR...`` registers two kinds of takes found under the
+directories:
+
+- takes of the Streamlit prototype: ``<pid>.wav`` next to the ``<pid>.jsonl.gz`` CutSet written
+  by ``record.py``; the annotator is derived from the PROLIFIC_PID and every cut becomes a
+  ``recording_segment`` of the take,
+- any other WAV or MP3, e.g. ``<annotator id><uuid4>.mp3`` saved into ``static/recordings/``
+  by the first version of the upload; a name ending with a uuid4 keeps the annotator id before
+  it, others get ``--annotator``.
+
+A pool of worker processes hashes every file, links (or copies) it into the content-addressed
+storage (see ``speechwoz.storage``) and, if it is already a canonical WAV, computes its
+statistics, quality metrics and waveform peaks; other files are queued for the transcode
+workers. Recording URLs are built for the mount point of the app, ``--script-name`` or the
+SCRIPT_NAME the server is started with. The main process writes the results in one transaction per ``--batch-size`` files.
+
+Every file is recorded in ``ingest_file`` together with its size and mtime in the same
+transaction as its recording, so a crashed or interrupted ingest is resumed by running the
+same command again: unchanged files which are done are skipped, failed ones are retried.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import wave
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from speechwoz import annotators, audio, quality, review, storage, transcode
+from speechwoz.db import add_recording, get_db
+
+EXTENSIONS = (".wav", ".mp3")
+
+# <annotator id><uuid4>.mp3 as saved by the first version of /upload_recording
+LEGACY_NAME = re.compile(r"^(?P<annotator>.+?)[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+SOURCE_PROTOTYPE = "prototype"
+
+# seconds between progress reports
+REPORT_INTERVAL = 5.0
+
+
+def scan(dirs, skip_dir):
+    """Yield ``(path, size, mtime_ns)`` of the takes under ``dirs``, except under ``skip_dir``."""
+    skip_dir = os.path.realpath(skip_dir)
+    for top in dirs:
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [d for d in dirnames if os.path.realpath(os.path.join(dirpath, d)) != skip_dir]
+            for name in sorted(filenames):
+                if name.lower().endswith(EXTENSIONS):
+                    path = os.path.abspath(os.path.join(dirpath, name))
+                    st = os.stat(path)
+                    yield path, st.st_size, st.st_mtime_ns
+
+
+def read_cuts(path):
+    """Turn segments of a prototype take from its CutSet, or None if there is no CutSet."""
+    cutset = os.path.splitext(path)[0] + ".jsonl.gz"
+    if not os.path.exists(cutset):
+        return None
+    segments = []
+    with gzip.open(cutset, "rt") as r:
+        for line in r:
+            cut = json.loads(line)
+            supervision = (cut.get("supervisions") or [{}])[0]
+            multiwoz = supervision.get("custom", {}).get("multiwoz", {})
+            segments.append(
+                {
+                    "cut_id": cut["id"],
+                    "start": cut["start"],
+                    "duration": cut["duration"],
+                    "dialogue_id": multiwoz.get("conversation_id"),
+                    "turn_id": multiwoz.get("turn_id"),
+                    "speaker": multiwoz.get("speaker"),
+                    "text": supervision.get("text"),
+                }
+            )
+    return segments
+
+
+def _link_or_copy(src, dst, root):
+    tmp = storage.tmp_path(root)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        # another file system
+        shutil.copyfile(src, tmp)
+    storage.publish(tmp, dst)
+
+
+def probe(path, root, sample_rate):
+    """Hash, store and analyze one file; runs in a worker process and does not touch the DB."""
+    h = hashlib.sha256()
+    with open(path, "rb") as r:
+        for block in iter(lambda: r.read(1024 * 1024), b""):
+            h.update(block)
+    sha256 = h.hexdigest()
+    ext = os.path.splitext(path)[1].lower()
+    relpath = storage.blob_relpath(sha256, ext)
+    dst = os.path.join(root, relpath)
+    if not os.path.exists(dst):
+        _link_or_copy(path, dst, root)
+    canonical = False
+    if ext == ".wav":
+        with wave.open(dst, "rb") as w:
+            canonical = w.getnchannels() == 1 and w.getsampwidth() == 2 and w.getframerate() == sample_rate
+    result = {"sha256": sha256, "path": dst, "relpath": relpath, "canonical": canonical, "segments": read_cuts(path)}
+    if canonical:
+        samples, rate = audio.read_wav(dst)
+        result.update(stats=audio.stats(samples, rate), metrics=quality.analyze(samples, rate))
+        result["peaks"] = review.peaks(samples)
+    return result
+
+
+def annotator_of(path, segments, default):
+    """Annotator id and role of a file."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if segments is not None:
+        return annotators.pseudonymize(stem), annotators.role(stem)
+    m = LEGACY_NAME.match(stem)
+    return (m.group("annotator") if m else default), annotators.ROLE_CALLER
+
+
+def register(db, found, result, source, default_annotator, sample_rate):
+    """Store the recording of one probed file; runs inside the batch transaction and returns its id."""
+    path, size, mtime_ns = found
+    segments = result["segments"]
+    ann_id, role = annotator_of(path, segments, default_annotator)
+    if segments is not None:
+        source = SOURCE_PROTOTYPE
+    db.execute("INSERT INTO annotator (id, role) VALUES (?, ?) ON CONFLICT (id) DO NOTHING", (ann_id, role))
+    db.execute(
+        "INSERT INTO blob (sha256, path, relpath, size) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING",
+        (result["sha256"], result["path"], result["relpath"], size),
+    )
+    existing = storage.find_recording(ann_id, source, result["sha256"])
+    if existing is not None:
+        # the same take under another path
+        return existing["id"]
+    url = storage.blob_url(result)
+    recording_id = add_recording(ann_id, source, result["path"], url, blob=result["sha256"], commit=False)
+    if result["canonical"]:
+        # nothing to convert; a finished job keeps the recording exportable like a transcoded one
+        db.execute(
+            "INSERT INTO transcode_job (recording_id, src_path, dst_path, sample_rate, status, started, finished,"
+            " duration, rms, peak, clipping_ratio) VALUES (:recording_id, :path, :path, :sample_rate, 'done',"
+            " CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, :duration, :rms, :peak, :clipping_ratio)",
+            dict(result["stats"], recording_id=recording_id, path=result["path"], sample_rate=sample_rate),
+        )
+        db.execute(
+            "UPDATE recording SET wav_path = ?, duration = ? WHERE id = ?",
+            (result["path"], result["stats"]["duration"], recording_id),
+        )
+        quality.store(db, recording_id, result["metrics"])
+        review.store_peaks(db, recording_id, result["peaks"])
+    else:
+        transcode.enqueue(result["path"], recording_id, commit=False)
+    db.executemany(
+        "INSERT INTO recording_segment (recording_id, cut_id, start, duration, dialogue_id, turn_id, speaker, text)"
+        " VALUES (:recording_id, :cut_id, :start, :duration, :dialogue_id, :turn_id, :speaker, :text)"
+        " ON CONFLICT DO NOTHING",
+        [dict(s, recording_id=recording_id) for s in segments or []],
+    )
+    return recording_id
+
+
+def write_results(db, batch, source, default_annotator, sample_rate):
+    """Register a batch of ``(found, result, error)`` in one transaction."""
+    with db:
+        for found, result, error in batch:
+            recording_id = None
+            if error is None:
+                recording_id = register(db, found, result, source, default_annotator, sample_rate)
+            db.execute(
+                "INSERT OR REPLACE INTO ingest_file (path, size, mtime_ns, status, recording_id, error)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                found + ("done" if error is None else "failed", recording_id, error),
+            )
+
+
+def ingest(dirs, workers, batch_size, source, default_annotator, report=logging.info):
+    """Ingest the WAV files under ``dirs``; returns counts of done, skipped and failed files and bytes."""
+    config = current_app.config
+    root = config["RECORDINGS_FOLDER"]
+    sample_rate = config["TRANSCODE_SAMPLE_RATE"]
+    db = get_db()
+    known = {
+        row["path"]: (row["size"], row["mtime_ns"])
+        for row in db.execute("SELECT path, size, mtime_ns FROM ingest_file WHERE status = 'done'")
+    }
+    counts = {"done": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    start = last_report = time.monotonic()
+    files = scan(dirs, os.path.join(root, storage.BLOB_DIR))
+    running = {}
+    batch = []
+    with ProcessPoolExecutor(workers) as pool:
+        while True:
+            # a few files waiting for every worker, without listing all of them first
+            for found in files:
+                if known.get(found[0]) == found[1:]:
+                    counts["skipped"] += 1
+                    continue
+                running[pool.submit(probe, found[0], root, sample_rate)] = found
+                if len(running) >= 2 * workers:
+                    break
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                found = running.pop(future)
+                try:
+                    batch.append((found, future.result(), None))
+                    counts["done"] += 1
+                    counts["bytes"] += found[1]
+                except Exception as e:
+                    logging.warning(f"Ingesting {found[0]} failed: {e!r}")
+                    batch.append((found, None, repr(e)))
+                    counts["failed"] += 1
+            if len(batch) >= batch_size:
+                write_results(db, batch, source, default_annotator, sample_rate)
+                batch = []
+            now = time.monotonic()
+            if now - last_report >= REPORT_INTERVAL:
+                report(format_rates(counts, now - start))
+                last_report = now
+    write_results(db, batch, source, default_annotator, sample_rate)
+    counts["seconds"] = time.monotonic() - start
+    return counts
+
+
+def format_rates(counts, seconds):
+    seconds = max(seconds, 1e-9)
+    return (
+        f"{counts['done']} files ({counts['bytes'] / 2**20:.1f} MiB) ingested, {counts['skipped']} skipped,"
+        f" {counts['failed']} failed: {counts['done'] / seconds:.1f} files/s, {counts['bytes'] / 2**20 / seconds:.1f} MiB/s"
+    )
+
+
+@click.command("ingest")
+@click.argument("dirs", nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option("-j", "--workers", type=int, default=None, help="Number of worker processes.")
+@click.option("--batch-size", type=int, default=500, show_default=True, help="Files per transaction.")
+@click.option("--source", default="legacy", show_default=True, help="Source of takes without a CutSet.")
+@click.option("--annotator", default="legacy", show_default=True, help="Annotator of takes with unknown one.")
+@click.option("--script-name", envvar="SCRIPT_NAME", help="Mount point of the app [default: APPLICATION_ROOT].")
+@with_appcontext
+def ingest_command(dirs, workers, batch_size, source, annotator, script_name):
+    """Register WAV and MP3 files and Streamlit prototype takes found in DIRS."""
+    config = current_app.config
+    workers = workers or config["TRANSCODE_WORKERS"]
+    script_name = (script_name or config["APPLICATION_ROOT"]).rstrip("/")
+    base_url = f"{config['PREFERRED_URL_SCHEME']}://{config['SERVER_NAME'] or 'localhost'}{script_name}/"
+    # recording URLs are built as in a request to the app where the server mounts it
+    with current_app.test_request_context(base_url=base_url):
+        counts = ingest(dirs, workers, batch_size, source, annotator, report=click.echo)
+    click.echo(format_rates(counts, counts["seconds"]))
+
+
+def init_app(app):
+    """Register the ingest command with the Flask app."""
+    app.cli.add_command(ingest_command)
@@ -0,0 +1,80 @@
+"""Serving of recordings and reference clips from RECORDINGS_FOLDER.
+
+``GET /media/<path>`` answers range requests, so players can seek without downloading the
+whole take, and conditional requests with an ETag derived from the content: blobs are
+named by their SHA-256 (see ``speechwoz.storage``), other files are hashed once per process.
+URLs built with ``media_url`` carry the content version, so browsers keep them for
+``MEDIA_MAX_AGE`` seconds and every annotator's browser downloads a reference clip once.
+
+Python only checks the request; the file itself can be sent by the front proxy:
+``USE_X_SENDFILE`` (Apache, lighttpd) or ``MEDIA_ACCEL_REDIRECT`` set to an internal nginx
+location aliasing RECORDINGS_FOLDER, e.g. ``/_recordings/``. Then a worker is busy for
+microseconds instead of the whole download.
+"""
+import functools
+import hashlib
+import mimetypes
+import os
+
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+from werkzeug.security import safe_join
+
+from speechwoz.storage import BLOB_DIR, TMP_DIR
+
+bp = Blueprint("media", __name__, url_prefix="/media")
+
+
+@functools.lru_cache(maxsize=1024)
+def _file_hash(path, size, mtime_ns):
+    h = hashlib.sha256()
+    with open(path, "rb") as r:
+        for block in iter(lambda: r.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def content_etag(filename, path):
+    """Blobs and files derived from them are named by their content, others are hashed."""
+    if filename.startswith(BLOB_DIR + "/"):
+        return os.path.basename(filename)
+    st = os.stat(path)
+    return _file_hash(path, st.st_size, st.st_mtime_ns)
+
+
+@bp.app_template_global()
+def media_url(filename):
+    """URL of a file in RECORDINGS_FOLDER which changes with its content."""
+    path = safe_join(current_app.config["RECORDINGS_FOLDER"], filename)
+    if path is None or not os.path.isfile(path):
+        return url_for("media.serve", filename=filename)
+    return url_for("media.serve", filename=filename, v=content_etag(filename, path)[:16])
+
+
+@bp.route("/<path:filename>")
+def serve(filename):
+    path = safe_join(current_app.config["RECORDINGS_FOLDER"], filename)
+    # files being written are never served
+    if path is None or filename.startswith(TMP_DIR + "/") or not os.path.isfile(path):
+        abort(404)
+    etag = content_etag(filename, path)
+    versioned = filename.startswith(BLOB_DIR + "/") or request.args.get("v") == etag[:16]
+    accel_prefix = current_app.config["MEDIA_ACCEL_REDIRECT"]
+    if accel_prefix:
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0])
+        response.set_etag(etag)
+        response.make_conditional(request)
+        if response.status_code == 200:
+            # nginx sends the file, ranges included
+            response.headers["X-Accel-Redirect"] = accel_prefix + filename
+    else:
+        # answers Range and If-None-Match; with USE_X_SENDFILE only the header is sent
+        response = send_file(path, etag=etag, conditional=True)
+    response.cache_control.public = True
+    if versioned:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = current_app.config["MEDIA_MAX_AGE"]
+        response.cache_control.immutable = True
+    else:
+        # revalidated with the ETag
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,272 @@
+"""Request, upload and database metrics in the Prometheus text format.
+
+With ``METRICS_ENABLED`` every request is timed per endpoint, upload requests also count
+their bytes and throughput, and pooled SQLite connections time every statement (see
+``TimedConnection`` in speechwoz/db.py). ``GET /metrics`` returns these together with the
+queue depths of background jobs, read from the database when scraped. Disabled, nothing
+is registered and requests and queries run exactly as before.
+
+Metrics are kept per worker process and not aggregated: with several gunicorn workers every
+scrape reports the worker which happened to serve it (labelled with its pid), so counters
+jump between scrapes. Scrape a deployment of a single worker, e.g. one gevent worker, or an
+extra single-worker instance of the app on the same database, which also sees the queue depths.
+
+The endpoints require ``Authorization: Bearer <METRICS_TOKEN>``. Without a token they only
+answer requests from the loopback interface which did not pass a proxy (no
+``X-Forwarded-For``), since a proxy on the same host connects from loopback as well.
+
+``METRICS_PROFILE_INTERVAL`` turns on a sampling profiler: a SIGPROF timer interrupts the
+process every that many seconds of CPU time and the stack of a request running longer than
+``METRICS_PROFILE_AFTER`` seconds is counted. ``GET /metrics/profile`` returns the counts as
+collapsed stacks, the input of flamegraph.pl or speedscope; ``POST`` also starts a new profile. Signals are delivered to the
+main thread, so this works with sync and gevent workers, not with threaded ones.
+"""
+import atexit
+import bisect
+import hmac
+import logging
+import os
+import signal
+import threading
+import time
+
+from flask import Blueprint, Response, abort, current_app, g, has_request_context, request
+
+from speechwoz import db, transcode
+from speechwoz.concurrency import cooperative
+
+bp = Blueprint("metrics", __name__, url_prefix="/metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# bytes per second, 64 KiB/s to 64 MiB/s
+THROUGHPUT_BUCKETS = tuple(2 ** i for i in range(16, 27, 2))
+
+UPLOAD_ENDPOINTS = {"upload_recording", "upload.put_chunk"}
+
+LOOPBACK = {"127.0.0.1", "::1"}
+
+# distinct stacks kept by the profiler
+PROFILE_MAX_STACKS = 10000
+PROFILE_MAX_DEPTH = 64
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic sum per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def lines(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    """Counts of observations in ``buckets`` (upper bounds) per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def lines(self):
+        with self.lock:
+            items = sorted((labels, list(counts)) for labels, counts in self.values.items())
+        names = self.labels + ("le",)
+        for labels, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {counts[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}"
+
+
+REQUEST_SECONDS = Histogram(
+    "speechwoz_request_seconds", "Time from the start of a request to its response.", ("endpoint", "method")
+)
+REQUESTS = Counter("speechwoz_requests_total", "Finished requests.", ("endpoint", "method", "status"))
+UPLOAD_BYTES = Counter("speechwoz_upload_bytes_total", "Bytes received by upload requests.", ("endpoint",))
+UPLOAD_THROUGHPUT = Histogram(
+    "speechwoz_upload_bytes_per_second",
+    "Throughput of single upload requests.",
+    ("endpoint",),
+    THROUGHPUT_BUCKETS,
+)
+QUERY_SECONDS = Histogram(
+    "speechwoz_db_query_seconds", "Duration of SQLite statements by kind.", ("statement",), QUERY_BUCKETS
+)
+METRICS = [REQUEST_SECONDS, REQUESTS, UPLOAD_BYTES, UPLOAD_THROUGHPUT, QUERY_SECONDS]
+
+# collapsed stack -> samples, written only by the signal handler so it needs no lock
+_profile = {}
+_profiled_pids = set()
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.get("metrics_start")
+    if start is None:
+        return response
+    seconds = time.perf_counter() - start
+    endpoint = request.endpoint or "none"
+    REQUEST_SECONDS.observe((endpoint, request.method), seconds)
+    REQUESTS.inc((endpoint, request.method, str(response.status_code)))
+    if endpoint in UPLOAD_ENDPOINTS and request.content_length:
+        UPLOAD_BYTES.inc((endpoint,), request.content_length)
+        UPLOAD_THROUGHPUT.observe((endpoint,), request.content_length / max(seconds, 1e-6))
+    return response
+
+
+def _record_query(sql, seconds):
+    # the first keyword keeps the label set small
+    kind = sql.lstrip()[:8].split(None, 1)[0].upper()
+    QUERY_SECONDS.observe((kind if kind.isalpha() else "OTHER",), seconds)
+
+
+def _sample(signum, frame):
+    if not has_request_context():
+        return
+    start = g.get("metrics_start")
+    if start is None or time.perf_counter() - start < current_app.config["METRICS_PROFILE_AFTER"]:
+        return
+    stack = []
+    while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+        stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    stack.append(request.endpoint or "none")
+    key = ";".join(reversed(stack))
+    if key in _profile or len(_profile) < PROFILE_MAX_STACKS:
+        _profile[key] = _profile.get(key, 0) + 1
+
+
+def _start_profiler():
+    """Arm the SIGPROF timer once per process, i.e. after gunicorn forked the worker."""
+    pid = os.getpid()
+    if pid in _profiled_pids:
+        return
+    _profiled_pids.add(pid)
+    interval = current_app.config["METRICS_PROFILE_INTERVAL"]
+    try:
+        signal.signal(signal.SIGPROF, _sample)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        # the default action of SIGPROF, restored at exit, terminates the process
+        atexit.register(signal.setitimer, signal.ITIMER_PROF, 0)
+    except (AttributeError, ValueError) as e:
+        # no setitimer on Windows, and handlers can only be installed from the main thread
+        logging.warning(f"Sampling profiler not started: {e!r}")
+
+
+def _gauge(name, help, label, counts):
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} gauge"
+    for value, count in sorted(counts.items()):
+        yield f"{name}{_format_labels((label,), (value,))} {count}"
+
+
+def queue_lines():
+    """Queue depths of the background work, read when scraped."""
+    conn = db.get_db()
+    yield from _gauge("speechwoz_transcode_jobs", "Transcoding jobs by status.", "status", transcode.queue_depths(conn))
+    rows = conn.execute("SELECT status, COUNT(*) FROM upload GROUP BY status").fetchall()
+    yield from _gauge("speechwoz_uploads", "Chunked uploads by status.", "status", dict(rows))
+    yield "# HELP speechwoz_db_idle_connections Pooled SQLite connections."
+    yield "# TYPE speechwoz_db_idle_connections gauge"
+    yield f"speechwoz_db_idle_connections {db.idle_connections()}"
+    if cooperative():
+        import gevent
+
+        threadpool = gevent.get_hub().threadpool
+        counts = {"threads": threadpool.size, "queued": threadpool.task_queue.qsize()}
+        yield from _gauge("speechwoz_threadpool", "Native threads and calls waiting for one.", "kind", counts)
+
+
+@bp.before_request
+def _authorize():
+    token = current_app.config["METRICS_TOKEN"]
+    if token:
+        allowed = hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    else:
+        allowed = request.remote_addr in LOOPBACK and "X-Forwarded-For" not in request.headers
+    if not allowed:
+        abort(403)
+
+
+@bp.route("")
+def metrics():
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines())
+    lines.extend(queue_lines())
+    lines.append("# HELP speechwoz_worker_info The worker process which served the scrape.")
+    lines.append("# TYPE speechwoz_worker_info gauge")
+    lines.append(f'speechwoz_worker_info{{pid="{os.getpid()}"}} 1')
+    return Response("\n".join(lines) + "\n", content_type=CONTENT_TYPE)
+
+
+@bp.route("/profile", methods=["GET", "POST"])
+def profile():
+    """Collapsed stacks of the slow requests, a POST starts a new profile."""
+    # a plain copy is a single call the signal handler cannot interrupt
+    stacks = dict(_profile)
+    if request.method == "POST":
+        _profile.clear()
+    body = "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+    return Response(body, content_type="text/plain; charset=utf-8")
+
+
+def init_app(app):
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    if _record_query not in db.query_hooks:
+        db.query_hooks.append(_record_query)
+    if app.config["METRICS_PROFILE_INTERVAL"]:
+        app.before_request(_start_profiler)
+    app.register_blueprint(bp)
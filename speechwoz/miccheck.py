@@ -0,0 +1,151 @@
+"""Live microphone check during onboarding.
+
+While the onboarding take is being recorded, the browser also posts small blocks of raw
+16-bit mono PCM to ``/mic_check/<check_id>?rate=<Hz>`` and gets back running level, noise
+and clipping estimates with a verdict, so a bad setup is noticed within seconds.
+
+The running state is a histogram of 20 ms frame levels plus a few counters and the samples
+of the last incomplete frame, i.e. constant size regardless of how long the check runs or how
+small the blocks are, and lives in the ``mic_check`` table so any
+worker can serve the next block. With ``MIC_CHECK_REQUIRED`` an onboarding take can only be
+finalized with the id of a passed check run while recording it, so unusable takes are never
+stored or transcoded; the upload of a rejected take is removed right away.
+"""
+import uuid
+
+import numpy as np
+from flask import Blueprint, abort, current_app, jsonify, request, session
+
+from speechwoz.audio import CLIPPING_LEVEL
+from speechwoz.db import get_db
+from speechwoz.quality import FRAME_SECONDS, MIN_DB, frame_levels
+
+bp = Blueprint("miccheck", __name__, url_prefix="/mic_check")
+
+# 1 dB histogram bins from MIN_DB to 0 dBFS
+BINS = int(-MIN_DB) + 1
+
+
+class LevelMeter:
+    """Running frame level statistics of a stream of int16 samples."""
+
+    def __init__(self, histogram=None, samples=0, clipped=0, sample_rate=None, tail=None):
+        self.histogram = np.zeros(BINS, dtype=np.int64) if histogram is None else histogram
+        self.samples = samples
+        self.clipped = clipped
+        self.sample_rate = sample_rate
+        # samples not filling a whole frame yet, measured with the next block
+        self.tail = np.zeros(0, dtype="<i2") if tail is None else tail
+        self.level = None
+
+    @classmethod
+    def from_row(cls, row):
+        histogram = np.frombuffer(row["histogram"], dtype=np.int64).copy()
+        tail = np.frombuffer(row["tail"] or b"", dtype="<i2")
+        return cls(histogram, row["samples"], row["clipped"], row["sample_rate"], tail)
+
+    def update(self, samples):
+        frame = max(1, int(self.sample_rate * FRAME_SECONDS))
+        pending = np.concatenate([self.tail, samples])
+        full = len(pending) // frame * frame
+        levels = frame_levels(pending[:full], self.sample_rate)
+        self.tail = pending[full:]
+        bins = np.clip(np.round(levels - MIN_DB).astype(int), 0, BINS - 1)
+        self.histogram += np.bincount(bins, minlength=BINS)
+        self.samples += len(samples)
+        self.clipped += int(np.count_nonzero(np.abs(samples.astype(np.int32)) >= CLIPPING_LEVEL))
+        if len(levels):
+            self.level = float(np.max(levels))
+
+    def percentile(self, q):
+        """Frame level in dBFS below which ``q`` percent of frames are."""
+        total = self.histogram.sum()
+        if total == 0:
+            return None
+        return float(np.searchsorted(np.cumsum(self.histogram), total * q / 100) + MIN_DB)
+
+    def report(self, config):
+        """Current estimates and a verdict: listening, ok, too-quiet, noisy or clipping."""
+        seconds = self.samples / self.sample_rate
+        speech, noise = self.percentile(95), self.percentile(10)
+        clipping_ratio = self.clipped / self.samples if self.samples else 0.0
+        if clipping_ratio > config["MIC_CHECK_MAX_CLIPPING"]:
+            verdict = "clipping"
+        elif seconds < config["MIC_CHECK_MIN_SECONDS"] or speech is None:
+            verdict = "listening"
+        elif speech < config["MIC_CHECK_MIN_SPEECH_DBFS"]:
+            verdict = "too-quiet"
+        elif speech - noise < config["MIC_CHECK_MIN_SNR"]:
+            verdict = "noisy"
+        else:
+            verdict = "ok"
+        return {
+            "verdict": verdict,
+            "seconds": seconds,
+            "level": self.level,
+            "speech": speech,
+            "noise": noise,
+            "snr": None if speech is None else speech - noise,
+            "clipping_ratio": clipping_ratio,
+        }
+
+
+def verdict(check_id, ann_id):
+    """Verdict of the check ``check_id`` of the annotator or ``None`` if there is no such check."""
+    if not check_id:
+        return None
+    query = "SELECT verdict FROM mic_check WHERE id = ? AND annotator_id = ? AND created >= datetime('now', ?)"
+    row = get_db().execute(query, (check_id, ann_id, f"-{int(current_app.config['MIC_CHECK_TTL'])} seconds")).fetchone()
+    return None if row is None else row["verdict"]
+
+
+@bp.route("", methods=["POST"])
+def open_check():
+    ann_id = session.get("ann_id")
+    if ann_id is None:
+        return jsonify(status="no-annotator")
+    check_id = uuid.uuid4().hex
+    db = get_db()
+    db.execute(
+        "INSERT INTO mic_check (id, annotator_id, histogram) VALUES (?, ?, ?)",
+        (check_id, ann_id, np.zeros(BINS, dtype=np.int64).tobytes()),
+    )
+    db.commit()
+    return jsonify(status="ok", check_id=check_id)
+
+
+@bp.route("/<check_id>", methods=["POST"])
+def feed_check(check_id):
+    """Add a block of raw little-endian int16 mono PCM to the check."""
+    sample_rate = request.args.get("rate", type=int)
+    if sample_rate is None or not 8000 <= sample_rate <= 96000:
+        return jsonify(status="no-rate")
+    config = current_app.config
+    if request.content_length is None or request.content_length > config["MIC_CHECK_MAX_BLOCK_SIZE"]:
+        return jsonify(status="block-too-large")
+    db = get_db()
+    row = db.execute("SELECT * FROM mic_check WHERE id = ?", (check_id,)).fetchone()
+    if row is None or row["annotator_id"] != session.get("ann_id"):
+        abort(404)
+    meter = LevelMeter.from_row(row)
+    if meter.sample_rate not in (None, sample_rate):
+        return jsonify(status="rate-changed")
+    meter.sample_rate = sample_rate
+    data = request.get_data()
+    meter.update(np.frombuffer(data[: len(data) // 2 * 2], dtype="<i2"))
+    report = meter.report(config)
+    db.execute(
+        "UPDATE mic_check SET histogram = ?, tail = ?, samples = ?, clipped = ?, sample_rate = ?, verdict = ?,"
+        " updated = CURRENT_TIMESTAMP WHERE id = ?",
+        (
+            meter.histogram.tobytes(),
+            meter.tail.tobytes(),
+            meter.samples,
+            meter.clipped,
+            sample_rate,
+            report["verdict"],
+            check_id,
+        ),
+    )
+    db.commit()
+    return jsonify(status="ok", **report)
@@ -0,0 +1,162 @@
+"""Compiled MultiWOZ dialogue store.
+
+``flask --app speechwoz compile-multiwoz`` parses the MultiWOZ 2.2 dialogues and the
+MultiWOZ 2.1 goal summaries once and writes them into a separate read-only SQLite file
+with one row per dialogue and one row per turn. Turns are clustered by (dialogue_id, turn_id),
+so loading the prompt of a dialogue is a primary key lookup plus one range scan of adjacent
+pages and a single turn is a primary key lookup. Workers start without parsing any JSON and
+they share the file through the page cache.
+
+The file is replaced atomically when recompiled; running workers keep reading the old
+version until they are restarted.
+"""
+import json
+import os
+import sqlite3
+
+import click
+from flask import Blueprint, abort, current_app, jsonify
+from flask.cli import with_appcontext
+
+from speechwoz.db import write_batch
+
+bp = Blueprint("multiwoz", __name__)
+
+SCHEMA = """
+CREATE TABLE dialogue (
+  id TEXT PRIMARY KEY,
+  n_turns INTEGER NOT NULL,
+  services TEXT NOT NULL,  -- JSON list
+  goal TEXT NOT NULL  -- JSON list of goal message sentences
+) WITHOUT ROWID;
+
+CREATE TABLE turn (
+  dialogue_id TEXT NOT NULL,
+  turn_id INTEGER NOT NULL,
+  speaker TEXT NOT NULL,  -- USER or SYSTEM
+  utterance TEXT NOT NULL,
+  PRIMARY KEY (dialogue_id, turn_id)
+) WITHOUT ROWID;
+"""
+
+# (pid, path) -> read-only connection
+_stores = {}
+
+
+def get_store():
+    """Read-only connection to the compiled store, opened once per worker process."""
+    path = current_app.config["MULTIWOZ_DATABASE"]
+    key = (os.getpid(), path)
+    if key not in _stores:
+        # immutable: no locking or change detection, the file is only ever replaced
+        db = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        _stores[key] = db
+    return _stores[key]
+
+
+def load_dialogue(dialogue_id):
+    """Return the dialogue as a dict or ``None`` if it is not in the store."""
+    store = get_store()
+    row = store.execute("SELECT * FROM dialogue WHERE id = ?", (dialogue_id,)).fetchone()
+    if row is None:
+        return None
+    turns = store.execute(
+        "SELECT speaker, turn_id, utterance FROM turn WHERE dialogue_id = ? ORDER BY turn_id", (dialogue_id,)
+    )
+    return {
+        "dialogue_id": row["id"],
+        "n_turns": row["n_turns"],
+        "services": json.loads(row["services"]),
+        "goal": json.loads(row["goal"]),
+        "turns": [dict(t) for t in turns],
+    }
+
+
+def load_turn(dialogue_id, turn_id):
+    """Return one turn of a dialogue as a dict or ``None`` if it is not in the store."""
+    query = "SELECT speaker, turn_id, utterance FROM turn WHERE dialogue_id = ? AND turn_id = ?"
+    row = get_store().execute(query, (dialogue_id, turn_id)).fetchone()
+    return None if row is None else dict(row)
+
+
+def iter_dialogues(m22_paths, m21_path):
+    """Yield dialogue rows and lists of their turn rows from MultiWOZ 2.2 dialogue files and the 2.1 data.json."""
+    with open(m21_path, "rt") as r:
+        m21 = json.load(r)
+    for path in m22_paths:
+        with open(path, "rt") as r:
+            m22 = json.load(r)
+        for d in m22:
+            cid = d["dialogue_id"]
+            assert cid in m21, f"{cid} from {path} is missing in {m21_path}"
+            turns = [(cid, int(t["turn_id"]), t["speaker"], t["utterance"]) for t in d["turns"]]
+            # TODO extract dialogue_act for system from m21 data for system turns
+            dialogue = (
+                cid,
+                len(turns),
+                json.dumps(d.get("services", [])),
+                json.dumps(m21[cid]["goal"].get("message", [])),
+            )
+            yield dialogue, turns
+
+
+def compile_store(m22_paths, m21_path, out_path):
+    """Write the store to ``out_path``; returns the ids and turn counts of compiled dialogues."""
+    tmp = out_path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    db.executescript(SCHEMA)
+    with db:
+        for dialogue, turns in iter_dialogues(m22_paths, m21_path):
+            db.execute("INSERT INTO dialogue VALUES (?, ?, ?, ?)", dialogue)
+            db.executemany("INSERT INTO turn VALUES (?, ?, ?, ?)", turns)
+    dialogues = db.execute("SELECT id, n_turns FROM dialogue").fetchall()
+    db.execute("VACUUM")
+    db.close()
+    os.replace(tmp, out_path)
+    return dialogues
+
+
+@bp.route("/dialogues/<dialogue_id>")
+def get_dialogue(dialogue_id):
+    dialogue = load_dialogue(dialogue_id)
+    if dialogue is None:
+        abort(404)
+    return jsonify(dialogue)
+
+
+@click.command("compile-multiwoz")
+@click.option(
+    "-i",
+    "--inputs",
+    multiple=True,
+    required=True,
+    type=click.Path(exists=True),
+    help="MultiWOZ 2.2 dialogues file(s) (JSON), can be repeated.",
+)
+@click.option(
+    "-s",
+    "--summary",
+    required=True,
+    type=click.Path(exists=True),
+    help="MultiWOZ 2.1 data.json for goal summaries.",
+)
+@with_appcontext
+def compile_multiwoz_command(inputs, summary):
+    """Compile MultiWOZ into the indexed dialogue store and register the dialogues."""
+    out_path = current_app.config["MULTIWOZ_DATABASE"]
+    dialogues = compile_store(inputs, summary, out_path)
+    # the app DB keeps per-dialogue recording counts for prompt assignment
+    write_batch(
+        "INSERT INTO dialogue (id, n_turns) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET n_turns = excluded.n_turns",
+        dialogues,
+    )
+    click.echo(f"Compiled {len(dialogues)} dialogues to {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB).")
+
+
+def init_app(app):
+    """Register the compile command and the dialogue endpoint with the Flask app."""
+    app.cli.add_command(compile_multiwoz_command)
+    app.register_blueprint(bp)
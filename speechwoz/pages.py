@@ -0,0 +1,122 @@
+"""Cached rendering of the annotator pages and fingerprinted static files.
+
+The landing, annotation and survey pages are the same for every annotator apart from a few
+user fragments: flashed messages and the annotator's data handed to the page scripts.
+``render_page`` renders a page once per template, role and locale with markers in place of
+these fragments (``user_fragment`` in the templates, macros of templates/fragments.html)
+and on later requests only renders the fragments into the cached page. The cache is kept
+per process for the config ``VERSION`` it was filled with, a request only compares that
+one key; after changing other config values of a running app call ``clear_cache``. With
+``PAGE_CACHE = False`` or TEMPLATES_AUTO_RELOAD (debug) every request renders the template.
+
+Page scripts are static files in static/js/ instead of inline code. ``static_url`` adds the
+content hash to their URL, so browsers keep them ``STATIC_MAX_AGE`` seconds and download
+them again only after a deploy changed them.
+"""
+import functools
+import hashlib
+import os
+
+from flask import current_app, g, render_template, request, url_for
+from markupsafe import Markup
+from werkzeug.security import safe_join
+
+# compiled on startup, so the first request of a worker does not wait for it
+PAGES = ("index.html", "annotate.html", "survey.html")
+
+# separates the cached parts of a page from the names of its user fragments
+MARKER = "\x00"
+
+
+@functools.lru_cache(maxsize=256)
+def _file_hash(path, size, mtime_ns):
+    with open(path, "rb") as r:
+        return hashlib.sha256(r.read()).hexdigest()
+
+
+def static_hash(filename):
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    return _file_hash(path, st.st_size, st.st_mtime_ns)
+
+
+def static_url(filename):
+    """URL of a static file which changes with its content."""
+    digest = static_hash(filename)
+    if digest is None:
+        return url_for("static", filename=filename)
+    return url_for("static", filename=filename, v=digest[:16])
+
+
+def _fragments():
+    context = {}
+    current_app.update_template_context(context)
+    return current_app.jinja_env.get_template("fragments.html").make_module(context)
+
+
+def user_fragment(name):
+    """The macro ``name`` of templates/fragments.html, or its marker while a page is cached."""
+    if g.get("caching_page"):
+        return Markup(f"{MARKER}{name}{MARKER}")
+    return getattr(_fragments(), name)()
+
+
+def locale():
+    languages = current_app.config["LANGUAGES"]
+    return request.accept_languages.best_match(languages, default=languages[0])
+
+
+def render_page(template):
+    """``render_template`` of a page which differs between annotators only in user fragments."""
+    app = current_app._get_current_object()
+    lang = locale()
+    if not app.config["PAGE_CACHE"] or app.jinja_env.auto_reload:
+        return render_template(template, locale=lang)
+    cache = app.extensions["pages"]
+    if cache["version"] != app.config["VERSION"]:
+        clear_cache(app)
+    # url_for is relative to the mount point, e.g. SCRIPT_NAME=/namuddis/speechwoz
+    key = (template, g.annotator_info["role"], lang, request.script_root)
+    parts = cache["pages"].get(key)
+    if parts is None:
+        g.caching_page = True
+        try:
+            parts = render_template(template, locale=lang).split(MARKER)
+        finally:
+            g.caching_page = False
+        cache["pages"][key] = parts
+    if len(parts) == 1:
+        return parts[0]
+    fragments = _fragments()
+    # odd parts are fragment names
+    return "".join(getattr(fragments, part)() if i % 2 else part for i, part in enumerate(parts))
+
+
+def clear_cache(app):
+    """Render the pages again on the next requests, e.g. after the config changed."""
+    cache = app.extensions["pages"]
+    cache["pages"].clear()
+    cache["version"] = app.config["VERSION"]
+
+
+def _cache_static(response):
+    if request.endpoint != "static" or response.status_code != 200 or "v" not in request.args:
+        return response
+    digest = static_hash(request.view_args["filename"])
+    if digest is not None and request.args["v"] == digest[:16]:
+        response.cache_control.public = True
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = current_app.config["STATIC_MAX_AGE"]
+        response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.extensions["pages"] = {"version": app.config["VERSION"], "pages": {}}
+    app.add_template_global(static_url)
+    app.add_template_global(user_fragment)
+    app.after_request(_cache_static)
+    for name in PAGES:
+        app.jinja_env.get_template(name)
@@ -0,0 +1,106 @@
+"""Audio quality metrics of recordings computed once at ingest.
+
+The transcode workers analyze every converted WAV (see ``speechwoz.transcode``) and store
+the metrics in ``recording_quality``. Reviewing then filters on indexed columns, e.g.
+``GET /recordings/quality?min_snr=15&max_clipping=0.001``, without reading any audio;
+only reviewers may list recordings, see ``speechwoz.annotators``.
+
+All metrics are computed on 20 ms frames with NumPy. Frames more than ``SILENCE_MARGIN_DB``
+below the speech level (or below ``SILENCE_FLOOR_DBFS``) count as silence.
+"""
+import numpy as np
+from flask import Blueprint, jsonify, request
+
+from speechwoz.annotators import reviewer_required
+from speechwoz.audio import CLIPPING_LEVEL
+from speechwoz.db import get_db
+
+bp = Blueprint("quality", __name__, url_prefix="/recordings")
+
+FRAME_SECONDS = 0.02
+SILENCE_FLOOR_DBFS = -60.0
+SILENCE_MARGIN_DB = 30.0
+# dB of an all-zero frame instead of -inf
+MIN_DB = -120.0
+
+METRICS = ["snr", "clipping_ratio", "silence_ratio", "loudness", "leading_silence", "trailing_silence"]
+
+# query parameter -> SQL condition on an indexed column
+FILTERS = {
+    "min_snr": "snr >= ?",
+    "max_clipping": "clipping_ratio <= ?",
+    "max_silence": "silence_ratio <= ?",
+    "min_loudness": "loudness >= ?",
+    "max_loudness": "loudness <= ?",
+}
+
+
+def frame_levels(samples, sample_rate):
+    """Energy of every full 20 ms frame in dBFS."""
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    n = len(samples) // frame
+    frames = samples[: n * frame].astype(np.float64).reshape(n, frame) / 32768.0
+    power = np.mean(frames * frames, axis=1)
+    return 10 * np.log10(np.maximum(power, 10 ** (MIN_DB / 10)))
+
+
+def analyze(samples, sample_rate):
+    """SNR estimate and loudness in dB, clipping and silence ratios, leading and trailing silence in seconds."""
+    levels = frame_levels(samples, sample_rate)
+    if len(levels) == 0:
+        return dict.fromkeys(METRICS)
+    # loud frames estimate speech, quiet frames the background noise
+    speech, noise = np.percentile(levels, [95, 10])
+    silent = levels < max(speech - SILENCE_MARGIN_DB, SILENCE_FLOOR_DBFS)
+    active = np.flatnonzero(~silent)
+    if len(active):
+        loudness = 10 * np.log10(np.mean(10 ** (levels[active] / 10)))
+        leading, trailing = active[0], len(levels) - 1 - active[-1]
+    else:
+        loudness, leading, trailing = MIN_DB, len(levels), len(levels)
+    clipped = np.count_nonzero(np.abs(samples.astype(np.int32)) >= CLIPPING_LEVEL)
+    return {
+        "snr": float(speech - noise),
+        "clipping_ratio": clipped / len(samples),
+        "silence_ratio": float(np.mean(silent)),
+        "loudness": float(loudness),
+        "leading_silence": leading * FRAME_SECONDS,
+        "trailing_silence": trailing * FRAME_SECONDS,
+    }
+
+
+def store(db, recording_id, metrics):
+    """Insert or replace the metrics of a recording; commit is left to the caller."""
+    db.execute(
+        "INSERT OR REPLACE INTO recording_quality (recording_id, snr, clipping_ratio, silence_ratio, loudness,"
+        " leading_silence, trailing_silence) VALUES (:recording_id, :snr, :clipping_ratio, :silence_ratio,"
+        " :loudness, :leading_silence, :trailing_silence)",
+        dict(metrics, recording_id=recording_id),
+    )
+
+
+def find_recordings(limit=100, after_id=0, **filters):
+    """Recordings whose metrics pass all ``filters`` (keys of ``FILTERS``), ordered by id."""
+    conditions = ["recording.id > ?"]
+    params = [after_id]
+    for name, value in filters.items():
+        if value is not None:
+            conditions.append(f"recording_quality.{FILTERS[name]}")
+            params.append(value)
+    query = (
+        "SELECT recording.id, recording.url, recording.annotator_id, recording.duration, recording_quality.*"
+        " FROM recording_quality JOIN recording ON recording.id = recording_quality.recording_id"
+        f" WHERE {' AND '.join(conditions)} ORDER BY recording.id LIMIT ?"
+    )
+    return get_db().execute(query, params + [limit]).fetchall()
+
+
+@bp.route("/quality")
+@reviewer_required
+def list_quality():
+    """Filter recordings by quality; paginate with ``after_id`` set to the last id of the previous page."""
+    filters = {name: request.args.get(name, type=float) for name in FILTERS}
+    limit = min(request.args.get("limit", 100, type=int), 1000)
+    after_id = request.args.get("after_id", 0, type=int)
+    rows = find_recordings(limit=limit, after_id=after_id, **filters)
+    return jsonify(status="ok", recordings=[dict(row) for row in rows])
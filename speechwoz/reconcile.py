@@ -0,0 +1,152 @@
+"""Cleanup after killed workers, run when a process creates the app and by ``flask reconcile``.
+
+Writers leave a known, small amount of state behind when killed, so nothing walks the
+recordings tree:
+
+- temporary files in ``RECORDINGS_FOLDER/blobs/tmp/`` (one flat directory, see
+  ``speechwoz.storage``) whose writer process is gone are removed,
+- idempotency keys left pending by a process which is gone are released and stored
+  responses older than ``IDEMPOTENCY_KEY_TTL`` deleted,
+- uploads stuck in finalizing for ``UPLOAD_FINALIZE_TIMEOUT`` seconds are opened again, so the
+  client's retry assembles them; open uploads older than ``UPLOAD_EXPIRE_AFTER`` expire,
+- chunk directories in ``UPLOAD_FOLDER`` (one per unfinished upload) of finished, expired,
+  rejected or unknown uploads are removed,
+- live mic checks older than ``MIC_CHECK_TTL`` are deleted.
+
+Writers are identified by pid, which assumes the workers sharing RECORDINGS_FOLDER run on
+one host.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from speechwoz.db import get_db
+from speechwoz.storage import TMP_DIR
+
+# ids per query when matching upload directories to their rows
+ID_BATCH_SIZE = 500
+
+
+def alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, owned by someone else
+        return True
+    return True
+
+
+def sweep_tmp(root):
+    """Remove temporary files of writers which are not running; returns their number."""
+    tmpdir = os.path.join(root, TMP_DIR)
+    try:
+        names = os.listdir(tmpdir)
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for name in names:
+        pid = name.split("-", 1)[0]
+        if pid.isdigit() and alive(int(pid)):
+            continue
+        try:
+            os.remove(os.path.join(tmpdir, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def release_keys(db, ttl):
+    """Release idempotency keys of gone processes and forget old responses; returns the number of rows."""
+    owners = [row[0] for row in db.execute("SELECT DISTINCT owner FROM idempotency_key WHERE status = 'pending'")]
+    gone = [(pid,) for pid in owners if not alive(pid)]
+    with db:
+        db.executemany("DELETE FROM idempotency_key WHERE status = 'pending' AND owner = ?", gone)
+        cur = db.execute("DELETE FROM idempotency_key WHERE created < datetime('now', ?)", (f"-{int(ttl)} seconds",))
+    return len(gone) + cur.rowcount
+
+
+def reopen_uploads(db, finalize_timeout, expire_after):
+    """Reopen uploads whose finalizing request died and expire abandoned ones; returns both counts."""
+    with db:
+        reopened = db.execute(
+            "UPDATE upload SET status = 'open', claimed = NULL"
+            " WHERE status = 'finalizing' AND claimed < datetime('now', ?)",
+            (f"-{int(finalize_timeout)} seconds",),
+        ).rowcount
+        expired = db.execute(
+            "UPDATE upload SET status = 'expired' WHERE status = 'open' AND created < datetime('now', ?)",
+            (f"-{int(expire_after)} seconds",),
+        ).rowcount
+    return reopened, expired
+
+
+def sweep_upload_dirs(db, upload_folder):
+    """Remove chunk directories of uploads which are not open or finalizing; returns their number."""
+    try:
+        names = os.listdir(upload_folder)
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for i in range(0, len(names), ID_BATCH_SIZE):
+        batch = names[i : i + ID_BATCH_SIZE]
+        query = f"SELECT id FROM upload WHERE status IN ('open', 'finalizing') AND id IN ({','.join('?' * len(batch))})"
+        active = {row[0] for row in db.execute(query, batch)}
+        for name in batch:
+            if name not in active:
+                shutil.rmtree(os.path.join(upload_folder, name), ignore_errors=True)
+                removed += 1
+    return removed
+
+
+def expire_mic_checks(db, ttl):
+    """Delete mic checks older than ``ttl`` seconds; returns their number."""
+    with db:
+        cur = db.execute("DELETE FROM mic_check WHERE created < datetime('now', ?)", (f"-{int(ttl)} seconds",))
+    return cur.rowcount
+
+
+def reconcile():
+    """Run all sweeps for the current app; returns what was done."""
+    config = current_app.config
+    db = get_db()
+    done = {"tmp_files": sweep_tmp(config["RECORDINGS_FOLDER"])}
+    done["idempotency_keys"] = release_keys(db, config["IDEMPOTENCY_KEY_TTL"])
+    done["reopened_uploads"], done["expired_uploads"] = reopen_uploads(
+        db, config["UPLOAD_FINALIZE_TIMEOUT"], config["UPLOAD_EXPIRE_AFTER"]
+    )
+    done["upload_dirs"] = sweep_upload_dirs(db, config["UPLOAD_FOLDER"])
+    done["mic_checks"] = expire_mic_checks(db, config["MIC_CHECK_TTL"])
+    return done
+
+
+@click.command("reconcile")
+@with_appcontext
+def reconcile_command():
+    """Remove what killed workers left behind."""
+    click.echo(", ".join(f"{name}: {count}" for name, count in reconcile().items()))
+
+
+def init_app(app):
+    """Register the command and reconcile an existing database."""
+    app.cli.add_command(reconcile_command)
+    if not app.config["RECONCILE_ON_STARTUP"] or not os.path.exists(app.config["DATABASE"]):
+        return
+    with app.app_context():
+        try:
+            done = reconcile()
+        except sqlite3.OperationalError as e:
+            # e.g. a database created before the tables used here
+            logging.warning(f"Reconciling skipped: {e!r}")
+            return
+    if any(done.values()):
+        logging.warning(f"Reconciled after killed workers: {done}")
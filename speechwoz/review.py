@@ -0,0 +1,87 @@
+"""Review queue of recordings with precomputed waveform thumbnails.
+
+The transcode workers reduce every converted WAV to ``PEAKS_WIDTH`` min/max pairs, stored
+as int8 bytes (2 KB per take) in ``recording_peaks``, which is enough to draw a waveform.
+``GET /review/queue`` pages through the transcoded recordings nobody reviewed yet in id
+order, ``after_id`` being the last id of the previous page, and returns their metadata,
+quality metrics and base64 encoded peaks without opening any audio file.
+``POST /review/<recording_id>`` with ``{"verdict": "accepted" | "rejected"}`` takes a
+recording out of the queue. Both are open to reviewers only, see ``speechwoz.annotators``.
+"""
+import base64
+
+import numpy as np
+from flask import Blueprint, abort, jsonify, request, session
+
+from speechwoz.annotators import reviewer_required
+from speechwoz.db import get_db
+
+bp = Blueprint("review", __name__, url_prefix="/review")
+
+PEAKS_WIDTH = 1000
+VERDICTS = ["accepted", "rejected"]
+
+
+def peaks(samples, width=PEAKS_WIDTH):
+    """Min and max of ``width`` equal slices of int16 ``samples`` as interleaved int8 bytes."""
+    if len(samples) == 0:
+        return b""
+    width = min(width, len(samples))
+    starts = np.arange(width) * len(samples) // width
+    pairs = np.stack([np.minimum.reduceat(samples, starts), np.maximum.reduceat(samples, starts)], axis=1)
+    return (pairs >> 8).astype(np.int8).tobytes()
+
+
+def store_peaks(db, recording_id, data):
+    """Insert or replace the peaks of a recording; commit is left to the caller."""
+    db.execute(
+        "INSERT OR REPLACE INTO recording_peaks (recording_id, width, peaks) VALUES (?, ?, ?)",
+        (recording_id, len(data) // 2, data),
+    )
+
+
+def review_queue(limit=50, after_id=0):
+    """Recordings with peaks and without a review, ordered by id."""
+    query = (
+        "SELECT recording.id, recording.url, recording.annotator_id, recording.source, recording.dialogue_id,"
+        " recording.turn_id, recording.duration, recording_peaks.width, recording_peaks.peaks,"
+        " recording_quality.snr, recording_quality.clipping_ratio, recording_quality.silence_ratio,"
+        " recording_quality.loudness"
+        " FROM recording_peaks JOIN recording ON recording.id = recording_peaks.recording_id"
+        " LEFT JOIN recording_quality ON recording_quality.recording_id = recording.id"
+        " LEFT JOIN review ON review.recording_id = recording.id"
+        " WHERE recording_peaks.recording_id > ? AND review.recording_id IS NULL"
+        " ORDER BY recording_peaks.recording_id LIMIT ?"
+    )
+    return get_db().execute(query, (after_id, limit)).fetchall()
+
+
+@bp.route("/queue")
+@reviewer_required
+def queue():
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    after_id = request.args.get("after_id", 0, type=int)
+    recordings = []
+    for row in review_queue(limit=limit, after_id=after_id):
+        rec = dict(row)
+        rec["peaks"] = base64.b64encode(rec["peaks"]).decode()
+        recordings.append(rec)
+    next_after_id = recordings[-1]["id"] if len(recordings) == limit else None
+    return jsonify(status="ok", recordings=recordings, after_id=next_after_id)
+
+
+@bp.route("/<int:recording_id>", methods=["POST"])
+@reviewer_required
+def review_recording(recording_id):
+    verdict = (request.get_json(silent=True) or {}).get("verdict")
+    if verdict not in VERDICTS:
+        return jsonify(status="unknown-verdict")
+    db = get_db()
+    if db.execute("SELECT 1 FROM recording WHERE id = ?", (recording_id,)).fetchone() is None:
+        abort(404)
+    db.execute(
+        "INSERT OR REPLACE INTO review (recording_id, reviewer, verdict) VALUES (?, ?, ?)",
+        (recording_id, session.get("ann_id"), verdict),
+    )
+    db.commit()
+    return jsonify(status="ok")
@@ -0,0 +1,125 @@
+"""Assignment of MultiWOZ dialogues to annotation sessions.
+
+Every session gets the dialogues with the lowest ``load``, i.e. the number of completed
+plus currently leased assignments, so concurrent participants spread over the corpus
+instead of all recording the first dialogues. A lease expires after
+``ASSIGNMENT_LEASE_SECONDS`` without renewal and its dialogue goes back to the pool.
+
+Dialogues are bucketed by their number of turns on the ``dialogue (n_turns, load)`` index.
+Picking a dialogue is one lookup of the least loaded dialogue per bucket that fits the
+remaining turn budget, so dialogues over the budget are never scanned and the cost grows
+with the budget, not with the corpus. It runs inside one ``BEGIN IMMEDIATE`` transaction,
+so concurrent workers never hand out the same slot twice; the views call it with
+``run_blocking`` as it may wait for the write lock of another worker.
+"""
+import time
+
+from flask import Blueprint, current_app, jsonify, session
+
+from speechwoz.concurrency import run_blocking
+from speechwoz.db import get_db
+
+bp = Blueprint("scheduler", __name__, url_prefix="/assignments")
+
+# expired leases released per assignment, keeps the sweep cost bounded
+EXPIRE_BATCH = 64
+
+
+def expire_leases(db, now, limit=EXPIRE_BATCH):
+    """Release up to ``limit`` expired leases; must be called inside a transaction."""
+    expired = db.execute(
+        "SELECT id, dialogue_id FROM assignment WHERE status = 'leased' AND expires < ? LIMIT ?",
+        (now, limit),
+    ).fetchall()
+    db.executemany("UPDATE assignment SET status = 'expired' WHERE id = ?", [(a["id"],) for a in expired])
+    db.executemany("UPDATE dialogue SET load = load - 1 WHERE id = ?", [(a["dialogue_id"],) for a in expired])
+    return len(expired)
+
+
+def active_assignments(db, session_id):
+    query = "SELECT * FROM assignment WHERE session_id = ? AND status != 'expired' ORDER BY id"
+    return db.execute(query, (session_id,)).fetchall()
+
+
+def assign(session_id, turn_budget, max_dialogues, lease_seconds):
+    """Return the assignments of the session, leasing new dialogues if it has none.
+
+    Picks up to ``max_dialogues`` least loaded dialogues whose turns fit into the
+    remaining ``turn_budget``. Calling it again renews the leases of the session."""
+    db = get_db()
+    now = time.time()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        expire_leases(db, now)
+        assignments = active_assignments(db, session_id)
+        if assignments:
+            db.execute(
+                "UPDATE assignment SET expires = ? WHERE session_id = ? AND status = 'leased'",
+                (now + lease_seconds, session_id),
+            )
+            return active_assignments(db, session_id)
+
+        chosen = []
+        budget = turn_budget
+        while len(chosen) < max_dialogues:
+            placeholders = ",".join("?" * len(chosen))
+            dialogue = db.execute(
+                "WITH RECURSIVE bucket (n_turns) AS (SELECT 1 UNION ALL SELECT n_turns + 1 FROM bucket WHERE n_turns < ?)"
+                " SELECT dialogue.id, dialogue.n_turns FROM bucket JOIN dialogue ON dialogue.id = ("
+                f"SELECT id FROM dialogue WHERE n_turns = bucket.n_turns AND id NOT IN ({placeholders})"
+                " ORDER BY load LIMIT 1) ORDER BY dialogue.load, dialogue.n_turns LIMIT 1",
+                [budget] + chosen,
+            ).fetchone()
+            if dialogue is None:
+                break
+            chosen.append(dialogue["id"])
+            budget -= dialogue["n_turns"]
+        db.executemany(
+            "INSERT INTO assignment (session_id, dialogue_id, expires) VALUES (?, ?, ?)",
+            [(session_id, d, now + lease_seconds) for d in chosen],
+        )
+        db.executemany("UPDATE dialogue SET load = load + 1 WHERE id = ?", [(d,) for d in chosen])
+        return active_assignments(db, session_id)
+
+
+def complete(session_id, dialogue_id):
+    """Mark the dialogue as recorded; its slot in ``load`` becomes permanent."""
+    db = get_db()
+    with db:
+        cur = db.execute(
+            "UPDATE assignment SET status = 'completed', completed = CURRENT_TIMESTAMP"
+            " WHERE session_id = ? AND dialogue_id = ? AND status = 'leased'",
+            (session_id, dialogue_id),
+        )
+    return cur.rowcount == 1
+
+
+def _as_json(assignments):
+    return [{"dialogue_id": a["dialogue_id"], "status": a["status"], "expires": a["expires"]} for a in assignments]
+
+
+@bp.route("", methods=["POST"])
+def get_assignments():
+    """Assign dialogues to the current session or renew its leases."""
+    session_id = session.get("session_id")
+    if session_id is None:
+        return jsonify(status="no-session")
+    config = current_app.config
+    assignments = run_blocking(
+        assign,
+        session_id,
+        config["ASSIGNMENT_TURN_BUDGET"],
+        config["ASSIGNMENT_MAX_DIALOGUES"],
+        config["ASSIGNMENT_LEASE_SECONDS"],
+    )
+    return jsonify(status="ok", assignments=_as_json(assignments))
+
+
+@bp.route("/<dialogue_id>/complete", methods=["POST"])
+def complete_assignment(dialogue_id):
+    session_id = session.get("session_id")
+    if session_id is None:
+        return jsonify(status="no-session")
+    if not run_blocking(complete, session_id, dialogue_id):
+        return jsonify(status="not-leased")
+    return jsonify(status="ok")
@@ -1,22 +1,258 @@
 -- Initialize the database.
 -- Drop any existing data and create empty tables.
 
--- DROP TABLE IF EXISTS user;
--- DROP TABLE IF EXISTS post;
+-- DROP TABLE IF EXISTS idempotency_key;
+-- DROP TABLE IF EXISTS web_session;
+-- DROP TABLE IF EXISTS ingest_file;
+-- DROP TABLE IF EXISTS recording_segment;
+-- DROP TABLE IF EXISTS export_run;
+-- DROP TABLE IF EXISTS mic_check;
+-- DROP TABLE IF EXISTS review;
+-- DROP TABLE IF EXISTS recording_peaks;
+-- DROP TABLE IF EXISTS recording_quality;
+-- DROP TABLE IF EXISTS transcode_job;
+-- DROP TABLE IF EXISTS upload;
+-- DROP TABLE IF EXISTS recording;
+-- DROP TABLE IF EXISTS assignment;
+-- DROP TABLE IF EXISTS dialogue;
+-- DROP TABLE IF EXISTS annotation_session;
+-- DROP TABLE IF EXISTS annotator;
 
--- TODO rework completely
+-- Anonymized participant, id is derived from the PROLIFIC_PID
+CREATE TABLE annotator (
+  id TEXT PRIMARY KEY,
+  role TEXT NOT NULL,
+  accepted_terms INTEGER NOT NULL DEFAULT 0,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One Prolific submission of an annotator
+CREATE TABLE annotation_session (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  annotator_id TEXT NOT NULL,
+  prolific_sessionid TEXT,
+  prolific_studyid TEXT,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  finished TIMESTAMP,
+  FOREIGN KEY (annotator_id) REFERENCES annotator (id),
+  UNIQUE (annotator_id, prolific_sessionid)
+);
+
+-- MultiWOZ dialogue used as a recording prompt,
+-- the turns are in the compiled store, see speechwoz/multiwoz.py
+CREATE TABLE dialogue (
+  id TEXT PRIMARY KEY,  -- MultiWOZ dialogue_id e.g. MUL0046.json
+  n_turns INTEGER NOT NULL,
+  recording_count INTEGER NOT NULL DEFAULT 0,
+  -- completed plus leased assignments, see speechwoz/scheduler.py
+  load INTEGER NOT NULL DEFAULT 0
+);
+
+-- buckets of dialogues by length, see speechwoz/scheduler.py
+CREATE INDEX dialogue_turns ON dialogue (n_turns, load);
+
+-- Dialogue leased to an annotation session for recording
+CREATE TABLE assignment (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  session_id INTEGER NOT NULL,
+  dialogue_id TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'leased',  -- leased, completed, expired
+  expires REAL NOT NULL,  -- unix time
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  completed TIMESTAMP,
+  FOREIGN KEY (session_id) REFERENCES annotation_session (id),
+  FOREIGN KEY (dialogue_id) REFERENCES dialogue (id)
+);
 
-CREATE TABLE user (
+CREATE INDEX assignment_session ON assignment (session_id);
+CREATE INDEX assignment_expires ON assignment (status, expires);
+
+-- Stored file content, see speechwoz/storage.py
+CREATE TABLE blob (
+  sha256 TEXT PRIMARY KEY,
+  path TEXT NOT NULL,
+  relpath TEXT NOT NULL,  -- relative to RECORDINGS_FOLDER
+  size INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+
+-- Audio take stored under RECORDINGS_FOLDER
+CREATE TABLE recording (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  annotator_id TEXT NOT NULL,
+  session_id INTEGER,
+  dialogue_id TEXT,
+  turn_id INTEGER,
+  source TEXT NOT NULL,  -- e.g. onboarding
+  path TEXT NOT NULL,
+  url TEXT NOT NULL,
+  blob TEXT,  -- content of the take
+  wav_path TEXT,  -- set once transcoded
+  duration REAL,
+  export_run INTEGER,  -- set once exported, see speechwoz/export.py
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (annotator_id) REFERENCES annotator (id),
+  FOREIGN KEY (session_id) REFERENCES annotation_session (id),
+  FOREIGN KEY (dialogue_id) REFERENCES dialogue (id),
+  FOREIGN KEY (blob) REFERENCES blob (sha256)
+);
+
+CREATE INDEX recording_annotator ON recording (annotator_id, created);
+CREATE INDEX recording_dialogue ON recording (dialogue_id, turn_id);
+CREATE INDEX recording_created ON recording (created);
+CREATE INDEX recording_unexported ON recording (id) WHERE export_run IS NULL;
+-- one recording per take of an annotator, retried uploads resolve to it
+CREATE UNIQUE INDEX recording_blob ON recording (blob, annotator_id, source) WHERE blob IS NOT NULL;
+
+-- Chunked upload in progress, see speechwoz/upload.py
+CREATE TABLE upload (
+  id TEXT PRIMARY KEY,
+  annotator_id TEXT NOT NULL,
+  source TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'open',  -- open, finalizing, done, expired, rejected
+  num_chunks INTEGER,
+  recording_id INTEGER,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  claimed TIMESTAMP,  -- by the finalizing request
+  finished TIMESTAMP,
+  FOREIGN KEY (recording_id) REFERENCES recording (id)
+);
+
+CREATE INDEX upload_status ON upload (status, created);
+
+-- Conversion of uploads to canonical WAV, see speechwoz/transcode.py
+CREATE TABLE transcode_job (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
-  username TEXT UNIQUE NOT NULL,
-  password TEXT NOT NULL
+  recording_id INTEGER,
+  src_path TEXT NOT NULL,
+  dst_path TEXT NOT NULL,
+  sample_rate INTEGER NOT NULL,
+  status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done, failed
+  attempts INTEGER NOT NULL DEFAULT 0,
+  error TEXT,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  started TIMESTAMP,
+  finished TIMESTAMP,
+  -- statistics of the converted WAV
+  duration REAL,
+  rms REAL,
+  peak REAL,
+  clipping_ratio REAL,
+  FOREIGN KEY (recording_id) REFERENCES recording (id)
 );
 
-CREATE TABLE post (
+CREATE INDEX transcode_job_status ON transcode_job (status, id);
+CREATE INDEX transcode_job_recording ON transcode_job (recording_id, status);
+
+-- Lhotse manifest export, see speechwoz/export.py
+CREATE TABLE export_run (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
-  author_id INTEGER NOT NULL,
+  outdir TEXT NOT NULL,
+  num_cuts INTEGER,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  finished TIMESTAMP
+);
+
+-- Computed by the transcode workers, see speechwoz/quality.py
+CREATE TABLE recording_quality (
+  recording_id INTEGER PRIMARY KEY,
+  snr REAL,  -- dB
+  clipping_ratio REAL,
+  silence_ratio REAL,
+  loudness REAL,  -- dBFS of non-silent frames
+  leading_silence REAL,  -- seconds
+  trailing_silence REAL,  -- seconds
+  computed TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (recording_id) REFERENCES recording (id)
+);
+
+CREATE INDEX recording_quality_snr ON recording_quality (snr);
+CREATE INDEX recording_quality_clipping ON recording_quality (clipping_ratio);
+CREATE INDEX recording_quality_silence ON recording_quality (silence_ratio);
+CREATE INDEX recording_quality_loudness ON recording_quality (loudness);
+
+-- Running state of a live microphone check, see speechwoz/miccheck.py
+CREATE TABLE mic_check (
+  id TEXT PRIMARY KEY,
+  annotator_id TEXT NOT NULL,
+  sample_rate INTEGER,
+  samples INTEGER NOT NULL DEFAULT 0,
+  clipped INTEGER NOT NULL DEFAULT 0,
+  histogram BLOB NOT NULL,  -- int64 counts of 1 dB frame level bins
+  tail BLOB,  -- int16 samples of the last incomplete frame
+  verdict TEXT,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  updated TIMESTAMP,
+  FOREIGN KEY (annotator_id) REFERENCES annotator (id)
+);
+
+CREATE INDEX mic_check_created ON mic_check (created);
+
+-- Waveform thumbnail computed by the transcode workers, see speechwoz/review.py
+CREATE TABLE recording_peaks (
+  recording_id INTEGER PRIMARY KEY,  -- keyset of the review queue
+  width INTEGER NOT NULL,
+  peaks BLOB NOT NULL,  -- width interleaved (min, max) int8 pairs
+  FOREIGN KEY (recording_id) REFERENCES recording (id)
+);
+
+CREATE TABLE review (
+  recording_id INTEGER PRIMARY KEY,
+  reviewer TEXT,
+  verdict TEXT NOT NULL,  -- accepted, rejected
   created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  title TEXT NOT NULL,
-  body TEXT NOT NULL,
-  FOREIGN KEY (author_id) REFERENCES user (id)
+  FOREIGN KEY (recording_id) REFERENCES recording (id)
+);
+
+-- Turns of a long recording, e.g. the cuts of a Streamlit prototype take, see speechwoz/ingest.py
+CREATE TABLE recording_segment (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  recording_id INTEGER NOT NULL,
+  cut_id TEXT NOT NULL,
+  start REAL NOT NULL,  -- seconds from the start of the recording
+  duration REAL NOT NULL,
+  dialogue_id TEXT,
+  turn_id INTEGER,
+  speaker TEXT,  -- MultiWOZ speaker of the turn
+  text TEXT,
+  FOREIGN KEY (recording_id) REFERENCES recording (id)
 );
+
+CREATE UNIQUE INDEX recording_segment_cut ON recording_segment (recording_id, cut_id);
+
+-- Files registered by the batch ingest; a file is skipped while its size and mtime match
+CREATE TABLE ingest_file (
+  path TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  status TEXT NOT NULL,  -- done, failed
+  recording_id INTEGER,
+  error TEXT,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (recording_id) REFERENCES recording (id)
+) WITHOUT ROWID;
+
+-- Server-side session data, see speechwoz/sessions.py
+CREATE TABLE web_session (
+  id TEXT PRIMARY KEY,
+  version INTEGER NOT NULL,  -- incremented by every write, also stored in the cookie
+  data TEXT NOT NULL,  -- tagged JSON like Flask's cookie sessions
+  expires REAL NOT NULL  -- unix time
+) WITHOUT ROWID;
+
+CREATE INDEX web_session_expires ON web_session (expires);
+
+-- Results of requests sent with an Idempotency-Key header, see speechwoz/idempotency.py
+CREATE TABLE idempotency_key (
+  annotator_id TEXT NOT NULL,
+  endpoint TEXT NOT NULL,
+  key TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',  -- pending, done
+  owner INTEGER NOT NULL,  -- pid of the process serving the first request
+  response TEXT,  -- JSON body returned to every retry
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (annotator_id, endpoint, key)
+) WITHOUT ROWID;
+
+CREATE INDEX idempotency_key_created ON idempotency_key (created);
+CREATE INDEX idempotency_key_pending ON idempotency_key (owner) WHERE status = 'pending';
@@ -0,0 +1,42 @@
+"""Cooperative serving mode with gevent.
+
+A sync gunicorn worker is pinned by a slow upload for its whole duration, so a few mobile
+uploads stall every page. With gevent workers each request is a greenlet and waiting for
+upload bytes just yields to the other requests. File writes and SQLite calls, which gevent
+cannot make cooperative, go through ``speechwoz.concurrency.run_blocking`` to a native
+thread pool of ``ASYNC_THREADPOOL_SIZE`` threads.
+
+    # From repo root
+    SCRIPT_NAME=/namuddis/speechwoz gunicorn speechwoz.serve:app -k gevent --worker-connections 500 -w 4
+
+    # or a single process without gunicorn
+    python -m speechwoz.serve --bind 127.0.0.1:8090
+"""
+from gevent import monkey
+
+if not monkey.is_module_patched("socket"):
+    # gunicorn's gevent worker has already patched before loading us
+    monkey.patch_all()
+
+import argparse  # noqa: E402
+
+import gevent  # noqa: E402
+
+from speechwoz.app import app  # noqa: E402
+
+gevent.get_hub().threadpool.maxsize = app.config["ASYNC_THREADPOOL_SIZE"]
+
+
+def main():
+    from gevent.pywsgi import WSGIServer
+
+    parser = argparse.ArgumentParser(description="Serve speechwoz with gevent.")
+    parser.add_argument("--bind", default="127.0.0.1:5000", help="host:port")
+    args = parser.parse_args()
+    host, port = args.bind.rsplit(":", 1)
+    print(f"Serving on http://{host}:{port}")
+    WSGIServer((host, int(port)), app).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Server-side sessions stored in SQLite.
+
+With ``SESSION_STORE = "sqlite"`` the session cookie holds only ``<id>.<version>``: a random
+id and the version of the session data last written. The data itself is serialized like
+Flask's cookie sessions (tagged JSON) into the ``web_session`` table, so the cookie stays
+small however much progress state a session keeps, and nothing is signed or verified.
+
+Sessions are read through an in-process LRU cache of ``SESSION_CACHE_SIZE`` entries. A cached
+session is used only while its version equals the one in the cookie; another worker process
+which changed the session has sent the browser a new version, so stale entries are never
+served. Reading a session costs a dict lookup and a shallow copy, independent of its size;
+the data is only serialized and written when the request modified it. As with cookie
+sessions, nested values must be assigned again (or ``session.modified`` set) to be stored.
+
+Sessions expire ``PERMANENT_SESSION_LIFETIME`` after their last write; the expiry is pushed
+forward at most once per half of that time. Expired rows are deleted in small batches every
+``SESSION_GC_INTERVAL`` seconds by the worker serving a request.
+"""
+import collections
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+from speechwoz.concurrency import run_blocking
+from speechwoz.db import get_db
+
+# expired rows deleted per statement, so the write lock is held briefly
+GC_BATCH_SIZE = 1000
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+_last_gc = {}
+
+
+class ServerSession(SecureCookieSession):
+    """Session data with the id and version it was loaded with; ``sid`` is None until stored."""
+
+    def __init__(self, initial=None, sid=None, version=0, expires=0.0):
+        super().__init__(initial)
+        self.sid = sid
+        self.version = version
+        self.expires = expires
+
+
+class SQLiteSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def open_session(self, app, request):
+        sid, _, version = request.cookies.get(self.get_cookie_name(app), "").partition(".")
+        if not sid or not version.isdigit():
+            return ServerSession()
+        return run_blocking(self.load, app, sid, int(version))
+
+    def load(self, app, sid, version):
+        now = time.time()
+        key = (app.config["DATABASE"], sid)
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                _cache.move_to_end(key)
+                return ServerSession(entry[2], sid, version, entry[1])
+        row = get_db().execute("SELECT * FROM web_session WHERE id = ? AND expires > ?", (sid, now)).fetchone()
+        if row is None:
+            return ServerSession()
+        data = self.serializer.loads(row["data"])
+        self.cache(app, key, (row["version"], row["expires"], data))
+        return ServerSession(data, sid, row["version"], row["expires"])
+
+    def cache(self, app, key, entry):
+        with _cache_lock:
+            _cache[key] = entry
+            _cache.move_to_end(key)
+            while len(_cache) > app.config["SESSION_CACHE_SIZE"]:
+                _cache.popitem(last=False)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if not session:
+            if session.sid is not None:
+                run_blocking(self.delete, app, session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly
+                )
+            return
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        ttl = app.permanent_session_lifetime.total_seconds()
+        if session.modified or session.sid is None:
+            run_blocking(self.store, app, session, time.time() + ttl)
+        elif session.expires - time.time() < ttl / 2:
+            run_blocking(self.touch, app, session, time.time() + ttl)
+        elif not (session.permanent and app.config["SESSION_REFRESH_EACH_REQUEST"]):
+            return
+        response.set_cookie(
+            name,
+            f"{session.sid}.{session.version}",
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+
+    def store(self, app, session, expires):
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires = expires
+        data = dict(session)
+        db = get_db()
+        with db:
+            # the version comes from the row, so concurrent writes of a session never share one
+            db.execute(
+                "INSERT INTO web_session (id, version, data, expires) VALUES (?, 1, ?, ?)"
+                " ON CONFLICT (id) DO UPDATE SET version = version + 1, data = excluded.data,"
+                " expires = excluded.expires",
+                (session.sid, self.serializer.dumps(data), expires),
+            )
+            session.version = db.execute("SELECT version FROM web_session WHERE id = ?", (session.sid,)).fetchone()[0]
+        self.cache(app, (app.config["DATABASE"], session.sid), (session.version, expires, data))
+        self.collect_garbage(app)
+
+    def touch(self, app, session, expires):
+        db = get_db()
+        with db:
+            db.execute("UPDATE web_session SET expires = ? WHERE id = ?", (expires, session.sid))
+        session.expires = expires
+        self.cache(app, (app.config["DATABASE"], session.sid), (session.version, expires, dict(session)))
+
+    def delete(self, app, sid):
+        db = get_db()
+        with db:
+            db.execute("DELETE FROM web_session WHERE id = ?", (sid,))
+        with _cache_lock:
+            _cache.pop((app.config["DATABASE"], sid), None)
+
+    def collect_garbage(self, app):
+        now = time.time()
+        database = app.config["DATABASE"]
+        if now - _last_gc.get(database, 0) < app.config["SESSION_GC_INTERVAL"]:
+            return
+        _last_gc[database] = now
+        db = get_db()
+        while True:
+            with db:
+                cur = db.execute(
+                    "DELETE FROM web_session WHERE id IN (SELECT id FROM web_session WHERE expires <= ? LIMIT ?)",
+                    (now, GC_BATCH_SIZE),
+                )
+            if cur.rowcount < GC_BATCH_SIZE:
+                return
+
+
+def init_app(app):
+    if app.config["SESSION_STORE"] == "sqlite":
+        app.session_interface = SQLiteSessionInterface()
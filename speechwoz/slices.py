@@ -0,0 +1,143 @@
+"""Time slices of stored PCM WAV files, e.g. one turn of a long prototype take.
+
+``GET /slices/<path>?start=12.5&duration=3.2`` returns a WAV of that part of a file in
+RECORDINGS_FOLDER, so a player fetches one turn (see ``recording_segment``) instead of the
+whole recording. The file is memory-mapped and the response is a new header followed by
+the samples copied straight out of the map: nothing is decoded and only the pages of the
+slice are read from disk.
+
+Maps of recently sliced files stay open in an LRU of ``SLICE_OPEN_MAPS`` entries per process,
+so slicing the turns of a take one after another parses its header and maps it once. A map
+dropped from the LRU is closed when the last slice being copied out of it is done.
+"""
+import collections
+import mmap
+import os
+import struct
+import threading
+
+from flask import Blueprint, abort, current_app, request, url_for
+from werkzeug.security import safe_join
+
+from speechwoz.concurrency import run_blocking
+from speechwoz.storage import BLOB_DIR, TMP_DIR
+
+bp = Blueprint("slices", __name__, url_prefix="/slices")
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_maps = collections.OrderedDict()
+_maps_lock = threading.Lock()
+
+
+class WavMap:
+    """A memory-mapped PCM WAV file and the position of its samples."""
+
+    def __init__(self, path):
+        with open(path, "rb") as r:
+            self.map = mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != b"RIFF" or self.map[8:12] != b"WAVE":
+            raise ValueError(f"{path}: not a WAV file")
+        self.fmt = self.data_offset = None
+        pos = 12
+        while pos + 8 <= len(self.map):
+            chunk, size = struct.unpack_from("<4sI", self.map, pos)
+            if chunk == b"fmt ":
+                self.fmt = struct.unpack_from("<HHIIHH", self.map, pos + 8)
+                if self.fmt[0] == WAVE_FORMAT_EXTENSIBLE:
+                    # the format code starts the subformat GUID
+                    self.fmt = struct.unpack_from("<H", self.map, pos + 32) + self.fmt[1:]
+            elif chunk == b"data":
+                self.data_offset = pos + 8
+                # writers which were not closed leave 0 or a too large size
+                self.data_size = len(self.map) - self.data_offset
+                if 0 < size < self.data_size:
+                    self.data_size = size
+                break
+            pos += 8 + size + size % 2
+        if self.fmt is None or self.data_offset is None or self.fmt[0] != WAVE_FORMAT_PCM:
+            raise ValueError(f"{path}: not a PCM WAV file")
+        _, self.channels, self.rate, self.byte_rate, self.block_align, self.bits = self.fmt
+
+    def slice(self, start, duration):
+        """Header and samples of a WAV of ``duration`` seconds from ``start``, clipped to the recording."""
+        frames = self.data_size // self.block_align
+        first = min(int(round(start * self.rate)), frames)
+        last = min(first + int(round(duration * self.rate)), frames)
+        begin = self.data_offset + first * self.block_align
+        data = self.map[begin : begin + (last - first) * self.block_align]
+        header = struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF",
+            36 + len(data),
+            b"WAVE",
+            b"fmt ",
+            16,
+            WAVE_FORMAT_PCM,
+            self.channels,
+            self.rate,
+            self.byte_rate,
+            self.block_align,
+            self.bits,
+            b"data",
+            len(data),
+        )
+        return header, data
+
+
+def open_map(path):
+    """The map of a WAV file from the LRU, opened on a miss or when the file changed."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _maps_lock:
+        if key in _maps:
+            _maps.move_to_end(key)
+            return _maps[key]
+    wav = WavMap(path)
+    with _maps_lock:
+        _maps[key] = wav
+        while len(_maps) > current_app.config["SLICE_OPEN_MAPS"]:
+            _maps.popitem(last=False)
+    return wav
+
+
+@bp.app_template_global()
+def slice_url(wav_path, start, duration):
+    """URL of a slice of a file stored under RECORDINGS_FOLDER, e.g. a ``recording.wav_path``."""
+    filename = os.path.relpath(wav_path, current_app.config["RECORDINGS_FOLDER"])
+    return url_for("slices.serve", filename=filename, start=f"{start:.3f}", duration=f"{duration:.3f}")
+
+
+@bp.route("/<path:filename>")
+def serve(filename):
+    start = request.args.get("start", type=float)
+    duration = request.args.get("duration", type=float)
+    if start is None or duration is None or start < 0 or not 0 < duration <= current_app.config["SLICE_MAX_SECONDS"]:
+        abort(400)
+    path = safe_join(current_app.config["RECORDINGS_FOLDER"], filename)
+    if path is None or filename.startswith(TMP_DIR + "/") or not os.path.isfile(path):
+        abort(404)
+    try:
+        # parsing the header touches the disk
+        wav = run_blocking(open_map, path)
+    except ValueError:
+        abort(415)
+    blob = filename.startswith(BLOB_DIR + "/")
+    # blobs and files derived from them are named by their content, other files may change
+    version = os.path.basename(filename) if blob else f"{len(wav.map):x}-{os.stat(path).st_mtime_ns:x}"
+    etag = f"{version}-{start}-{duration}"
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        header, data = run_blocking(wav.slice, start, duration)
+        response = current_app.response_class([header, data], mimetype="audio/wav")
+        response.content_length = len(header) + len(data)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    if blob:
+        response.cache_control.max_age = current_app.config["MEDIA_MAX_AGE"]
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
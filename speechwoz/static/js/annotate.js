@@ -0,0 +1,18 @@
+// Annotation interface, templates/annotate.html; multiwozdb and terminal_history are set there.
+
+// readonly during
+if (role() !== ROLE_AGENT) {
+  window.multiwozdb = null;
+}
+
+window.current_conversation = null;
+window.microphone_recording = false;
+// telephone_number_state: unknown -> filled -> verified (after accepting call with that number)
+window.telephone_number_state = "unknown";
+window.conversations = {};
+
+// stores unsaved conversations before are submitted to server
+// conversations
+// stores all relevant events
+// conversations =
+//   { {"id": "1", "audio_len": XY, "agent_id": "null or hash(+420XY)", "caller_id": "null or hash(+420XY)", agent_queries
@@ -0,0 +1,112 @@
+// Registration and onboarding, templates/index.html; the URLs are set there.
+document.getElementById("role").innerHTML = role();
+document.getElementById("twilio_number").innerHTML = twilio_number;
+
+navigator
+    .mediaDevices
+    .getUserMedia({audio: true})
+    .then(stream => { handlerFunction(stream) });
+
+function handlerFunction(stream) {
+    micStream = stream;
+    rec = new MediaRecorder(stream);
+    rec.ondataavailable = e => {
+        // chunks are uploaded while recording, the take is assembled on the server
+        upload.push(e.data);
+        if (rec.state == "inactive") {
+            // the server keeps only takes which passed the live mic check
+            micCheck.stop().then(() => micCheck.checkId).then(checkId => finishOnboarding(upload, checkId));
+        }
+    }
+}
+
+const MIC_CHECK_MESSAGES = {
+    "listening": "Checking your microphone, keep talking...",
+    "ok": "Your microphone setup sounds good.",
+    "too-quiet": "You are too quiet. Move closer to the microphone or raise its volume.",
+    "noisy": "There is too much background noise. Find a quiet place.",
+    "clipping": "Your recording is distorted. Lower the microphone volume or move away from it.",
+}
+
+function showMicCheck(report) {
+    const message = MIC_CHECK_MESSAGES[report["verdict"]] || report["status"];
+    const level = report["level"] === null ? "" : " [level " + Math.round(report["level"]) + " dB]";
+    document.getElementById("mic-check").innerText = message + level;
+}
+
+function numOnboardingSamples() {
+  const container = document.getElementById('recorded-container');
+  return container.children.length;
+}
+
+function createSampleDiv(audio_src) {
+  recorded_url = audio_src;
+  console.log("New recorded onboarding: " + recorded_url)
+  divhtml  = "<div class='sample'>Sample " +
+    (numOnboardingSamples() + 1)+
+    " <strong>Listen to your recording and re-record if the quality is not good!</strong><br>" +
+    "<audio controls='controls' src='" + recorded_url + "'></audio>" +
+    "</div>"
+  return divhtml
+}
+
+function finishOnboarding(upload, checkId) {
+    upload.finish({mic_check: checkId}).then(function(data) {
+        console.log(data);
+        if (data["status"] == "mic-check-failed") {
+            alert("Your microphone setup did not pass the check. Fix it and record again!");
+            return;
+        }
+        rec_container = document.getElementById("recorded-container")
+        rec_container.innerHTML = rec_container.innerHTML + "\n" + createSampleDiv(data["path"])
+    });
+}
+
+startRecording.onclick = e => {
+    console.log('Recording are started..');
+    startRecording.disabled = true;
+    stopRecording.disabled = false;
+    upload = new ChunkedUpload(prefix_upload_onboarding);
+    micCheck = new MicCheck(prefix_mic_check, micStream, showMicCheck);
+    // emit a chunk every second
+    rec.start(1000);
+};
+
+stopRecording.onclick = e => {
+    console.log("Recording are stopped.");
+    startRecording.disabled = false;
+    stopRecording.disabled = true;
+    rec.stop();
+};
+
+agent_instructions = document.getElementById("role-instructions-agent")
+if (role() == ROLE_AGENT) {
+  agent_instructions.visible = true
+} else {
+  agent_instructions.visible = true
+}
+
+caller_instructions = document.getElementById("role-instructions-caller")
+if (role() == ROLE_AGENT) {
+  caller_instructions.visible = true
+} else {
+  caller_instructions.visible = true
+}
+
+document.accepted_terms = false;
+function accept_terms_onclick() {
+  document.accepted_terms = true
+  accept_terms_button = document.getElementById("accept_terms")
+  accept_terms_button.innerText = accept_terms_button.innerText + " [Accepted]"
+  accept_terms_button.disabled = document.accepted_terms;
+
+}
+
+function check_go_annotate_link() {
+  if ((document.accepted_terms && (numOnboardingSamples() > 1))) {
+    return true
+  } else {
+    alert("You must agree to the terms and record a sample with your audio setup and listen to a recording to verify you have a good audio setup! ACCEPT TERMS and START RECORDING by clicking 'Start recording' buttong!")
+    return false
+  }
+}
@@ -1 +1,133 @@
 console.log("speechwoz js loaded")
+
+// ---------- data declaration and helper functions --------- //
+// page data (annotator_info, mode, ...) is set in templates/base.html
+const ANN_UNKNOWN = "ANN_UNKNOWN"
+const ROLE_UNKNOWN = "ROLE_UNKNOWN"
+const ROLE_AGENT = "ROLE_AGENT"
+const ROLE_CALLER = "ROLE_CALLER"
+
+const MODE_REGISTRATION = "MODE_REGISTRATION"  // registration not done
+const MODE_READING = "MODE_READING"  // registration is done but cannot be in mode_conversation
+const MODE_CONVERSATION = "MODE_CONVERSATION" // registration is done; both agent and caller connected and onboarded and all other conditions
+const MODE_SURVEY = "MODE_CONVERSATION"  // all job done but cannot be logout yet --> after the user has to go to registration again
+
+window.annotator_info = {id: ANN_UNKNOWN, role: ROLE_UNKNOWN}
+
+function role() { return window.annotator_info['role']; }
+function ann_id() { return window.annotator_info['id']; }
+
+// TODO variables to be used for task management
+// key: prolific_pid value: studyid
+window.waiting_pids = {}
+
+
+  // ----- UI & Data presentation -----/
+window.onload = function () {
+  document.getElementById("ann_id").innerHTML = ann_id();
+
+}
+
+// Resumable chunked upload, see speechwoz/upload.py for the server side.
+// Usage: up = new ChunkedUpload(prefix_upload_onboarding); up.push(blob) for every
+// MediaRecorder chunk; up.finish({mic_check: checkId}).then(data => data["path"])
+class ChunkedUpload {
+  constructor(url, retries = 5) {
+    this.url = url;
+    this.retries = retries;
+    this.numChunks = 0;
+    this.pending = [];
+    // retries of opening and of finalizing get the first response, see speechwoz/idempotency.py
+    this.openKey = crypto.randomUUID();
+    this.finishKey = crypto.randomUUID();
+    this.uploadId = this.retry(() => fetch(url, {method: "POST", headers: {"Idempotency-Key": this.openKey}})
+      .then(this.json))
+      .then(data => data["upload_id"]);
+  }
+
+  json(response) {
+    return response.json().then(data => {
+      // the first request with the key is still running
+      if (data["status"] == "in-progress") { throw new Error("in progress"); }
+      return data;
+    });
+  }
+
+  retry(request) {
+    const attempt = (n) => request().catch(err => {
+      if (n <= 0) { throw err; }
+      return new Promise(resolve => setTimeout(resolve, 500 * (this.retries - n + 1)))
+        .then(() => attempt(n - 1));
+    });
+    return attempt(this.retries);
+  }
+
+  push(blob) {
+    const index = this.numChunks++;
+    this.pending.push(this.uploadId.then(id => this.retry(() =>
+      fetch(this.url + "/" + id + "/" + index, {method: "PUT", body: blob}).then(r => {
+        if (!r.ok) { throw new Error("chunk " + index + " failed: " + r.status); }
+        return r.json();
+      }))));
+  }
+
+  finish(fields = {}) {
+    return Promise.all(this.pending)
+      .then(() => this.uploadId)
+      .then(id => this.retry(() => fetch(this.url + "/" + id + "/finalize", {
+        method: "POST",
+        headers: {"Idempotency-Key": this.finishKey, "Content-Type": "application/json"},
+        body: JSON.stringify({...fields, num_chunks: this.numChunks}),
+      }).then(this.json)));
+  }
+};
+
+// Live microphone check, see speechwoz/miccheck.py for the server side.
+// Usage: check = new MicCheck(prefix_mic_check, stream, report => ...); ...; check.stop().then(...)
+var MicCheck = class {
+  constructor(url, stream, onReport, blockSeconds = 0.25) {
+    this.url = url;
+    this.onReport = onReport;
+    this.buffers = [];
+    this.buffered = 0;
+    this.sending = Promise.resolve();
+    this.context = new AudioContext();
+    this.blockSize = Math.round(this.context.sampleRate * blockSeconds);
+    this.source = this.context.createMediaStreamSource(stream);
+    this.processor = this.context.createScriptProcessor(4096, 1, 1);
+    this.processor.onaudioprocess = e => this.collect(e.inputBuffer.getChannelData(0));
+    this.source.connect(this.processor);
+    this.processor.connect(this.context.destination);
+    this.checkId = fetch(url, {method: "POST"})
+      .then(r => r.json())
+      .then(data => data["check_id"]);
+  }
+
+  collect(floats) {
+    const pcm = new Int16Array(floats.length);
+    for (let i = 0; i < floats.length; i++) {
+      pcm[i] = Math.max(-32768, Math.min(32767, Math.round(floats[i] * 32768)));
+    }
+    this.buffers.push(pcm);
+    this.buffered += pcm.length;
+    if (this.buffered >= this.blockSize) {
+      const block = new Blob(this.buffers);
+      this.buffers = [];
+      this.buffered = 0;
+      // one block at a time, the server updates the running state in order
+      this.sending = this.sending
+        .then(() => this.checkId)
+        .then(id => fetch(this.url + "/" + id + "?rate=" + this.context.sampleRate, {method: "POST", body: block}))
+        .then(r => r.json())
+        .then(this.onReport)
+        .catch(err => console.log(err));
+    }
+  }
+
+  stop() {
+    this.processor.disconnect();
+    this.source.disconnect();
+    this.context.close();
+    return this.sending;
+  }
+};
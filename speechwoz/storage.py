@@ -0,0 +1,129 @@
+"""Content-addressed storage of recordings.
+
+Takes are hashed with SHA-256 while they are written and stored once per content at
+``RECORDINGS_FOLDER/blobs/<h[:2]>/<h[2:4]>/<h><ext>``, so directories stay small (at most
+256 subdirectories per level) regardless of the number of takes, and names do not depend on
+the annotator. The ``blob`` table maps a hash to its file and every recording refers to its
+blob; a retried upload of the same take by the same annotator and source resolves to the
+already stored recording instead of creating a duplicate.
+
+Files are written crash-safe: into a temporary file in ``blobs/tmp/``, which is never served,
+then fsynced and renamed to their address, and the directory entry is fsynced before the
+blob row is committed. A killed worker leaves at most a temporary file named after its pid,
+removed by the startup reconciler (see ``speechwoz.reconcile``).
+"""
+import hashlib
+import os
+import uuid
+
+from flask import current_app, url_for
+
+from speechwoz.concurrency import run_blocking
+from speechwoz.db import get_db
+
+BLOB_DIR = "blobs"
+TMP_DIR = os.path.join(BLOB_DIR, "tmp")
+
+
+def blob_relpath(sha256, ext):
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256 + ext)
+
+
+def tmp_path(root):
+    """A new temporary file name under ``root`` (RECORDINGS_FOLDER), starting with the writer's pid."""
+    tmpdir = os.path.join(root, TMP_DIR)
+    os.makedirs(tmpdir, exist_ok=True)
+    return os.path.join(tmpdir, f"{os.getpid()}-{uuid.uuid4().hex}")
+
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish(tmp, path):
+    """Durably move the completely written file ``tmp`` to ``path``; readers see all of it or nothing."""
+    fd = os.open(tmp, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp, path)
+    fsync_dir(os.path.dirname(path))
+
+
+class BlobWriter:
+    """File-like writer which hashes the content and moves it to its address on ``commit``.
+
+    Used as a context manager the temporary file is removed unless committed."""
+
+    def __init__(self, ext):
+        self.ext = ext
+        self.root = current_app.config["RECORDINGS_FOLDER"]
+        self.tmp = tmp_path(self.root)
+        self.file = open(self.tmp, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, block):
+        self.hash.update(block)
+        self.file.write(block)
+        self.size += len(block)
+
+    def commit(self):
+        """Store the blob unless the same content is stored already; returns its ``blob`` row."""
+        self.file.close()
+        sha256 = self.hash.hexdigest()
+        relpath = blob_relpath(sha256, self.ext)
+        path = os.path.join(self.root, relpath)
+        if os.path.exists(path):
+            os.remove(self.tmp)
+        else:
+            publish(self.tmp, path)
+        db = get_db()
+        db.execute(
+            "INSERT INTO blob (sha256, path, relpath, size) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            (sha256, path, relpath, self.size),
+        )
+        db.commit()
+        return get_blob(sha256)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def store_stream(stream, ext):
+    """Copy a request body stream into a blob block by block; returns the ``blob`` row."""
+    buffer_size = current_app.config["UPLOAD_BUFFER_SIZE"]
+    with BlobWriter(ext) as w:
+        while True:
+            block = stream.read(buffer_size)
+            if not block:
+                break
+            # hashing and writing would block the event loop of cooperative workers
+            run_blocking(w.write, block)
+        return run_blocking(w.commit)
+
+
+def blob_url(blob):
+    return url_for("media.serve", filename=blob["relpath"])
+
+
+def get_blob(sha256):
+    return get_db().execute("SELECT * FROM blob WHERE sha256 = ?", (sha256,)).fetchone()
+
+
+def find_recording(annotator_id, source, sha256):
+    """The recording of the blob stored for the annotator and source, if any."""
+    query = "SELECT * FROM recording WHERE blob = ? AND annotator_id = ? AND source = ?"
+    return get_db().execute(query, (sha256, annotator_id, source)).fetchone()
@@ -0,0 +1,230 @@
+"""Background conversion of uploaded recordings to canonical WAV.
+
+Uploads only enqueue a row into the ``transcode_job`` table so the request returns
+immediately. ``flask --app speechwoz transcode`` runs a pool of worker processes which
+convert queued uploads with the configured encoder to mono 16-bit PCM WAV next to the
+upload, store duration, RMS, peak and clipping statistics of the result and its quality
+metrics (see ``speechwoz.quality``) and waveform peaks (see ``speechwoz.review``).
+"""
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from speechwoz import audio, quality, review, storage
+from speechwoz.db import get_db
+
+
+def wav_path(src_path, sample_rate):
+    """E.g. ``take.mp3`` -> ``take.16k.wav``; never the upload itself even if it is a WAV."""
+    return f"{os.path.splitext(src_path)[0]}.{sample_rate // 1000}k.wav"
+
+
+def enqueue(src_path, recording_id=None, commit=True):
+    """Queue conversion of ``src_path``; cheap enough to be called from a request."""
+    db = get_db()
+    sample_rate = current_app.config["TRANSCODE_SAMPLE_RATE"]
+    cur = db.execute(
+        "INSERT INTO transcode_job (recording_id, src_path, dst_path, sample_rate) VALUES (?, ?, ?, ?)",
+        (recording_id, src_path, wav_path(src_path, sample_rate), sample_rate),
+    )
+    if commit:
+        db.commit()
+    return cur.lastrowid
+
+
+def claim_jobs(db, limit):
+    """Mark up to ``limit`` queued jobs as running and return them.
+
+    The write lock taken by ``BEGIN IMMEDIATE`` makes claiming safe with several pools."""
+    if limit <= 0:
+        return []
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        jobs = db.execute(
+            "SELECT id, src_path, dst_path, sample_rate FROM transcode_job"
+            " WHERE status = 'queued' ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+        db.executemany(
+            "UPDATE transcode_job SET status = 'running', attempts = attempts + 1, started = CURRENT_TIMESTAMP"
+            " WHERE id = ?",
+            [(job["id"],) for job in jobs],
+        )
+    return jobs
+
+
+def finish_job(db, job_id, stats, metrics, peaks):
+    with db:
+        db.execute(
+            "UPDATE transcode_job SET status = 'done', finished = CURRENT_TIMESTAMP, error = NULL,"
+            " duration = :duration, rms = :rms, peak = :peak, clipping_ratio = :clipping_ratio"
+            " WHERE id = :id",
+            dict(stats, id=job_id),
+        )
+        db.execute(
+            "UPDATE recording SET (wav_path, duration) = (SELECT dst_path, duration FROM transcode_job WHERE id = ?)"
+            " WHERE id = (SELECT recording_id FROM transcode_job WHERE id = ?)",
+            (job_id, job_id),
+        )
+        recording_id = db.execute("SELECT recording_id FROM transcode_job WHERE id = ?", (job_id,)).fetchone()[0]
+        if recording_id is not None:
+            quality.store(db, recording_id, metrics)
+            review.store_peaks(db, recording_id, peaks)
+
+
+def fail_job(db, job_id, error, max_attempts):
+    """Put the job back to the queue unless it already failed ``max_attempts`` times."""
+    with db:
+        db.execute(
+            "UPDATE transcode_job SET error = ?, finished = CURRENT_TIMESTAMP,"
+            " status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END"
+            " WHERE id = ?",
+            (error, max_attempts, job_id),
+        )
+
+
+def requeue_stale(db, older_than):
+    """Return jobs left running by a killed pool to the queue."""
+    with db:
+        cur = db.execute(
+            "UPDATE transcode_job SET status = 'queued' WHERE status = 'running' AND started < datetime('now', ?)",
+            (f"-{int(older_than)} seconds",),
+        )
+    return cur.rowcount
+
+
+def release_jobs(db, job_ids):
+    """Return claimed jobs to the queue without counting the attempt."""
+    with db:
+        db.executemany(
+            "UPDATE transcode_job SET status = 'queued', attempts = attempts - 1 WHERE id = ? AND status = 'running'",
+            [(job_id,) for job_id in job_ids],
+        )
+
+
+def queue_depths(db):
+    """Number of jobs per status."""
+    rows = db.execute("SELECT status, COUNT(*) FROM transcode_job GROUP BY status").fetchall()
+    return {status: count for status, count in rows}
+
+
+def transcode(encoder, src_path, dst_path, sample_rate, root):
+    """Convert one upload and analyze the result; runs in a worker process and does not touch the DB.
+
+    The WAV is written to a temporary file under ``root`` (RECORDINGS_FOLDER) first, since
+    recordings sharing a blob may be converted by two workers at once."""
+    tmp = storage.tmp_path(root)
+    audio.ENCODERS[encoder](src_path, tmp, sample_rate)
+    samples, rate = audio.read_wav(tmp)
+    storage.publish(tmp, dst_path)
+    return audio.stats(samples, rate), quality.analyze(samples, rate), review.peaks(samples)
+
+
+def run_pool(db, encoder, workers, root, poll_interval=1.0, max_attempts=3, once=False):
+    """Feed queued jobs to ``workers`` processes until interrupted.
+
+    A worker process which dies (e.g. the encoder crashed) breaks the whole pool: the pool is
+    replaced and the jobs it was running are retried one at a time, so only the job which
+    crashes a worker on its own counts a failed attempt.
+
+    With ``once`` return as soon as the queue is drained. Returns the number of processed jobs."""
+    processed = 0
+    running = {}
+    # jobs of a broken pool, run alone until it is known which one crashed it
+    suspects = set()
+    pool = ProcessPoolExecutor(workers)
+    try:
+        while True:
+            jobs = claim_jobs(db, (1 if suspects else 2 * workers) - len(running))
+            for i, job in enumerate(jobs):
+                try:
+                    future = pool.submit(transcode, encoder, job["src_path"], job["dst_path"], job["sample_rate"], root)
+                except BrokenProcessPool:
+                    release_jobs(db, [unsubmitted["id"] for unsubmitted in jobs[i:]])
+                    if not running:
+                        pool.shutdown(wait=False)
+                        pool = ProcessPoolExecutor(workers)
+                    # otherwise the running jobs report the broken pool below
+                    break
+                running[future] = job["id"]
+            if not running:
+                suspects.clear()
+                if once:
+                    return processed
+                time.sleep(poll_interval)
+                continue
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                # all jobs of a broken pool fail
+                done = list(running)
+            crashed = []
+            for future in done:
+                job_id = running.pop(future)
+                try:
+                    finish_job(db, job_id, *future.result())
+                except BrokenProcessPool:
+                    crashed.append(job_id)
+                    continue
+                except Exception as e:
+                    logging.warning(f"Transcoding job {job_id} failed: {e!r}")
+                    fail_job(db, job_id, repr(e), max_attempts)
+                processed += 1
+                suspects.discard(job_id)
+            if not crashed:
+                continue
+            if len(crashed) == 1:
+                logging.warning(f"Transcoding job {crashed[0]} crashed its worker process")
+                fail_job(db, crashed[0], "worker process died", max_attempts)
+                processed += 1
+                suspects.discard(crashed[0])
+            else:
+                logging.warning(f"A worker process died running jobs {crashed}, retrying them one at a time")
+                release_jobs(db, crashed)
+                suspects.update(crashed)
+            pool.shutdown(wait=False)
+            pool = ProcessPoolExecutor(workers)
+    finally:
+        # e.g. interrupted, the jobs are not left running until requeue_stale
+        release_jobs(db, running.values())
+        # cancel_futures of shutdown needs Python 3.9
+        for future in running:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+@click.command("transcode")
+@click.option("-j", "--workers", type=int, default=None, help="Number of worker processes.")
+@click.option("--once", is_flag=True, help="Exit when the queue is drained.")
+@with_appcontext
+def transcode_command(workers, once):
+    """Convert queued uploads to WAV in background worker processes."""
+    config = current_app.config
+    assert config["TRANSCODE_SAMPLE_RATE"] in audio.SAMPLE_RATES, config["TRANSCODE_SAMPLE_RATE"]
+    assert config["TRANSCODE_ENCODER"] in audio.ENCODERS, config["TRANSCODE_ENCODER"]
+    workers = workers or config["TRANSCODE_WORKERS"]
+    db = get_db()
+    requeued = requeue_stale(db, config["TRANSCODE_STALE_AFTER"])
+    if requeued:
+        click.echo(f"Requeued {requeued} stale jobs.")
+    click.echo(f"Transcoding with {workers} '{config['TRANSCODE_ENCODER']}' workers.")
+    processed = run_pool(
+        db,
+        config["TRANSCODE_ENCODER"],
+        workers,
+        config["RECORDINGS_FOLDER"],
+        poll_interval=config["TRANSCODE_POLL_INTERVAL"],
+        max_attempts=config["TRANSCODE_MAX_ATTEMPTS"],
+        once=once,
+    )
+    click.echo(f"Processed {processed} jobs: {queue_depths(db)}")
+
+
+def init_app(app):
+    """Register the worker command with the Flask app."""
+    app.cli.add_command(transcode_command)
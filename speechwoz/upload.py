@@ -0,0 +1,230 @@
+"""Resumable chunked upload of recordings.
+
+The browser opens an upload, sends numbered chunks while the ``MediaRecorder`` is still
+recording and asks the server to assemble the take once it stops.
+Chunks are streamed to disk in ``UPLOAD_BUFFER_SIZE`` blocks, so a worker never holds
+a whole take in memory, and a dropped connection loses at most the chunk in flight.
+
+Protocol::
+
+    POST /upload/<source>                          -> {"status": "ok", "upload_id": ...}
+    PUT  /upload/<source>/<upload_id>/<index>      raw chunk bytes in the body
+    GET  /upload/<source>/<upload_id>              -> {"received": [indices]} for resuming
+    POST /upload/<source>/<upload_id>/finalize     {"num_chunks": N, "mic_check": check_id}
+                                                   -> {"status": "ok", "path": url}
+
+Chunks may arrive in any order and may be retried; re-sending a chunk replaces it.
+Finalizing twice returns the already assembled take. An onboarding take whose mic check
+(see speechwoz/miccheck.py) did not pass is rejected and its chunks removed. A finalize whose worker was killed
+while assembling is taken over by a retry ``UPLOAD_FINALIZE_TIMEOUT`` seconds later.
+Opening and finalizing accept an ``Idempotency-Key`` header (see speechwoz/idempotency.py),
+so a retried open returns the same upload. Chunks are fsynced before they are acknowledged.
+"""
+import logging
+import os
+import shutil
+import uuid
+
+from flask import Blueprint, abort, current_app, jsonify, request, session
+
+from speechwoz import miccheck, storage, transcode
+from speechwoz.concurrency import run_blocking
+from speechwoz.db import add_recording, get_db, get_recording
+from speechwoz.idempotency import idempotent
+
+bp = Blueprint("upload", __name__, url_prefix="/upload")
+
+RECORDING_SOURCES = ["onboarding"]  # TODO add others
+
+
+def _upload_dir(upload_id):
+    return os.path.join(current_app.config["UPLOAD_FOLDER"], upload_id)
+
+
+def _chunk_path(updir, index):
+    return os.path.join(updir, f"{index:06d}.part")
+
+
+def _received_chunks(updir):
+    return sorted(int(n[:-5]) for n in os.listdir(updir) if n.endswith(".part"))
+
+
+def _load_upload(source, upload_id):
+    if source not in RECORDING_SOURCES:
+        abort(404)
+    query = (
+        "SELECT upload.*, recording.url FROM upload LEFT JOIN recording ON recording.id = upload.recording_id"
+        " WHERE upload.id = ?"
+    )
+    upload = get_db().execute(query, (upload_id,)).fetchone()
+    if upload is None or upload["source"] != source or upload["annotator_id"] != session.get("ann_id"):
+        abort(404)
+    return _upload_dir(upload_id), upload
+
+
+def stream_to_file(stream, path, max_size):
+    """Copy ``stream`` into ``path`` block by block.
+
+    Returns the number of bytes written or ``None`` if the stream exceeded ``max_size``
+    in which case nothing is left behind at ``path``."""
+    buffer_size = current_app.config["UPLOAD_BUFFER_SIZE"]
+    size = 0
+    with open(path, "wb") as w:
+        while True:
+            # reading the socket yields to other requests in cooperative workers, writing the file would not
+            block = stream.read(buffer_size)
+            if not block:
+                break
+            size += len(block)
+            if size > max_size:
+                break
+            run_blocking(w.write, block)
+        if size <= max_size:
+            # on disk before it is renamed and acknowledged
+            w.flush()
+            run_blocking(os.fsync, w.fileno())
+    if size > max_size:
+        os.remove(path)
+        return None
+    return size
+
+
+def _insert_upload(upload_id, ann_id, source):
+    db = get_db()
+    db.execute("INSERT INTO upload (id, annotator_id, source) VALUES (?, ?, ?)", (upload_id, ann_id, source))
+    db.commit()
+
+
+def _claim_finalize(upload_id):
+    """True for only one of concurrent finalize requests of the upload.
+
+    A claim older than ``UPLOAD_FINALIZE_TIMEOUT`` seconds is taken over, its request died assembling the take."""
+    db = get_db()
+    cur = db.execute(
+        "UPDATE upload SET status = 'finalizing', claimed = CURRENT_TIMESTAMP WHERE id = ?"
+        " AND (status = 'open' OR status = 'finalizing' AND claimed < datetime('now', ?))",
+        (upload_id, f"-{int(current_app.config['UPLOAD_FINALIZE_TIMEOUT'])} seconds"),
+    )
+    db.commit()
+    return cur.rowcount == 1
+
+
+def _reject(upload_id, updir):
+    db = get_db()
+    db.execute(
+        "UPDATE upload SET status = 'rejected', finished = CURRENT_TIMESTAMP WHERE id = ? AND status = 'open'",
+        (upload_id,),
+    )
+    db.commit()
+    shutil.rmtree(updir, ignore_errors=True)
+
+
+def _assemble(updir, num_chunks):
+    """Concatenate the chunks into a blob; returns the ``blob`` row."""
+    with storage.BlobWriter(".mp3") as w:
+        for i in range(num_chunks):
+            with open(_chunk_path(updir, i), "rb") as r:
+                shutil.copyfileobj(r, w, current_app.config["UPLOAD_BUFFER_SIZE"])
+        return w.commit()
+
+
+def _register_take(upload, num_chunks, blob, audio_url, session_id):
+    """Add the recording of the take unless the annotator uploaded the same take before."""
+    db = get_db()
+    duplicate = storage.find_recording(upload["annotator_id"], upload["source"], blob["sha256"])
+    recording_id = add_recording(
+        upload["annotator_id"],
+        upload["source"],
+        blob["path"],
+        audio_url,
+        session_id,
+        blob=blob["sha256"],
+        commit=False,
+    )
+    db.execute(
+        "UPDATE upload SET status = 'done', num_chunks = ?, recording_id = ?, finished = CURRENT_TIMESTAMP"
+        " WHERE id = ?",
+        (num_chunks, recording_id, upload["id"]),
+    )
+    if duplicate is None:
+        transcode.enqueue(blob["path"], recording_id, commit=False)
+    db.commit()
+    return get_recording(recording_id)
+
+
+@bp.route("/<source>", methods=["POST"])
+@idempotent
+def open_upload(source):
+    if source not in RECORDING_SOURCES:
+        abort(404)
+    ann_id = session.get("ann_id")
+    if ann_id is None:
+        return jsonify(status="no-annotator")
+    upload_id = uuid.uuid4().hex
+    # a reconciler removes directories without an open upload row, see speechwoz/reconcile.py
+    run_blocking(_insert_upload, upload_id, ann_id, source)
+    os.makedirs(_upload_dir(upload_id))
+    return jsonify(status="ok", upload_id=upload_id)
+
+
+@bp.route("/<source>/<upload_id>", methods=["GET"])
+def upload_status(source, upload_id):
+    updir, upload = _load_upload(source, upload_id)
+    received = _received_chunks(updir) if upload["status"] == "open" else []
+    return jsonify(status="ok", upload_status=upload["status"], received=received, path=upload["url"])
+
+
+@bp.route("/<source>/<upload_id>/<int:index>", methods=["PUT"])
+def put_chunk(source, upload_id, index):
+    updir, upload = _load_upload(source, upload_id)
+    if upload["status"] == "rejected":
+        return jsonify(status="rejected")
+    if upload["status"] != "open":
+        return jsonify(status="finalized", path=upload["url"])
+    if index >= current_app.config["UPLOAD_MAX_CHUNKS"]:
+        return jsonify(status="too-many-chunks")
+    max_size = current_app.config["UPLOAD_MAX_CHUNK_SIZE"]
+    if request.content_length is not None and request.content_length > max_size:
+        return jsonify(status="chunk-too-large")
+    # a retried chunk must never be seen half written, so write aside and rename
+    tmp = _chunk_path(updir, index) + "." + uuid.uuid4().hex
+    size = stream_to_file(request.stream, tmp, max_size)
+    if size is None:
+        return jsonify(status="chunk-too-large")
+    os.replace(tmp, _chunk_path(updir, index))
+    return jsonify(status="ok", index=index, size=size)
+
+
+@bp.route("/<source>/<upload_id>/finalize", methods=["POST"])
+@idempotent
+def finalize_upload(source, upload_id):
+    updir, upload = _load_upload(source, upload_id)
+    if upload["status"] == "done":
+        return jsonify(status="ok", path=upload["url"])
+    if upload["status"] == "rejected":
+        return jsonify(status="rejected")
+    data = request.get_json(silent=True) or {}
+    num_chunks = data.get("num_chunks")
+    if not isinstance(num_chunks, int) or num_chunks < 1:
+        return jsonify(status="no-num-chunks")
+    if source == "onboarding" and current_app.config["MIC_CHECK_REQUIRED"]:
+        verdict = run_blocking(miccheck.verdict, data.get("mic_check"), upload["annotator_id"])
+        if verdict != "ok":
+            # do not store and transcode takes from a setup which failed the live check
+            run_blocking(_reject, upload_id, updir)
+            return jsonify(status="mic-check-failed", mic_check=verdict)
+    received = set(_received_chunks(updir))
+    missing = [i for i in range(num_chunks) if i not in received]
+    if missing:
+        return jsonify(status="missing-chunks", missing=missing)
+
+    if not run_blocking(_claim_finalize, upload_id):
+        return jsonify(status="finalizing")
+
+    blob = run_blocking(_assemble, updir, num_chunks)
+    audio_url = storage.blob_url(blob)
+    logging.info(f"Assembled {num_chunks} chunks to {blob['path']}\n\t accessible at {audio_url}")
+
+    recording = run_blocking(_register_take, upload, num_chunks, blob, audio_url, session.get("session_id"))
+    run_blocking(shutil.rmtree, updir)
+    return jsonify(status="ok", path=recording["url"])
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from speechwoz import annotators, create_app
+from speechwoz.db import init_db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create and configure a new app instance for each test."""
+    app = create_app(
+        {
+            "TESTING": True,
+            "MIC_CHECK_REQUIRED": False,
+            "DATABASE": str(tmp_path / "test.sqlite"),
+            "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+            "RECORDINGS_FOLDER": str(tmp_path / "recordings"),
+            "MULTIWOZ_DATABASE": str(tmp_path / "multiwoz.sqlite"),
+            "TRANSCODE_ENCODER": "stub",
+        }
+    )
+    with app.app_context():
+        init_db()
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    """A test client for the app."""
+    return app.test_client()
+
+
+@pytest.fixture
+def runner(app):
+    """A test runner for the app's Click commands."""
+    return app.test_cli_runner()
+
+
+@pytest.fixture
+def multiwoz(runner, tmp_path):
+    """Compile two tiny MultiWOZ dialogues into the store and the app DB; returns the MultiWOZ 2.2 dialogues."""
+    dialogues = [
+        {
+            "dialogue_id": "SNG0001.json",
+            "services": ["hotel"],
+            "turns": [
+                {"speaker": "USER", "turn_id": "0", "utterance": "I need a cheap hotel."},
+                {"speaker": "SYSTEM", "turn_id": "1", "utterance": "Which area?"},
+                {"speaker": "USER", "turn_id": "2", "utterance": "The centre, please."},
+            ],
+        },
+        {
+            "dialogue_id": "MUL0002.json",
+            "services": ["train", "taxi"],
+            "turns": [{"speaker": "USER", "turn_id": "0", "utterance": "A train to Ely."}],
+        },
+    ]
+    m22 = tmp_path / "dialogues_001.json"
+    m22.write_text(json.dumps(dialogues))
+    m21 = tmp_path / "data.json"
+    m21.write_text(json.dumps({d["dialogue_id"]: {"goal": {"message": ["Find a hotel."]}} for d in dialogues}))
+    result = runner.invoke(args=["compile-multiwoz", "-i", str(m22), "-s", str(m21)])
+    assert result.exit_code == 0, result.output
+    return dialogues
+
+
+@pytest.fixture
+def login(app):
+    """Log a client in as the annotator of a Prolific participant; returns the annotator id."""
+
+    def login(client, prolific_pid="test-pid"):
+        with app.app_context():
+            ann_id = annotators.register(prolific_pid)
+        with client.session_transaction() as session:
+            session["ann_id"] = ann_id
+        return ann_id
+
+    return login
+
+
+@pytest.fixture
+def ann_id(client, login):
+    """The id of the annotator logged in with ``client``."""
+    return login(client)
@@ -0,0 +1,60 @@
+import hashlib
+import hmac
+
+from speechwoz import annotators
+from speechwoz.db import get_db
+
+
+def test_pseudonymize(app):
+    app.config["ANNOTATOR_ID_KEY"] = "key"
+    with app.app_context():
+        ann_id = annotators.pseudonymize("pid")
+        assert ann_id == hmac.new(b"key", b"pid", hashlib.sha256).hexdigest()
+        assert annotators.pseudonymize("pid") == ann_id
+        assert annotators.pseudonymize("other") != ann_id
+        app.config["ANNOTATOR_ID_KEY"] = "new key"
+        assert annotators.pseudonymize("pid") != ann_id
+
+
+def test_pseudonymize_bytes_key(app):
+    with app.app_context():
+        app.config["ANNOTATOR_ID_KEY"] = "key"
+        ann_id = annotators.pseudonymize("pid")
+        app.config["ANNOTATOR_ID_KEY"] = b"key"
+        assert annotators.pseudonymize("pid") == ann_id
+        app.config["ANNOTATOR_ID_KEY"] = None
+        app.config["SECRET_KEY"] = b"\xff\x00 random"
+        assert annotators.pseudonymize("pid") == hmac.new(b"\xff\x00 random", b"pid", hashlib.sha256).hexdigest()
+
+
+def test_register(app):
+    with app.app_context():
+        caller = annotators.register("pid")
+        assert annotators.register("pid") == caller
+        agent = annotators.register("oplatek")
+        assert annotators.lookup(caller)["role"] == annotators.ROLE_CALLER
+        assert annotators.lookup(agent)["role"] == annotators.ROLE_AGENT
+        assert get_db().execute("SELECT COUNT(*) FROM annotator").fetchone()[0] == 2
+
+
+def test_lookup_cache(app):
+    with app.app_context():
+        assert annotators.lookup("unknown") is None
+        ann_id = annotators.register("pid")
+        assert annotators.lookup(ann_id)["id"] == ann_id
+        with get_db() as db:
+            db.execute("DELETE FROM annotator")
+        # served from the cache
+        assert annotators.lookup(ann_id)["id"] == ann_id
+
+
+def test_lookup_cache_size(app):
+    app.config["ANNOTATOR_CACHE_SIZE"] = 1
+    with app.app_context():
+        first, second = annotators.register("first"), annotators.register("second")
+        annotators.lookup(first)
+        annotators.lookup(second)
+        with get_db() as db:
+            db.execute("DELETE FROM annotator")
+        assert annotators.lookup(first) is None
+        assert annotators.lookup(second)["id"] == second
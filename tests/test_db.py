@@ -0,0 +1,55 @@
+from speechwoz import db
+
+
+def test_pool_reuses_connections(app):
+    with app.app_context():
+        first = db.acquire_db()
+        db.release_db(first)
+        assert db.idle_connections() == 1
+        assert db.acquire_db() is first
+        db.release_db(first)
+
+
+def test_pool_size(app):
+    app.config["DB_POOL_SIZE"] = 1
+    with app.app_context():
+        connections = [db.acquire_db() for _ in range(3)]
+        for connection in connections:
+            db.release_db(connection)
+        assert db.idle_connections() == 1
+
+
+def test_release_rolls_back(app, ann_id):
+    with app.app_context():
+        connection = db.acquire_db()
+        connection.execute("DELETE FROM annotator")
+        db.release_db(connection)
+        assert not connection.in_transaction
+        assert db.get_annotator(ann_id) is not None
+
+
+def test_pragmas(app):
+    with app.app_context():
+        connection = db.acquire_db()
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert connection.execute("PRAGMA busy_timeout").fetchone()[0] == app.config["DB_PRAGMAS"]["busy_timeout"]
+        db.release_db(connection)
+
+
+def test_timed_connection(app):
+    timings = []
+    db.query_hooks.append(lambda sql, seconds: timings.append(sql))
+    try:
+        connection = db.connect(app.config["DATABASE"], {}, factory=db.TimedConnection)
+        connection.execute("SELECT 1")
+        connection.close()
+    finally:
+        db.query_hooks.pop()
+    assert timings == ["SELECT 1"]
+
+
+def test_write_batch(app):
+    rows = [(f"D{i}", 1) for i in range(7)]
+    with app.app_context():
+        assert db.write_batch("INSERT INTO dialogue (id, n_turns) VALUES (?, ?)", rows, batch_size=3) == 7
+        assert db.get_db().execute("SELECT COUNT(*) FROM dialogue").fetchone()[0] == 7
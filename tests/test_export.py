@@ -0,0 +1,67 @@
+import gzip
+import json
+
+from speechwoz.db import add_recording, get_db
+
+
+def add_transcoded(db, ann_id, turn_id, jobs=1):
+    recording_id = add_recording(
+        ann_id,
+        "annotate",
+        f"/rec/{turn_id}.webm",
+        f"/media/{turn_id}.webm",
+        dialogue_id="SNG0001.json",
+        turn_id=turn_id,
+        blob=str(turn_id),
+    )
+    for sample_rate in [8000, 16000][-jobs:]:
+        db.execute(
+            "INSERT INTO transcode_job (recording_id, src_path, dst_path, sample_rate, status)"
+            " VALUES (?, ?, ?, ?, 'done')",
+            (recording_id, f"/rec/{turn_id}.webm", f"/rec/{turn_id}.wav", sample_rate),
+        )
+    with db:
+        db.execute(
+            "UPDATE recording SET wav_path = ?, duration = 1.5 WHERE id = ?", (f"/rec/{turn_id}.wav", recording_id)
+        )
+    return recording_id
+
+
+def read_cuts(outdir):
+    cuts = []
+    for path in sorted(outdir.glob("speechwoz_cuts.*.jsonl.gz")):
+        with gzip.open(path, "rt") as r:
+            cuts.extend(json.loads(line) for line in r)
+    return cuts
+
+
+def test_export(app, runner, multiwoz, ann_id, tmp_path):
+    with app.app_context():
+        db = get_db()
+        add_transcoded(db, ann_id, 0, jobs=2)
+        add_transcoded(db, ann_id, 1)
+        # not transcoded yet
+        add_recording(ann_id, "annotate", "/rec/2.webm", "/media/2.webm", blob="2")
+    result = runner.invoke(args=["export-cuts", "-o", str(tmp_path / "exports"), "--shard-size", "1"])
+    assert result.exit_code == 0, result.output
+    cuts = read_cuts(tmp_path / "exports")
+    # one cut per recording, with the newest job
+    assert [cut["id"] for cut in cuts] == ["speechwoz-00000001", "speechwoz-00000002"]
+    assert [cut["recording"]["sampling_rate"] for cut in cuts] == [16000, 16000]
+    assert cuts[0]["recording"]["num_samples"] == 24000
+    supervision = cuts[1]["supervisions"][0]
+    assert supervision["text"] == "Which area?"
+    assert supervision["custom"]["multiwoz"]["speaker"] == "SYSTEM"
+
+
+def test_export_only_new(app, runner, multiwoz, ann_id, tmp_path):
+    with app.app_context():
+        add_transcoded(get_db(), ann_id, 0)
+    assert runner.invoke(args=["export-cuts", "-o", str(tmp_path / "first")]).exit_code == 0
+    with app.app_context():
+        add_transcoded(get_db(), ann_id, 1)
+    assert runner.invoke(args=["export-cuts", "-o", str(tmp_path / "second")]).exit_code == 0
+    assert runner.invoke(args=["export-cuts", "-o", str(tmp_path / "full"), "--full"]).exit_code == 0
+    assert len(read_cuts(tmp_path / "first")) == 1
+    assert [cut["id"] for cut in read_cuts(tmp_path / "second")] == ["speechwoz-00000002"]
+    assert len(read_cuts(tmp_path / "full")) == 2
@@ -0,0 +1,80 @@
+import uuid
+
+from speechwoz.db import get_db
+
+
+def count(app, table):
+    with app.app_context():
+        return get_db().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def js_open(client, key):
+    """Open an upload as ChunkedUpload in static/js/speechwoz.js does."""
+    return client.post("/upload/onboarding", headers={"Idempotency-Key": key}).get_json()
+
+
+def js_finish(client, upload_id, key, num_chunks):
+    """Finalize an upload as ChunkedUpload.finish() does."""
+    return client.post(
+        f"/upload/onboarding/{upload_id}/finalize",
+        headers={"Idempotency-Key": key, "Content-Type": "application/json"},
+        json={"num_chunks": num_chunks},
+    ).get_json()
+
+
+def test_upload_as_the_page(app, client, ann_id):
+    open_key, finish_key = str(uuid.uuid4()), str(uuid.uuid4())
+    upload_id = js_open(client, open_key)["upload_id"]
+    assert client.put(f"/upload/onboarding/{upload_id}/0", data=b"take").get_json()["status"] == "ok"
+    data = js_finish(client, upload_id, finish_key, 1)
+    assert data["status"] == "ok"
+    # retries of both requests get the first responses
+    assert js_open(client, open_key)["upload_id"] == upload_id
+    assert js_finish(client, upload_id, finish_key, 1) == data
+    assert count(app, "upload") == 1
+    assert count(app, "recording") == 1
+
+
+def test_same_key_for_open_and_finalize(app, client, ann_id):
+    # keys are scoped to the endpoint
+    key = str(uuid.uuid4())
+    upload_id = js_open(client, key)["upload_id"]
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"take")
+    assert js_finish(client, upload_id, key, 1)["status"] == "ok"
+
+
+def test_failed_request_frees_key(app, client, ann_id):
+    upload_id = js_open(client, "open")["upload_id"]
+    key = str(uuid.uuid4())
+    assert js_finish(client, upload_id, key, 1)["status"] == "missing-chunks"
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"take")
+    assert js_finish(client, upload_id, key, 1)["status"] == "ok"
+
+
+def test_pending_key(app, client, ann_id):
+    with app.app_context():
+        db = get_db()
+        with db:
+            db.execute(
+                "INSERT INTO idempotency_key (annotator_id, endpoint, key, owner) VALUES (?, 'upload.open_upload', 'k', 1)",
+                (ann_id,),
+            )
+    assert js_open(client, "k") == {"status": "in-progress"}
+
+
+def test_keys_per_annotator(app, client, login, ann_id):
+    other = app.test_client()
+    login(other, "other-pid")
+    assert js_open(client, "k")["upload_id"] != js_open(other, "k")["upload_id"]
+
+
+def test_bad_key(client, ann_id):
+    assert js_open(client, "k" * 129) == {"status": "bad-idempotency-key"}
+    assert count(client.application, "upload") == 0
+
+
+def test_without_key(app, client, ann_id):
+    client.post("/upload/onboarding")
+    client.post("/upload/onboarding")
+    assert count(app, "upload") == 2
+    assert count(app, "idempotency_key") == 0
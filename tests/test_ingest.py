@@ -0,0 +1,99 @@
+import gzip
+import json
+import uuid
+import wave
+
+import numpy as np
+import pytest
+
+from speechwoz import annotators
+from speechwoz.db import get_db
+
+
+def write_wav(path, channels=1, rate=16000, seconds=0.5):
+    samples = (np.sin(np.arange(int(rate * seconds) * channels) / 10) * 8000).astype("<i2")
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+
+
+@pytest.fixture
+def takes(tmp_path):
+    """A directory with a legacy MP3 take, a WAV take, a stereo take, a prototype take with its CutSet
+    and a broken file."""
+    folder = tmp_path / "takes"
+    (folder / "prototype").mkdir(parents=True)
+    (folder / f"legacy{uuid.uuid4()}.mp3").write_bytes(b"ID3 first upload version")
+    write_wav(folder / f"ann{uuid.uuid4()}.wav")
+    write_wav(folder / "stereo.wav", channels=2)
+    write_wav(folder / "prototype" / "pid.wav")
+    cut = {
+        "id": "cut-0",
+        "start": 0.0,
+        "duration": 0.5,
+        "supervisions": [
+            {
+                "text": "I need a cheap hotel.",
+                "custom": {"multiwoz": {"conversation_id": "SNG0001.json", "turn_id": 0, "speaker": "USER"}},
+            }
+        ],
+    }
+    with gzip.open(folder / "prototype" / "pid.jsonl.gz", "wt") as w:
+        w.write(json.dumps(cut) + "\n")
+    (folder / "broken.wav").write_bytes(b"not a wav")
+    return folder
+
+
+def ingest(runner, folder, env=None):
+    result = runner.invoke(args=["ingest", str(folder), "-j", "2", "--annotator", "unknown"], env=env)
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_ingest(app, runner, takes):
+    output = ingest(runner, takes)
+    assert "4 files" in output and "1 failed" in output
+    with app.app_context():
+        db = get_db()
+        recordings = {row["annotator_id"]: row for row in db.execute("SELECT * FROM recording")}
+        pid = annotators.pseudonymize("pid")
+        assert set(recordings) == {"legacy", "ann", "unknown", pid}
+        assert recordings[pid]["source"] == "prototype"
+        assert recordings["ann"]["duration"] == pytest.approx(0.5)
+        # the MP3 and the stereo take wait for the transcode workers
+        assert recordings["legacy"]["path"].endswith(".mp3")
+        assert recordings["legacy"]["wav_path"] is None
+        assert recordings["unknown"]["wav_path"] is None
+        jobs = dict(db.execute("SELECT recording_id, status FROM transcode_job").fetchall())
+        assert jobs == {
+            recordings["legacy"]["id"]: "queued",
+            recordings["ann"]["id"]: "done",
+            recordings["unknown"]["id"]: "queued",
+            recordings[pid]["id"]: "done",
+        }
+        segment = db.execute("SELECT * FROM recording_segment").fetchone()
+        assert segment["recording_id"] == recordings[pid]["id"]
+        assert (segment["dialogue_id"], segment["turn_id"], segment["speaker"]) == ("SNG0001.json", 0, "USER")
+        files = dict(db.execute("SELECT path, status FROM ingest_file").fetchall())
+        assert files[str(takes / "broken.wav")] == "failed"
+
+
+def test_resume(app, runner, takes):
+    ingest(runner, takes)
+    output = ingest(runner, takes)
+    assert "0 files" in output and "4 skipped" in output and "1 failed" in output
+    # a copy of a known take is not another recording
+    write_wav(takes / "copy.wav", channels=2)
+    ingest(runner, takes)
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM recording").fetchone()[0] == 4
+
+
+def test_urls_of_mount_point(app, runner, takes):
+    ingest(runner, takes, env={"SCRIPT_NAME": "/namuddis/speechwoz"})
+    with app.app_context():
+        urls = [row[0] for row in get_db().execute("SELECT url FROM recording")]
+    assert len(urls) == 4
+    assert all(url.startswith("/namuddis/speechwoz/media/blobs/") for url in urls)
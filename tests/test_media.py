@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+import pytest
+
+from speechwoz.media import media_url
+from speechwoz.storage import BLOB_DIR, TMP_DIR
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def recording(app):
+    """A reference clip in RECORDINGS_FOLDER; returns its name."""
+    os.makedirs(os.path.join(app.config["RECORDINGS_FOLDER"], "reference"))
+    with open(os.path.join(app.config["RECORDINGS_FOLDER"], "reference", "clip.wav"), "wb") as w:
+        w.write(DATA)
+    return "reference/clip.wav"
+
+
+def test_serve(client, recording):
+    with client.get(f"/media/{recording}") as response:
+        assert response.status_code == 200
+        assert response.data == DATA
+        assert response.headers["ETag"] == f'"{hashlib.sha256(DATA).hexdigest()}"'
+        assert response.cache_control.no_cache
+
+
+def test_range(client, recording):
+    with client.get(f"/media/{recording}", headers={"Range": "bytes=10-19"}) as response:
+        assert response.status_code == 206
+        assert response.data == DATA[10:20]
+        assert response.headers["Content-Range"] == f"bytes 10-19/{len(DATA)}"
+
+
+def test_not_modified(client, recording):
+    with client.get(f"/media/{recording}") as response:
+        etag = response.headers["ETag"]
+    with client.get(f"/media/{recording}", headers={"If-None-Match": etag}) as response:
+        assert response.status_code == 304
+        assert response.data == b""
+
+
+def test_media_url(app, client, recording):
+    with app.test_request_context():
+        url = media_url(recording)
+        assert url == f"/media/{recording}?v={hashlib.sha256(DATA).hexdigest()[:16]}"
+        assert media_url("missing.wav") == "/media/missing.wav"
+    with client.get(url) as response:
+        assert response.cache_control.max_age == app.config["MEDIA_MAX_AGE"]
+        assert response.cache_control.immutable
+
+
+def test_blob_etag(app, client):
+    digest = hashlib.sha256(DATA).hexdigest()
+    os.makedirs(os.path.join(app.config["RECORDINGS_FOLDER"], BLOB_DIR))
+    with open(os.path.join(app.config["RECORDINGS_FOLDER"], BLOB_DIR, digest), "wb") as w:
+        w.write(DATA)
+    with client.get(f"/media/{BLOB_DIR}/{digest}") as response:
+        assert response.headers["ETag"] == f'"{digest}"'
+        assert response.cache_control.immutable
+
+
+def test_not_found(app, client):
+    os.makedirs(os.path.join(app.config["RECORDINGS_FOLDER"], TMP_DIR))
+    open(os.path.join(app.config["RECORDINGS_FOLDER"], TMP_DIR, "1-part"), "wb").close()
+    for url in [f"/media/{TMP_DIR}/1-part", "/media/missing.wav", "/media/../test.sqlite"]:
+        with client.get(url) as response:
+            assert response.status_code == 404
+
+
+def test_accel_redirect(app, client, recording):
+    app.config["MEDIA_ACCEL_REDIRECT"] = "/_recordings/"
+    with client.get(f"/media/{recording}") as response:
+        assert response.status_code == 200
+        assert response.headers["X-Accel-Redirect"] == f"/_recordings/{recording}"
+        assert response.data == b""
+        etag = response.headers["ETag"]
+    with client.get(f"/media/{recording}", headers={"If-None-Match": etag}) as response:
+        assert response.status_code == 304
+        assert "X-Accel-Redirect" not in response.headers
@@ -0,0 +1,51 @@
+import pytest
+
+from speechwoz import create_app, metrics
+from speechwoz.db import init_db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({"TESTING": True, "DATABASE": str(tmp_path / "test.sqlite"), "METRICS_ENABLED": True})
+    with app.app_context():
+        init_db()
+    yield app
+
+
+def test_metrics(client):
+    client.post("/upload/onboarding")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+    assert 'speechwoz_requests_total{endpoint="upload.open_upload",method="POST",status="200"}' in text
+    assert "speechwoz_db_query_seconds_bucket" in text
+    assert "speechwoz_worker_info" in text
+
+
+def test_remote_and_proxied_forbidden(client):
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 403
+    assert client.get("/metrics", headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 403
+    assert client.get("/metrics/profile", environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 403
+
+
+def test_token(app, client):
+    app.config["METRICS_TOKEN"] = "secret"
+    remote = {"REMOTE_ADDR": "10.0.0.1"}
+    assert client.get("/metrics", environ_base=remote, headers={"Authorization": "Bearer secret"}).status_code == 200
+    assert client.get("/metrics", environ_base=remote, headers={"Authorization": "Bearer wrong"}).status_code == 403
+    # with a token set, local requests need it too
+    assert client.get("/metrics").status_code == 403
+
+
+def test_profile_reset_needs_post(client, monkeypatch):
+    monkeypatch.setattr(metrics, "_profile", {"index;speechwoz.app:index": 3})
+    assert client.get("/metrics/profile?reset=1").get_data(as_text=True) == "index;speechwoz.app:index 3\n"
+    assert metrics._profile
+    assert client.post("/metrics/profile").get_data(as_text=True) == "index;speechwoz.app:index 3\n"
+    assert metrics._profile == {}
+
+
+def test_disabled(tmp_path):
+    app = create_app({"TESTING": True, "DATABASE": str(tmp_path / "test.sqlite")})
+    assert app.test_client().get("/metrics").status_code == 404
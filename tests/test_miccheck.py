@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pytest
+
+from speechwoz.db import get_db
+from speechwoz.reconcile import expire_mic_checks
+
+RATE = 16000
+
+
+def pcm(amplitude, seconds):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(RATE * seconds)) / RATE
+    samples = amplitude * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 30, len(t))
+    return np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+
+
+def run_check(client, *blocks):
+    check_id = client.post("/mic_check").get_json()["check_id"]
+    report = None
+    for block in blocks:
+        report = client.post(f"/mic_check/{check_id}?rate={RATE}", data=block).get_json()
+    return check_id, report
+
+
+@pytest.fixture
+def required(app):
+    app.config["MIC_CHECK_REQUIRED"] = True
+
+
+def upload_take(client, check_id):
+    upload_id = client.post("/upload/onboarding").get_json()["upload_id"]
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"take")
+    body = {"num_chunks": 1, "mic_check": check_id}
+    return upload_id, client.post(f"/upload/onboarding/{upload_id}/finalize", json=body).get_json()
+
+
+def test_check_verdicts(client, ann_id):
+    _, report = run_check(client, pcm(0, 1), pcm(10000, 3))
+    assert report["status"] == "ok"
+    assert report["verdict"] == "ok"
+    assert report["seconds"] == pytest.approx(4)
+    assert run_check(client, pcm(10000, 1))[1]["verdict"] == "listening"
+    assert run_check(client, pcm(100, 4))[1]["verdict"] == "too-quiet"
+    assert run_check(client, pcm(40000, 4))[1]["verdict"] == "clipping"
+
+
+def test_small_blocks(client, ann_id):
+    # 200 samples are shorter than a 20 ms frame at 16 kHz
+    data = pcm(0, 1) + pcm(10000, 3)
+    blocks = [data[i : i + 400] for i in range(0, len(data), 400)]
+    assert run_check(client, *blocks[:10])[1]["verdict"] == "listening"
+    _, report = run_check(client, *blocks)
+    assert report["verdict"] == "ok"
+    assert report["seconds"] == pytest.approx(4)
+    _, whole = run_check(client, data)
+    assert report["speech"] == whole["speech"] and report["noise"] == whole["noise"]
+
+
+def test_check_of_another_annotator(app, client, login, ann_id):
+    check_id, _ = run_check(client)
+    other = app.test_client()
+    login(other, "other-pid")
+    assert other.post(f"/mic_check/{check_id}?rate={RATE}", data=pcm(0, 1)).status_code == 404
+
+
+def test_passed_check_finalizes(app, client, ann_id, required):
+    check_id, _ = run_check(client, pcm(0, 1), pcm(10000, 3))
+    _, data = upload_take(client, check_id)
+    assert data["status"] == "ok"
+
+
+def test_failed_check_rejects(app, client, ann_id, required):
+    check_id, _ = run_check(client, pcm(100, 4))
+    upload_id, data = upload_take(client, check_id)
+    assert data == {"status": "mic-check-failed", "mic_check": "too-quiet"}
+    # the chunks are removed and the upload cannot be finalized any more
+    assert not os.path.exists(os.path.join(app.config["UPLOAD_FOLDER"], upload_id))
+    assert client.put(f"/upload/onboarding/{upload_id}/0", data=b"take").get_json()["status"] == "rejected"
+    body = {"num_chunks": 1, "mic_check": check_id}
+    assert client.post(f"/upload/onboarding/{upload_id}/finalize", json=body).get_json()["status"] == "rejected"
+
+
+def test_verdict_tied_to_check(app, client, ann_id, required):
+    passed, _ = run_check(client, pcm(0, 1), pcm(10000, 3))
+    # a later failed check does not change the verdict of the passed one
+    failed, _ = run_check(client, pcm(100, 4))
+    assert upload_take(client, passed)[1]["status"] == "ok"
+    assert upload_take(client, failed)[1]["status"] == "mic-check-failed"
+    assert upload_take(client, None)[1] == {"status": "mic-check-failed", "mic_check": None}
+
+
+def test_expired_checks(app, client, ann_id, required):
+    passed, _ = run_check(client, pcm(0, 1), pcm(10000, 3))
+    with app.app_context():
+        db = get_db()
+        with db:
+            db.execute("UPDATE mic_check SET created = datetime('now', '-2 days')")
+        assert expire_mic_checks(db, app.config["MIC_CHECK_TTL"]) == 1
+    assert upload_take(client, passed)[1]["status"] == "mic-check-failed"
@@ -0,0 +1,47 @@
+from speechwoz.db import get_db
+from speechwoz.multiwoz import load_dialogue, load_turn
+
+
+def test_compile(app, multiwoz):
+    with app.app_context():
+        rows = get_db().execute("SELECT id, n_turns, recording_count FROM dialogue ORDER BY id").fetchall()
+    assert [tuple(row) for row in rows] == [("MUL0002.json", 1, 0), ("SNG0001.json", 3, 0)]
+
+
+def test_recompile_keeps_counts(app, runner, multiwoz, tmp_path):
+    with app.app_context():
+        db = get_db()
+        with db:
+            db.execute("UPDATE dialogue SET recording_count = 5 WHERE id = 'SNG0001.json'")
+    result = runner.invoke(
+        args=["compile-multiwoz", "-i", str(tmp_path / "dialogues_001.json"), "-s", str(tmp_path / "data.json")]
+    )
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        row = get_db().execute("SELECT recording_count FROM dialogue WHERE id = 'SNG0001.json'").fetchone()
+    assert row[0] == 5
+
+
+def test_load_dialogue(app, multiwoz):
+    with app.app_context():
+        dialogue = load_dialogue("SNG0001.json")
+        assert load_dialogue("MISSING.json") is None
+    assert dialogue["n_turns"] == 3
+    assert dialogue["services"] == ["hotel"]
+    assert dialogue["goal"] == ["Find a hotel."]
+    assert dialogue["turns"] == [{**t, "turn_id": int(t["turn_id"])} for t in multiwoz[0]["turns"]]
+
+
+def test_load_turn(app, multiwoz):
+    with app.app_context():
+        assert load_turn("SNG0001.json", 1) == {"speaker": "SYSTEM", "turn_id": 1, "utterance": "Which area?"}
+        assert load_turn("MUL0002.json", 0)["utterance"] == "A train to Ely."
+        assert load_turn("MUL0002.json", 1) is None
+        assert load_turn("MISSING.json", 0) is None
+
+
+def test_dialogue_endpoint(client, multiwoz):
+    response = client.get("/dialogues/MUL0002.json")
+    assert response.status_code == 200
+    assert response.json["turns"] == [{"speaker": "USER", "turn_id": 0, "utterance": "A train to Ely."}]
+    assert client.get("/dialogues/MISSING.json").status_code == 404
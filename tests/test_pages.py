@@ -0,0 +1,78 @@
+import hashlib
+import os
+
+import pytest
+from flask import g, session
+
+from speechwoz.annotators import ROLE_AGENT, ROLE_CALLER
+from speechwoz.pages import clear_cache, render_page, static_url
+
+
+@pytest.fixture(autouse=True)
+def pages(app):
+    """The page routes of ``speechwoz.app``, which the templates link to."""
+    for template in ["index.html", "annotate.html", "survey.html"]:
+        endpoint = template.split(".")[0]
+        app.add_url_rule(f"/{endpoint}", endpoint, lambda template=template: render_page(template))
+
+
+def render(app, template, ann_id, role=ROLE_CALLER, **session_data):
+    with app.test_request_context():
+        g.annotator_info = {"id": ann_id, "role": role, "accepted_terms": False}
+        session.update(session_data)
+        return render_page(template)
+
+
+def test_user_fragments(app):
+    first = render(app, "annotate.html", "first-id", multiwozdb={"dialogue_id": "SNG0001.json"})
+    second = render(app, "annotate.html", "second-id")
+    assert "first-id" in first and "SNG0001.json" in first
+    assert "second-id" in second and "first-id" not in second and "SNG0001.json" not in second
+    assert "\x00" not in first + second
+
+
+@pytest.mark.parametrize("page_cache", [True, False])
+def test_cache_matches_render(app, page_cache):
+    app.config["PAGE_CACHE"] = page_cache
+    pages = [render(app, "annotate.html", "ann-id", mode="MODE_ANNOTATE") for _ in range(2)]
+    app.config["PAGE_CACHE"] = not page_cache
+    assert pages == [render(app, "annotate.html", "ann-id", mode="MODE_ANNOTATE")] * 2
+
+
+def test_cache_keys(app):
+    render(app, "annotate.html", "ann-id")
+    render(app, "annotate.html", "agent-id", role=ROLE_AGENT)
+    render(app, "index.html", "ann-id")
+    assert len(app.extensions["pages"]["pages"]) == 3
+    # a new deploy renders the pages again
+    app.config["VERSION"] = "new"
+    render(app, "annotate.html", "ann-id")
+    assert len(app.extensions["pages"]["pages"]) == 1
+
+
+def test_clear_cache(app):
+    render(app, "annotate.html", "ann-id")
+    cached = dict(app.extensions["pages"]["pages"])
+    # only VERSION is compared on a request
+    app.config["STATIC_MAX_AGE"] = 60
+    render(app, "annotate.html", "ann-id")
+    assert app.extensions["pages"]["pages"] == cached
+    clear_cache(app)
+    assert app.extensions["pages"]["pages"] == {}
+    render(app, "annotate.html", "ann-id")
+    assert app.extensions["pages"]["pages"] == cached
+
+
+def test_static_url(app, client):
+    filename = "js/speechwoz.js"
+    with open(os.path.join(app.static_folder, filename), "rb") as r:
+        digest = hashlib.sha256(r.read()).hexdigest()
+    with app.test_request_context():
+        url = static_url(filename)
+        assert url == f"/static/{filename}?v={digest[:16]}"
+        assert static_url("missing.js") == "/static/missing.js"
+    with client.get(url) as response:
+        assert response.cache_control.max_age == app.config["STATIC_MAX_AGE"]
+        assert response.cache_control.immutable
+    with client.get(f"/static/{filename}?v=outdated") as response:
+        assert not response.cache_control.immutable
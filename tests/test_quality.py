@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from speechwoz.db import add_recording, get_db
+from speechwoz.quality import analyze, store
+
+
+@pytest.fixture
+def recordings(app, login):
+    """A clean and a clipped recording with metrics; returns their ids."""
+    caller = login(app.test_client(), "caller-pid")
+    with app.app_context():
+        db = get_db()
+        ids = [add_recording(caller, "annotate", f"/rec/{i}.wav", f"/media/{i}.wav", blob=str(i)) for i in range(2)]
+        for recording_id, clipping in zip(ids, [0.0, 0.05]):
+            metrics = dict(snr=30.0, clipping_ratio=clipping, silence_ratio=0.2, loudness=-20.0)
+            store(db, recording_id, dict(metrics, leading_silence=0.1, trailing_silence=0.1))
+        db.commit()
+    return ids
+
+
+def test_analyze():
+    rng = np.random.default_rng(0)
+    sample_rate = 16000
+    noise = rng.normal(0, 30, sample_rate)
+    t = np.arange(sample_rate) / sample_rate
+    speech = 10000 * np.sin(2 * np.pi * 440 * t)
+    samples = np.concatenate([noise, noise + speech, noise]).astype(np.int16)
+    metrics = analyze(samples, sample_rate)
+    assert metrics["snr"] > 40
+    assert metrics["clipping_ratio"] == 0
+    assert metrics["silence_ratio"] == pytest.approx(2 / 3, abs=0.02)
+    assert metrics["leading_silence"] == pytest.approx(1.0, abs=0.04)
+    assert analyze(np.zeros(10, dtype=np.int16), sample_rate) == dict.fromkeys(metrics)
+
+
+def test_quality_forbidden(client, login, recordings):
+    assert client.get("/recordings/quality").status_code == 403
+    login(client, "caller-pid")
+    assert client.get("/recordings/quality").status_code == 403
+
+
+def test_quality_filters(client, login, recordings):
+    login(client, "oplatek")
+    response = client.get("/recordings/quality")
+    assert [r["id"] for r in response.json["recordings"]] == recordings
+    response = client.get("/recordings/quality?max_clipping=0.001")
+    assert [r["id"] for r in response.json["recordings"]] == recordings[:1]
+    response = client.get(f"/recordings/quality?after_id={recordings[0]}")
+    assert [r["id"] for r in response.json["recordings"]] == recordings[1:]
@@ -0,0 +1,83 @@
+import os
+import subprocess
+
+import pytest
+
+from speechwoz import reconcile
+from speechwoz.db import get_db
+from speechwoz.storage import TMP_DIR
+
+
+@pytest.fixture
+def dead_pid():
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+def execute(app, query, params=()):
+    with app.app_context():
+        db = get_db()
+        with db:
+            return db.execute(query, params)
+
+
+def statuses(app):
+    with app.app_context():
+        return dict(get_db().execute("SELECT id, status FROM upload").fetchall())
+
+
+def test_sweep_tmp(app, dead_pid):
+    tmpdir = os.path.join(app.config["RECORDINGS_FOLDER"], TMP_DIR)
+    os.makedirs(tmpdir)
+    for name in [f"{os.getpid()}-live", f"{dead_pid}-dead", "junk"]:
+        open(os.path.join(tmpdir, name), "wb").close()
+    assert reconcile.sweep_tmp(app.config["RECORDINGS_FOLDER"]) == 2
+    assert os.listdir(tmpdir) == [f"{os.getpid()}-live"]
+
+
+def test_release_keys(app, ann_id, dead_pid):
+    insert = (
+        "INSERT INTO idempotency_key (annotator_id, endpoint, key, owner, status, created) VALUES (?, 'e', ?, ?, ?, ?)"
+    )
+    execute(app, insert, (ann_id, "live", os.getpid(), "pending", "2100-01-01"))
+    execute(app, insert, (ann_id, "dead", dead_pid, "pending", "2100-01-01"))
+    execute(app, insert, (ann_id, "done", dead_pid, "done", "2100-01-01"))
+    execute(app, insert, (ann_id, "old", os.getpid(), "done", "2000-01-01"))
+    with app.app_context():
+        assert reconcile.release_keys(get_db(), app.config["IDEMPOTENCY_KEY_TTL"]) == 2
+        keys = [row[0] for row in get_db().execute("SELECT key FROM idempotency_key ORDER BY key")]
+    assert keys == ["done", "live"]
+
+
+def test_reopen_and_expire_uploads(app, ann_id):
+    insert = (
+        "INSERT INTO upload (id, annotator_id, source, status, created, claimed) VALUES (?, ?, 'onboarding', ?, ?, ?)"
+    )
+    execute(app, insert, ("stuck", ann_id, "finalizing", "2100-01-01", "2000-01-01"))
+    execute(app, insert, ("assembling", ann_id, "finalizing", "2100-01-01", "2100-01-01"))
+    execute(app, insert, ("abandoned", ann_id, "open", "2000-01-01", None))
+    execute(app, insert, ("recent", ann_id, "open", "2100-01-01", None))
+    with app.app_context():
+        assert reconcile.reopen_uploads(get_db(), 600, 3600) == (1, 1)
+    assert statuses(app) == {"stuck": "open", "assembling": "finalizing", "abandoned": "expired", "recent": "open"}
+
+
+def test_sweep_upload_dirs(app, client, ann_id):
+    upload_id = client.post("/upload/onboarding").get_json()["upload_id"]
+    execute(
+        app,
+        "INSERT INTO upload (id, annotator_id, source, status) VALUES ('gone', ?, 'onboarding', 'expired')",
+        (ann_id,),
+    )
+    for name in ["gone", "unknown"]:
+        os.makedirs(os.path.join(app.config["UPLOAD_FOLDER"], name))
+    with app.app_context():
+        assert reconcile.sweep_upload_dirs(get_db(), app.config["UPLOAD_FOLDER"]) == 2
+    assert os.listdir(app.config["UPLOAD_FOLDER"]) == [upload_id]
+
+
+def test_reconcile_command(runner):
+    result = runner.invoke(args=["reconcile"])
+    assert result.exit_code == 0
+    assert "tmp_files: 0" in result.output
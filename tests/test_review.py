@@ -0,0 +1,69 @@
+import base64
+
+import numpy as np
+import pytest
+
+from speechwoz.db import add_recording, get_db
+from speechwoz.review import peaks, store_peaks
+
+
+@pytest.fixture
+def recordings(app, login, client):
+    """Two recordings of a caller with peaks; returns their ids."""
+    caller = login(app.test_client(), "caller-pid")
+    with app.app_context():
+        db = get_db()
+        ids = [add_recording(caller, "annotate", f"/rec/{i}.wav", f"/media/{i}.wav", blob=str(i)) for i in range(2)]
+        for recording_id in ids:
+            store_peaks(db, recording_id, peaks(np.arange(-3000, 3000, dtype=np.int16), width=4))
+        db.commit()
+    return ids
+
+
+def test_peaks():
+    data = peaks(np.array([-32768, 0, 100, 32767], dtype=np.int16), width=2)
+    assert np.frombuffer(data, dtype=np.int8).tolist() == [-128, 0, 0, 127]
+    assert peaks(np.array([], dtype=np.int16)) == b""
+
+
+@pytest.mark.parametrize("pid", [None, "caller-pid"])
+def test_callers_forbidden(client, login, recordings, pid):
+    if pid is not None:
+        login(client, pid)
+    assert client.get("/review/queue").status_code == 403
+    response = client.post(f"/review/{recordings[0]}", json={"verdict": "accepted"})
+    assert response.status_code == 403
+    assert response.json["status"] == "forbidden"
+
+
+def test_review_as_agent(client, login, recordings):
+    login(client, "oplatek")
+    response = client.get("/review/queue?limit=1")
+    assert response.json["status"] == "ok"
+    assert [r["id"] for r in response.json["recordings"]] == [recordings[0]]
+    assert len(base64.b64decode(response.json["recordings"][0]["peaks"])) == 8
+    assert response.json["after_id"] == recordings[0]
+    assert client.post(f"/review/{recordings[0]}", json={"verdict": "maybe"}).json["status"] == "unknown-verdict"
+    assert client.post(f"/review/{recordings[0]}", json={"verdict": "accepted"}).json["status"] == "ok"
+    response = client.get("/review/queue")
+    assert [r["id"] for r in response.json["recordings"]] == [recordings[1]]
+    assert response.json["after_id"] is None
+
+
+def test_review_token(app, client, recordings):
+    app.config["REVIEW_TOKEN"] = "secret"
+    assert client.get("/review/queue", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    headers = {"Authorization": "Bearer secret"}
+    assert client.get("/review/queue", headers=headers).json["status"] == "ok"
+    response = client.post(f"/review/{recordings[1]}", json={"verdict": "rejected"}, headers=headers)
+    assert response.json["status"] == "ok"
+    with app.app_context():
+        row = get_db().execute("SELECT reviewer, verdict FROM review").fetchone()
+    assert tuple(row) == (None, "rejected")
+
+
+def test_review_unknown_recording(app, client, login, recordings):
+    login(client, "oplatek")
+    assert client.post(f"/review/{recordings[-1] + 1}", json={"verdict": "accepted"}).status_code == 404
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM review").fetchone()[0] == 0
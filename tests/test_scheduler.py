@@ -0,0 +1,116 @@
+import pytest
+
+from speechwoz import scheduler
+from speechwoz.db import get_db, start_session, write_batch
+from speechwoz.scheduler import assign, complete
+
+
+@pytest.fixture
+def dialogues(app):
+    """Dialogues of 1 to 20 turns, three of each length."""
+    with app.app_context():
+        write_batch(
+            "INSERT INTO dialogue (id, n_turns) VALUES (?, ?)",
+            [(f"MUL{n:02d}{i}.json", n) for n in range(1, 21) for i in range(3)],
+        )
+
+
+def loads(app):
+    with app.app_context():
+        return {row["id"]: row["load"] for row in get_db().execute("SELECT id, load FROM dialogue")}
+
+
+def test_assign_fits_budget(app, dialogues):
+    with app.app_context():
+        session_id = start_session("ann", "s1")
+        assignments = assign(session_id, 7, 2, 3600)
+        n_turns = [
+            get_db().execute("SELECT n_turns FROM dialogue WHERE id = ?", (a["dialogue_id"],)).fetchone()[0]
+            for a in assignments
+        ]
+    assert len(assignments) == 2
+    assert len({a["dialogue_id"] for a in assignments}) == 2
+    assert sum(n_turns) <= 7
+
+
+def test_assign_spreads_load(app, dialogues):
+    with app.app_context():
+        assigned = [a["dialogue_id"] for i in range(30) for a in assign(start_session("ann", f"s{i}"), 2, 1, 3600)]
+    # the six dialogues within the budget are leased five times each
+    assert len(assigned) == 30
+    assert sorted(load for load in loads(app).values() if load) == [5] * 6
+    assert all(d.startswith(("MUL01", "MUL02")) for d in assigned)
+
+
+def test_assign_skips_over_budget(app, dialogues):
+    with app.app_context():
+        db = get_db()
+        # the short dialogues are loaded, the long ones are not
+        with db:
+            db.execute("UPDATE dialogue SET load = 10 WHERE n_turns <= 3")
+        assignments = assign(start_session("ann", "s1"), 3, 2, 3600)
+        plan = " ".join(
+            row[-1]
+            for row in db.execute("EXPLAIN QUERY PLAN SELECT id FROM dialogue WHERE n_turns = 3 ORDER BY load LIMIT 1")
+        )
+    assert len(assignments) == 2
+    assert "dialogue_turns" in plan and "TEMP B-TREE" not in plan
+
+
+def test_assign_renews(app, dialogues):
+    with app.app_context():
+        session_id = start_session("ann", "s1")
+        first = assign(session_id, 7, 2, 3600)
+        again = assign(session_id, 7, 2, 7200)
+    assert [a["dialogue_id"] for a in again] == [a["dialogue_id"] for a in first]
+    assert all(a["expires"] > b["expires"] for a, b in zip(again, first))
+    assert sum(loads(app).values()) == 2
+
+
+def test_expired_lease_released(app, dialogues):
+    with app.app_context():
+        expired = assign(start_session("ann", "s1"), 7, 2, -1)
+        assign(start_session("ann", "s2"), 7, 2, 3600)
+        statuses = [row[0] for row in get_db().execute("SELECT status FROM assignment ORDER BY id")]
+    assert statuses == ["expired", "expired", "leased", "leased"]
+    # only the leases of the second session count
+    assert sum(loads(app).values()) == 2
+    assert len(expired) == 2
+
+
+def test_complete(app, dialogues):
+    with app.app_context():
+        session_id = start_session("ann", "s1")
+        dialogue_id = assign(session_id, 7, 1, 3600)[0]["dialogue_id"]
+        assert complete(session_id, dialogue_id)
+        assert not complete(session_id, dialogue_id)
+        # a completed assignment is not released when its lease runs out
+        assign(start_session("ann", "s2"), 7, 1, 3600)
+    assert loads(app)[dialogue_id] == 1
+
+
+def test_endpoints(client, dialogues):
+    assert client.post("/assignments").json["status"] == "no-session"
+    with client.session_transaction() as session:
+        session["session_id"] = 1
+    response = client.post("/assignments")
+    assert response.json["status"] == "ok"
+    dialogue_id = response.json["assignments"][0]["dialogue_id"]
+    assert client.post(f"/assignments/{dialogue_id}/complete").json["status"] == "ok"
+    assert client.post(f"/assignments/{dialogue_id}/complete").json["status"] == "not-leased"
+
+
+def test_endpoints_run_blocking(client, dialogues, monkeypatch):
+    """The transactions may wait for the write lock, so they must not run on the gevent hub."""
+    called = []
+
+    def run_blocking(fn, *args, **kwargs):
+        called.append(fn.__name__)
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(scheduler, "run_blocking", run_blocking)
+    with client.session_transaction() as session:
+        session["session_id"] = 1
+    dialogue_id = client.post("/assignments").json["assignments"][0]["dialogue_id"]
+    client.post(f"/assignments/{dialogue_id}/complete")
+    assert called == ["assign", "complete"]
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+from flask import jsonify, request, session
+
+from speechwoz import sessions
+from speechwoz.db import get_db
+from speechwoz.sessions import SQLiteSessionInterface
+
+
+@pytest.fixture
+def client(app):
+    """A client without a cookie jar, the tests send the session cookie themselves."""
+
+    @app.route("/test/session", methods=["GET", "POST"])
+    def session_view():
+        if request.method == "POST":
+            session.update(request.get_json())
+        return jsonify(dict(session))
+
+    @app.route("/test/session/clear", methods=["POST"])
+    def clear_view():
+        session.clear()
+        return jsonify({})
+
+    return app.test_client(use_cookies=False)
+
+
+def cookie(response):
+    """The value of the session cookie set by the response, None if not set."""
+    for header in response.headers.getlist("Set-Cookie"):
+        name, _, rest = header.partition("=")
+        if name == "session":
+            return rest.split(";")[0]
+    return None
+
+
+def get(client, value):
+    return client.get("/test/session", headers={"Cookie": f"session={value}"})
+
+
+def post(client, value, data):
+    headers = {"Cookie": f"session={value}"} if value else {}
+    return client.post("/test/session", json=data, headers=headers)
+
+
+def rows(app):
+    with app.app_context():
+        return [dict(row) for row in get_db().execute("SELECT id, version, data FROM web_session")]
+
+
+def test_cookie_holds_id_and_version(app, client):
+    value = cookie(post(client, None, {"progress": [1, 2, 3]}))
+    sid, version = value.split(".")
+    assert version == "1"
+    assert [(row["id"], row["version"]) for row in rows(app)] == [(sid, 1)]
+    assert get(client, value).json == {"progress": [1, 2, 3]}
+
+
+def test_write_bumps_version(app, client):
+    first = cookie(post(client, None, {"turn": 1}))
+    second = cookie(post(client, first, {"turn": 2}))
+    assert second.split(".") == [first.split(".")[0], "2"]
+    assert get(client, second).json == {"turn": 2}
+
+
+def test_unmodified_session_not_written(app, client):
+    value = cookie(post(client, None, {"turn": 1}))
+    response = get(client, value)
+    assert response.json == {"turn": 1}
+    assert cookie(response) is None
+    assert rows(app)[0]["version"] == 1
+
+
+def test_newer_version_of_another_worker(app, client):
+    value = cookie(post(client, None, {"turn": 1}))
+    sid = value.split(".")[0]
+    # another process stored version 2, this process still caches version 1
+    with app.app_context():
+        db = get_db()
+        with db:
+            data = SQLiteSessionInterface.serializer.dumps({"turn": 7})
+            db.execute("UPDATE web_session SET version = 2, data = ? WHERE id = ?", (data, sid))
+    assert get(client, f"{sid}.2").json == {"turn": 7}
+
+
+@pytest.mark.parametrize("value", ["", "garbage", "unknown.1", "unknown.x"])
+def test_unknown_cookie(client, value):
+    assert get(client, value).json == {}
+
+
+def test_expired_session(app, client):
+    value = cookie(post(client, None, {"turn": 1}))
+    with app.app_context():
+        db = get_db()
+        with db:
+            db.execute("UPDATE web_session SET expires = ?", (time.time() - 1,))
+    # as if the process had not cached it, a cached session expires with the row anyway
+    sessions._cache.clear()
+    assert get(client, value).json == {}
+
+
+def test_clear_deletes_session(app, client):
+    value = cookie(post(client, None, {"turn": 1}))
+    response = client.post("/test/session/clear", headers={"Cookie": f"session={value}"})
+    assert cookie(response) == ""
+    assert rows(app) == []
+    assert get(client, value).json == {}
+
+
+def test_garbage_collection(app, client):
+    app.config["SESSION_GC_INTERVAL"] = 0
+    stale = cookie(post(client, None, {"turn": 1}))
+    with app.app_context():
+        db = get_db()
+        with db:
+            db.execute("UPDATE web_session SET expires = ?", (time.time() - 1,))
+    fresh = cookie(post(client, None, {"turn": 2}))
+    assert [row["id"] for row in rows(app)] == [fresh.split(".")[0]]
+    assert stale != fresh
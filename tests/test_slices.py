@@ -0,0 +1,67 @@
+import io
+import os
+import wave
+
+import numpy as np
+import pytest
+
+RATE = 8000
+
+
+@pytest.fixture
+def wav(app):
+    """Two seconds of 16-bit mono PCM, sample i has the value i; returns its name under RECORDINGS_FOLDER."""
+    folder = os.path.join(app.config["RECORDINGS_FOLDER"], "takes")
+    os.makedirs(folder)
+    with wave.open(os.path.join(folder, "take.wav"), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(np.arange(2 * RATE, dtype="<i2").tobytes())
+    return "takes/take.wav"
+
+
+def samples(data):
+    with wave.open(io.BytesIO(data)) as r:
+        assert r.getframerate() == RATE
+        return np.frombuffer(r.readframes(r.getnframes()), dtype="<i2")
+
+
+def test_slice(client, wav):
+    response = client.get(f"/slices/{wav}?start=0.5&duration=0.25")
+    assert response.status_code == 200
+    assert response.mimetype == "audio/wav"
+    assert samples(response.data).tolist() == list(range(4000, 6000))
+
+
+def test_slice_clipped_to_recording(client, wav):
+    assert len(samples(client.get(f"/slices/{wav}?start=1.5&duration=10").data)) == RATE // 2
+    assert len(samples(client.get(f"/slices/{wav}?start=5&duration=1").data)) == 0
+
+
+def test_etag(client, wav):
+    etag = client.get(f"/slices/{wav}?start=0&duration=1").headers["ETag"]
+    response = client.get(f"/slices/{wav}?start=0&duration=1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert client.get(f"/slices/{wav}?start=0&duration=0.5", headers={"If-None-Match": etag}).status_code == 200
+
+
+@pytest.mark.parametrize(
+    "query", ["", "?start=0", "?duration=1", "?start=-1&duration=1", "?start=0&duration=0", "?start=0&duration=601"]
+)
+def test_bad_bounds(client, wav, query):
+    assert client.get(f"/slices/{wav}{query}").status_code == 400
+
+
+@pytest.mark.parametrize("filename", ["takes/missing.wav", "../test.sqlite", "blobs/tmp/123-abc"])
+def test_not_found(app, client, wav, filename):
+    os.makedirs(os.path.join(app.config["RECORDINGS_FOLDER"], "blobs", "tmp"))
+    with open(os.path.join(app.config["RECORDINGS_FOLDER"], "blobs", "tmp", "123-abc"), "wb") as w:
+        w.write(b"RIFF")
+    assert client.get(f"/slices/{filename}?start=0&duration=1").status_code == 404
+
+
+def test_not_wav(app, client, wav):
+    with open(os.path.join(app.config["RECORDINGS_FOLDER"], "takes", "take.mp3"), "wb") as w:
+        w.write(b"ID3" + bytes(100))
+    assert client.get("/slices/takes/take.mp3?start=0&duration=1").status_code == 415
@@ -0,0 +1,72 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from speechwoz import storage
+from speechwoz.db import add_recording, get_db
+
+
+def test_blob_address(app):
+    with app.app_context():
+        with storage.BlobWriter(".mp3") as w:
+            w.write(b"take")
+            blob = w.commit()
+    sha256 = hashlib.sha256(b"take").hexdigest()
+    assert blob["sha256"] == sha256
+    assert blob["relpath"] == os.path.join("blobs", sha256[:2], sha256[2:4], sha256 + ".mp3")
+    assert blob["size"] == 4
+    with open(blob["path"], "rb") as r:
+        assert r.read() == b"take"
+
+
+def test_same_content_stored_once(app):
+    with app.app_context():
+        first = storage.store_stream(io.BytesIO(b"take"), ".mp3")
+        second = storage.store_stream(io.BytesIO(b"take"), ".mp3")
+        assert get_db().execute("SELECT COUNT(*) FROM blob").fetchone()[0] == 1
+    assert first["path"] == second["path"]
+    # nothing left behind by the second writer
+    assert os.listdir(os.path.join(app.config["RECORDINGS_FOLDER"], storage.TMP_DIR)) == []
+
+
+def test_failed_write_leaves_nothing(app):
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            with storage.BlobWriter(".mp3") as w:
+                w.write(b"half a take")
+                raise RuntimeError("client went away")
+        assert get_db().execute("SELECT COUNT(*) FROM blob").fetchone()[0] == 0
+    assert os.listdir(os.path.join(app.config["RECORDINGS_FOLDER"], storage.TMP_DIR)) == []
+
+
+def test_recording_per_annotator_and_source(app, login):
+    ann = login(app.test_client(), "pid-a")
+    other = login(app.test_client(), "pid-b")
+    with app.app_context():
+        blob = storage.store_stream(io.BytesIO(b"take"), ".mp3")
+        first = add_recording(ann, "onboarding", blob["path"], "/a", blob=blob["sha256"])
+        # a retried upload resolves to the stored recording
+        assert add_recording(ann, "onboarding", blob["path"], "/a", blob=blob["sha256"]) == first
+        assert storage.find_recording(ann, "onboarding", blob["sha256"])["id"] == first
+        # the same content of another annotator or source is a recording of its own
+        assert add_recording(other, "onboarding", blob["path"], "/a", blob=blob["sha256"]) != first
+        assert add_recording(ann, "annotate", blob["path"], "/a", blob=blob["sha256"]) != first
+        assert storage.find_recording(ann, "elsewhere", blob["sha256"]) is None
+
+
+def test_uploads_of_same_take(app, client, ann_id):
+    paths = []
+    for _ in range(2):
+        upload_id = client.post("/upload/onboarding").get_json()["upload_id"]
+        client.put(f"/upload/onboarding/{upload_id}/0", data=b"take")
+        data = client.post(f"/upload/onboarding/{upload_id}/finalize", json={"num_chunks": 1}).get_json()
+        paths.append(data["path"])
+    assert paths[0] == paths[1]
+    with app.app_context():
+        db = get_db()
+        assert db.execute("SELECT COUNT(*) FROM recording").fetchone()[0] == 1
+        assert db.execute("SELECT COUNT(*) FROM transcode_job").fetchone()[0] == 1
+    with client.get(paths[0]) as response:
+        assert response.data == b"take"
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from speechwoz import audio, transcode
+from speechwoz.db import get_db
+
+
+def crashing_encode(src, dst, sample_rate):
+    """Kills the worker process on takes named crash.raw, like a segfaulting encoder."""
+    if os.path.basename(src) == "crash.raw":
+        os._exit(1)
+    audio.stub_encode(src, dst, sample_rate)
+
+
+@pytest.fixture
+def takes(app):
+    """Enqueue raw PCM takes by name; returns a function returning the job ids."""
+    folder = app.config["RECORDINGS_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+
+    def enqueue(*names):
+        job_ids = []
+        for name in names:
+            path = os.path.join(folder, name)
+            with open(path, "wb") as w:
+                w.write(os.urandom(3200))
+            job_ids.append(transcode.enqueue(path))
+        return job_ids
+
+    return enqueue
+
+
+def statuses(db):
+    return {row["id"]: (row["status"], row["attempts"]) for row in db.execute("SELECT * FROM transcode_job")}
+
+
+def test_run_pool(app, takes):
+    with app.app_context():
+        job_ids = takes("a.raw", "b.raw", "c.raw")
+        db = get_db()
+        assert transcode.run_pool(db, "stub", 2, app.config["RECORDINGS_FOLDER"], once=True) == 3
+        assert statuses(db) == {job_id: ("done", 1) for job_id in job_ids}
+        for row in db.execute("SELECT * FROM transcode_job"):
+            samples, rate = audio.read_wav(row["dst_path"])
+            assert rate == 16000 and len(samples) == 1600
+
+
+def test_crashed_worker(app, takes, monkeypatch):
+    monkeypatch.setitem(audio.ENCODERS, "crashing", crashing_encode)
+    with app.app_context():
+        good, crash, other = takes("good.raw", "crash.raw", "other.raw")
+        db = get_db()
+        transcode.run_pool(db, "crashing", 2, app.config["RECORDINGS_FOLDER"], max_attempts=2, once=True)
+        # only the job crashing its worker alone counts attempts, the others are converted
+        assert statuses(db) == {good: ("done", 1), crash: ("failed", 2), other: ("done", 1)}
+        assert db.execute("SELECT error FROM transcode_job WHERE id = ?", (crash,)).fetchone()[0] == (
+            "worker process died"
+        )
+
+
+def test_interrupted_pool(app, takes, monkeypatch):
+    def interrupt(*args):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(transcode, "finish_job", interrupt)
+    with app.app_context():
+        first, second, third = takes("a.raw", "b.raw", "c.raw")
+        db = get_db()
+        with pytest.raises(KeyboardInterrupt):
+            transcode.run_pool(db, "stub", 1, app.config["RECORDINGS_FOLDER"], once=True)
+        # the job being finished is left to requeue_stale, the submitted one is released
+        assert statuses(db) == {first: ("running", 1), second: ("queued", 0), third: ("queued", 0)}
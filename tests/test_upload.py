@@ -0,0 +1,136 @@
+import os
+
+import pytest
+
+from speechwoz.db import get_db
+
+
+def open_upload(client):
+    data = client.post("/upload/onboarding").get_json()
+    assert data["status"] == "ok"
+    return data["upload_id"]
+
+
+def finalize(client, upload_id, num_chunks):
+    return client.post(f"/upload/onboarding/{upload_id}/finalize", json={"num_chunks": num_chunks}).get_json()
+
+
+def stored(app, upload_id):
+    """Content of the take assembled from the upload."""
+    with app.app_context():
+        query = (
+            "SELECT recording.path FROM upload JOIN recording ON recording.id = upload.recording_id WHERE upload.id = ?"
+        )
+        path = get_db().execute(query, (upload_id,)).fetchone()["path"]
+    with open(path, "rb") as r:
+        return r.read()
+
+
+def test_open_requires_annotator(client):
+    assert client.post("/upload/onboarding").get_json()["status"] == "no-annotator"
+
+
+def test_unknown_source(client, ann_id):
+    assert client.post("/upload/nowhere").status_code == 404
+
+
+def test_chunks_out_of_order(app, client, ann_id):
+    upload_id = open_upload(client)
+    for index in [2, 0, 1]:
+        data = client.put(f"/upload/onboarding/{upload_id}/{index}", data=b"chunk%d" % index).get_json()
+        assert data == {"status": "ok", "index": index, "size": 6}
+    assert client.get(f"/upload/onboarding/{upload_id}").get_json()["received"] == [0, 1, 2]
+
+    data = finalize(client, upload_id, 3)
+    assert data["status"] == "ok"
+    assert data["path"].startswith("/media/blobs/")
+    assert stored(app, upload_id) == b"chunk0chunk1chunk2"
+    # the chunks are removed once the take is assembled
+    assert not os.path.exists(os.path.join(app.config["UPLOAD_FOLDER"], upload_id))
+
+
+def test_retried_chunk_replaces(app, client, ann_id):
+    upload_id = open_upload(client)
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"lost")
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"retried")
+    assert finalize(client, upload_id, 1)["status"] == "ok"
+    assert stored(app, upload_id) == b"retried"
+
+
+def test_missing_chunks(client, ann_id):
+    upload_id = open_upload(client)
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"a")
+    client.put(f"/upload/onboarding/{upload_id}/2", data=b"c")
+    assert finalize(client, upload_id, 3) == {"status": "missing-chunks", "missing": [1]}
+    # the upload stays open for the missing chunk
+    client.put(f"/upload/onboarding/{upload_id}/1", data=b"b")
+    assert finalize(client, upload_id, 3)["status"] == "ok"
+
+
+@pytest.mark.parametrize("body", [{}, {"num_chunks": 0}, {"num_chunks": "2"}])
+def test_bad_num_chunks(client, ann_id, body):
+    upload_id = open_upload(client)
+    data = client.post(f"/upload/onboarding/{upload_id}/finalize", json=body).get_json()
+    assert data["status"] == "no-num-chunks"
+
+
+def test_double_finalize(app, client, ann_id):
+    upload_id = open_upload(client)
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"take")
+    first = finalize(client, upload_id, 1)
+    assert finalize(client, upload_id, 1) == first
+    assert client.put(f"/upload/onboarding/{upload_id}/1", data=b"late").get_json() == {
+        "status": "finalized",
+        "path": first["path"],
+    }
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM recording").fetchone()[0] == 1
+        assert get_db().execute("SELECT COUNT(*) FROM transcode_job").fetchone()[0] == 1
+
+
+def test_chunk_too_large(app, client, ann_id):
+    app.config["UPLOAD_MAX_CHUNK_SIZE"] = 4
+    upload_id = open_upload(client)
+    assert client.put(f"/upload/onboarding/{upload_id}/0", data=b"12345").get_json()["status"] == "chunk-too-large"
+    assert client.get(f"/upload/onboarding/{upload_id}").get_json()["received"] == []
+
+
+def test_too_many_chunks(app, client, ann_id):
+    app.config["UPLOAD_MAX_CHUNKS"] = 2
+    upload_id = open_upload(client)
+    assert client.put(f"/upload/onboarding/{upload_id}/2", data=b"x").get_json()["status"] == "too-many-chunks"
+
+
+def test_upload_of_other_annotator(app, client, ann_id, login):
+    upload_id = open_upload(client)
+    other = app.test_client()
+    login(other, "other-pid")
+    assert other.put(f"/upload/onboarding/{upload_id}/0", data=b"x").status_code == 404
+    assert other.get(f"/upload/onboarding/{upload_id}").status_code == 404
+
+
+def claim(app, upload_id, age):
+    """Mark the upload as being finalized by a request which started ``age`` seconds ago."""
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "UPDATE upload SET status = 'finalizing', claimed = datetime('now', ?) WHERE id = ?",
+            (f"-{age} seconds", upload_id),
+        )
+        db.commit()
+
+
+def test_concurrent_finalize(app, client, ann_id):
+    upload_id = open_upload(client)
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"take")
+    claim(app, upload_id, 1)
+    assert finalize(client, upload_id, 1) == {"status": "finalizing"}
+
+
+def test_stale_finalize_taken_over(app, client, ann_id):
+    upload_id = open_upload(client)
+    client.put(f"/upload/onboarding/{upload_id}/0", data=b"take")
+    # the worker assembling the take was killed
+    claim(app, upload_id, app.config["UPLOAD_FINALIZE_TIMEOUT"] + 60)
+    assert finalize(client, upload_id, 1)["status"] == "ok"
+    assert stored(app, upload_id) == b"take"